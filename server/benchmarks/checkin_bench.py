@@ -0,0 +1,109 @@
+"""
+Benchmark of a burst of habit check-ins written inline and through the write-behind buffer.
+
+For each mode, builds the app on a temporary SQLite file with users and habits, then replays
+POST /user/<id>/habit/<habit_id>/checkin for random habits and recent days from several
+threads, like the morning spike of check-ins, and reports throughput and latency. In
+write-behind mode it also reports how long the buffer took to write everything once the
+burst ended, and how many batches it wrote.
+
+Run with:
+python -m server.benchmarks.checkin_bench
+python -m server.benchmarks.checkin_bench --checkins 5000 --threads 16 --batch 500
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from server.src.app import create_app
+from server.src.database import db
+from server.src.models.helpers import utc_today
+from server.src.models.models import Habit, User
+from server.benchmarks.replay import client_sender, replay
+
+
+def _requests(habits, checkins, rng):
+    today = utc_today()
+    for _ in range(checkins):
+        user_id, habit_id = rng.choice(habits)
+        day = today - timedelta(days=rng.randrange(7))
+        yield "POST", f"/user/{user_id}/habit/{habit_id}/checkin", {"date": day.isoformat()}
+
+
+def run(write_behind, users, checkins, threads, batch_size, rng_seed=0):
+    """
+    Benchmark one mode on a fresh database.
+
+    :param write_behind: True to queue check-ins in the write-behind buffer.
+    :return: The replay report, mapping routes to summaries, and the buffer stats with the
+             seconds taken to flush after the burst, or None inline.
+    """
+    # pylint: disable=too-many-arguments
+    rng = random.Random(rng_seed)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(temp_dir, 'checkin.db')}",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+                "PASSWORD_HASH_COST": 4,
+                "CHECKIN_WRITE_BEHIND": write_behind,
+                "CHECKIN_FLUSH_BATCH": batch_size,
+            }
+        )
+        with app.app_context():
+            db.create_all()
+            User.bulk_create([
+                {"name": f"user{n}", "email": f"user{n}@example.com", "password": "password",
+                 "habits": [{"name": f"habit {i}"} for i in range(3)]}
+                for n in range(users)
+            ])
+            habits = [(habit.user_id, habit.id) for habit in Habit.query]
+        try:
+            report, _ = replay(
+                _requests(habits, checkins, rng), client_sender(app), workers=threads
+            )
+            stats = None
+            buffer = app.extensions.get("checkin_buffer")
+            if buffer is not None:
+                started = time.perf_counter()
+                buffer.flush()
+                stats = {**buffer.stats(), "drain_seconds": time.perf_counter() - started}
+                buffer.close()
+        finally:
+            with app.app_context():
+                db.engine.dispose()
+    return report, stats
+
+
+def main():
+    """
+    Run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200, help="users to seed, 3 habits each")
+    parser.add_argument("--checkins", type=int, default=2000, help="check-ins per mode")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent request threads")
+    parser.add_argument("--batch", type=int, default=500, help="CHECKIN_FLUSH_BATCH")
+    args = parser.parse_args()
+
+    print(f"{'mode':<13} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode, write_behind in (("inline", False), ("write-behind", True)):
+        report, stats = run(write_behind, args.users, args.checkins, args.threads, args.batch)
+        for summary in report.values():
+            print(
+                f"{mode:<13} {summary['throughput']:8.1f} {summary['p50_ms']:8.2f} "
+                f"{summary['p95_ms']:8.2f} {summary['p99_ms']:8.2f}"
+            )
+        if stats is not None:
+            print(
+                f"{'':<13} flushed in {stats['drain_seconds'] * 1000:.0f} ms after the burst, "
+                f"{stats['flush_count']} batches, {stats['events']['coalesced']} coalesced"
+            )
+
+
+if __name__ == "__main__":
+    main()
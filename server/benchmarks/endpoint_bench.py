@@ -0,0 +1,298 @@
+"""
+Benchmark suite for every user_controller route.
+
+Builds the app with create_app and an in-memory SQLite database, as the controller tests do,
+seeds it with users and habits, then drives each route through the Flask test client and
+reports throughput and p50/p95/p99 latency. Results can be written to JSON and compared
+against a stored baseline, failing the run if any route regressed past a threshold.
+
+Run with:
+python -m server.benchmarks.endpoint_bench --output results.json
+python -m server.benchmarks.endpoint_bench --save-baseline server/benchmarks/baseline.json
+python -m server.benchmarks.endpoint_bench --baseline server/benchmarks/baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+from datetime import timedelta
+from server.src.app import create_app
+from server.src.database import db
+from server.src.models.helpers import utc_today
+from server.src.models.models import User, Habit
+from server.benchmarks.stats import find_regressions, summarize
+
+TEST_CONFIG = {
+    "TESTING": True,
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+    "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    # keeps seeding fast, signup_bench measures hashing at the production cost
+    "PASSWORD_HASH_COST": 4,
+}
+
+
+# emails must be unique, so they are numbered rather than random
+_EMAIL_SEQUENCE = itertools.count()
+
+
+def _user_payload(rng, habits=3, email=None):
+    return {
+        "name": f"user{rng.randrange(10**9)}",
+        "email": email or f"user{next(_EMAIL_SEQUENCE)}@example.com",
+        "password": "password",
+        "habits": [{"name": f"habit {i}"} for i in range(habits)],
+    }
+
+
+def _pick(rng, seeded):
+    user_id = rng.choice(list(seeded))
+    return user_id, seeded[user_id]
+
+
+def _habit_request(rng, seeded, method):
+    user_id, habit_ids = _pick(rng, seeded)
+    return method, f"/user/{user_id}/habit/{rng.choice(habit_ids)}", {"name": str(rng.random())}
+
+
+def _batch_update_request(rng, seeded):
+    user_id, habit_ids = _pick(rng, seeded)
+    body = [{"id": habit_id, "name": str(rng.random())} for habit_id in habit_ids]
+    return "PATCH", f"/user/{user_id}/habits/batch", body
+
+
+def _check_in_request(rng, seeded):
+    user_id, habit_ids = _pick(rng, seeded)
+    day = utc_today() - timedelta(days=rng.randrange(365))
+    return (
+        "POST",
+        f"/user/{user_id}/habit/{rng.choice(habit_ids)}/checkin",
+        {"date": day.isoformat()},
+    )
+
+
+def _history_request(rng, seeded):
+    user_id, habit_ids = _pick(rng, seeded)
+    start = utc_today() - timedelta(days=364)
+    return "GET", f"/user/{user_id}/habit/{rng.choice(habit_ids)}/history?from={start}", None
+
+
+# Scenarios per user_controller endpoint. Each builds one request from a random generator and
+# the seeded {user_id: [habit_id, ...]} map, returning (method, path, json body).
+SCENARIOS = {
+    "get_user": {
+        "get_user": lambda rng, seeded: ("GET", f"/user/{_pick(rng, seeded)[0]}", None),
+        "get_user?include=habits": lambda rng, seeded: (
+            "GET", f"/user/{_pick(rng, seeded)[0]}?include=habits", None
+        ),
+    },
+    # before the update scenarios, which change the seeded emails
+    "get_user_by_email": {
+        "get_user_by_email": lambda rng, seeded: (
+            "GET", f"/user?email=seed{rng.randrange(len(seeded))}@example.com", None
+        ),
+    },
+    "list_users": {
+        "list_users": lambda rng, seeded: ("GET", "/users?limit=50", None),
+        "list_users?ids=": lambda rng, seeded: (
+            "GET", "/users?ids=" + ",".join(str(rng.choice(list(seeded))) for _ in range(50)), None
+        ),
+    },
+    "list_habits": {
+        "list_habits": lambda rng, seeded: ("GET", f"/user/{_pick(rng, seeded)[0]}/habits", None),
+    },
+    "get_user_events": {
+        "get_user_events": lambda rng, seeded: (
+            "GET", f"/user/{_pick(rng, seeded)[0]}/events?timeout=0", None
+        ),
+    },
+    "search_habits": {
+        "search_habits": lambda rng, seeded: ("GET", "/habits/search?q=habt%201", None),
+    },
+    "search_user_habits": {
+        "search_user_habits": lambda rng, seeded: (
+            "GET", f"/user/{_pick(rng, seeded)[0]}/habits/search?q=habit", None
+        ),
+    },
+    "get_today": {
+        "get_today": lambda rng, seeded: ("GET", f"/user/{_pick(rng, seeded)[0]}/today", None),
+    },
+    "create_user": {
+        "create_user": lambda rng, seeded: ("POST", "/user", _user_payload(rng)),
+    },
+    "bulk_create_users": {
+        "bulk_create_users(50)": lambda rng, seeded: (
+            "POST", "/users/bulk", [_user_payload(rng) for _ in range(50)]
+        ),
+    },
+    "update_user": {
+        "update_user": lambda rng, seeded: (
+            "PUT", f"/user/{_pick(rng, seeded)[0]}", _user_payload(rng, habits=0)
+        ),
+    },
+    "patch_user": {
+        "patch_user": lambda rng, seeded: (
+            "PATCH", f"/user/{_pick(rng, seeded)[0]}", {"email": f"{rng.random()}@example.com"}
+        ),
+    },
+    "create_habit": {
+        "create_habit": lambda rng, seeded: (
+            "POST", f"/user/{_pick(rng, seeded)[0]}/habit", {"name": "new habit"}
+        ),
+    },
+    "update_habit": {
+        "update_habit": lambda rng, seeded: _habit_request(rng, seeded, "PUT"),
+    },
+    "patch_habit": {
+        "patch_habit": lambda rng, seeded: _habit_request(rng, seeded, "PATCH"),
+    },
+    "check_in_habit": {
+        "check_in_habit": _check_in_request,
+    },
+    "get_habit_history": {
+        "get_habit_history?365d": _history_request,
+    },
+    "batch_create_habits": {
+        "batch_create_habits(20)": lambda rng, seeded: (
+            "POST",
+            f"/user/{_pick(rng, seeded)[0]}/habits/batch",
+            [{"name": f"habit {i}"} for i in range(20)],
+        ),
+    },
+    "batch_update_habits": {
+        "batch_update_habits": _batch_update_request,
+    },
+}
+
+
+def seed(app, users, habits_per_user, rng):
+    """
+    Fill the database with users and habits.
+
+    :param app: The Flask app.
+    :param users: The number of users to create.
+    :param habits_per_user: The number of habits each user gets.
+    :param rng: The random generator used to build payloads.
+    :return: A dict mapping each seeded user id to its habit ids. The users are numbered
+             from 0 in their emails, e.g. seed0@example.com.
+    """
+    with app.app_context():
+        db.create_all()
+        for start in range(0, users, 1000):
+            count = min(1000, users - start)
+            User.bulk_create([
+                _user_payload(rng, habits_per_user, f"seed{start + index}@example.com")
+                for index in range(count)
+            ])
+        seeded = {}
+        for habit_id, user_id in db.session.query(Habit.id, Habit.user_id).all():
+            seeded.setdefault(user_id, []).append(habit_id)
+        return seeded
+
+
+def check_coverage(app):
+    """
+    Make sure every user_controller route has a scenario.
+
+    :param app: The Flask app.
+    :return: The names of the endpoints without a scenario.
+    """
+    endpoints = {
+        rule.endpoint.split(".", 1)[1]
+        for rule in app.url_map.iter_rules()
+        if rule.endpoint.startswith("user_controller.")
+    }
+    return sorted(endpoints - set(SCENARIOS))
+
+
+def run_scenario(client, next_request, requests, warmup):
+    """
+    Drive one scenario through the test client.
+
+    :param client: The Flask test client.
+    :param next_request: Function returning the (method, path, json body) of a request.
+    :param requests: The number of timed requests.
+    :param warmup: The number of untimed requests sent first.
+    :return: The summary of the timed requests.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for index in range(warmup + requests):
+        if index == warmup:
+            latencies.clear()
+            started = time.perf_counter()
+        method, path, body = next_request()
+        begin = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        latencies.append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run(users, habits_per_user, requests, warmup, rng_seed=0):
+    """
+    Seed a fresh app and benchmark every scenario.
+
+    :return: A dict mapping scenario names to their summaries.
+    """
+    rng = random.Random(rng_seed)
+    app = create_app(TEST_CONFIG)
+    missing = check_coverage(app)
+    if missing:
+        raise RuntimeError(f"No benchmark scenario for: {', '.join(missing)}")
+    seeded = seed(app, users, habits_per_user, rng)
+
+    results = {}
+    client = app.test_client()
+    for scenarios in SCENARIOS.values():
+        for name, build_request in scenarios.items():
+            results[name] = run_scenario(
+                client, lambda build=build_request: build(rng, seeded), requests, warmup
+            )
+    return results
+
+
+def main():
+    """
+    Run the suite from the command line. Exits with status 1 if a baseline regressed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000, help="users to seed")
+    parser.add_argument("--habits", type=int, default=10, help="habits per seeded user")
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=30, help="untimed requests per route")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON results file")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    results = run(args.users, args.habits, args.requests, args.warmup)
+
+    print(f"{'scenario':<28} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<28} {result['throughput']:8.0f} {result['p50_ms']:8.2f} "
+            f"{result['p95_ms']:8.2f} {result['p99_ms']:8.2f}"
+        )
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions against baseline:", *regressions, sep="\n  ")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
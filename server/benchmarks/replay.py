@@ -0,0 +1,257 @@
+"""
+Replay recorded traffic from a JSONL file and report per route throughput, latency
+percentiles and status codes.
+
+Each line is a JSON object with "method", "path" and optionally "body", as written by the
+capture middleware (TRAFFIC_CAPTURE_PATH). The file is streamed, so it can be larger than
+memory. Requests go through the Flask test client of a fresh app by default, or to a live
+server with --base-url.
+
+Run with:
+python -m server.benchmarks.replay traffic.jsonl --workers 8 --rate 200
+python -m server.benchmarks.replay traffic.jsonl --base-url http://localhost:5000
+"""
+
+import argparse
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from server.benchmarks.stats import summarize
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+_STOP = object()
+
+
+def read_requests(lines):
+    """
+    Parse recorded requests, skipping blank and malformed lines.
+
+    :param lines: An iterable of JSONL lines.
+    :return: A generator of (method, path, body) tuples.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            method, path = record["method"].upper(), record["path"]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            continue
+        yield method, path, record.get("body")
+
+
+def route_of(method, path):
+    """
+    Group a request by route, replacing numeric path segments and dropping the query string.
+
+    :param method: The HTTP method.
+    :param path: The request path.
+    :return: The route name, e.g. "GET /user/<id>".
+    """
+    return f"{method} {_ID_SEGMENT.sub('/<id>', path.split('?', 1)[0])}"
+
+
+def client_sender(app):
+    """
+    Build a function sending requests through the Flask test client of an app, with one
+    client per worker thread.
+
+    :param app: The Flask app.
+    :return: A function taking (method, path, body) and returning the HTTP status code.
+    """
+    local = threading.local()
+
+    def send(method, path, body):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        return client.open(path, method=method, json=body).status_code
+
+    return send
+
+
+def http_sender(base_url, timeout=30):
+    """
+    Build a function sending requests to a live server.
+
+    :param base_url: The server's base URL, e.g. http://localhost:5000.
+    :param timeout: The per request timeout in seconds.
+    :return: A function taking (method, path, body) and returning the HTTP status code, or 0
+             if the request failed without a response.
+    """
+    base_url = base_url.rstrip("/")
+
+    def send(method, path, body):
+        data = None if body is None else json.dumps(body).encode()
+        http_request = urllib.request.Request(
+            base_url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"} if data is not None else {},
+        )
+        try:
+            with urllib.request.urlopen(http_request, timeout=timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+        except (urllib.error.URLError, OSError):
+            return 0
+
+    return send
+
+
+class ReplayStats:
+    """
+    Thread safe collector of per route latencies and status codes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, route, status, seconds):
+        """
+        Record one replayed request.
+        """
+        with self._lock:
+            latencies, statuses = self._routes.setdefault(route, ([], {}))
+            latencies.append(seconds)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def report(self, elapsed):
+        """
+        Summarize every route.
+
+        :param elapsed: The wall clock duration of the replay in seconds.
+        :return: A dict mapping routes to summaries, with a "statuses" breakdown each.
+        """
+        with self._lock:
+            return {
+                route: {**summarize(latencies, elapsed), "statuses": dict(sorted(statuses.items()))}
+                for route, (latencies, statuses) in sorted(self._routes.items())
+            }
+
+
+def replay(requests, send, workers=4, rate=0.0, limit=None):
+    """
+    Replay requests against a target.
+
+    A reader feeds a bounded queue so memory stays flat however long the input is, and each
+    request is scheduled at start + n / rate when a target rate is given.
+
+    :param requests: An iterable of (method, path, body) tuples.
+    :param send: A function from client_sender or http_sender.
+    :param workers: The number of concurrent worker threads.
+    :param rate: The target number of requests per second across all workers, 0 for as
+                 fast as possible.
+    :param limit: The maximum number of requests to send, or None for all.
+    :return: The report of ReplayStats, and the total duration in seconds.
+    """
+    pending = queue.Queue(maxsize=workers * 16)
+    stats = ReplayStats()
+
+    def work():
+        while True:
+            item = pending.get()
+            if item is _STOP:
+                return
+            due, (method, path, body) = item
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            begin = time.perf_counter()
+            status = send(method, path, body)
+            stats.add(route_of(method, path), status, time.perf_counter() - begin)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for index, item in enumerate(requests):
+        if limit is not None and index >= limit:
+            break
+        due = started + index / rate if rate > 0 else 0.0
+        pending.put((due, item))
+    for _ in threads:
+        pending.put(_STOP)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return stats.report(elapsed), elapsed
+
+
+def _app_sender(database_uri):
+    # imported here so replaying against a live server doesn't need the app's dependencies
+    # pylint: disable=import-outside-toplevel
+    from server.src.app import create_app
+    from server.src.database import db
+
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": database_uri,
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+    return client_sender(app)
+
+
+def main():
+    """
+    Run a replay from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("file", help="JSONL file of recorded requests")
+    parser.add_argument("--base-url", help="replay against a live server instead of the app")
+    parser.add_argument("--database-uri",
+                        help="database for the test client, defaults to a temporary SQLite file")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent workers")
+    parser.add_argument("--rate", type=float, default=0.0, help="target requests per second")
+    parser.add_argument("--limit", type=int, help="maximum number of requests to send")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.base_url:
+        send = http_sender(args.base_url)
+    else:
+        database_uri = args.database_uri
+        if database_uri is None:
+            # a file rather than :memory: so worker threads get their own connections
+            temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+            database_uri = f"sqlite:///{os.path.join(temp_dir.name, 'replay.db')}"
+        send = _app_sender(database_uri)
+
+    with open(args.file, encoding="utf-8") as lines:
+        report, elapsed = replay(
+            read_requests(lines), send, args.workers, args.rate, args.limit
+        )
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+    total = sum(route["requests"] for route in report.values())
+    print(f"{total} requests in {elapsed:.2f} s ({total / elapsed if elapsed else 0:.0f}/s)")
+    print(f"{'route':<40} {'count':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8}  statuses")
+    for route, summary in report.items():
+        print(
+            f"{route:<40} {summary['requests']:6d} {summary['throughput']:7.1f} "
+            f"{summary['p50_ms']:8.2f} {summary['p95_ms']:8.2f} {summary['p99_ms']:8.2f}  "
+            f"{summary['statuses']}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
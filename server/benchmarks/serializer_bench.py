@@ -0,0 +1,61 @@
+"""
+Microbenchmark comparing the compiled model serializers against a naive dict comprehension
+over the table's columns.
+
+Run with:
+python -m server.benchmarks.serializer_bench
+"""
+
+import argparse
+import timeit
+from flask import jsonify
+from server.src.app import create_app
+from server.src.models.models import User, USER_SERIALIZER
+from server.src.models.serializers import json_response
+
+
+def naive_to_json(user):
+    """
+    Serializes a user the straightforward way, walking the columns on every call.
+    """
+    return {
+        column.name: getattr(user, column.name)
+        for column in User.__table__.columns
+        if column.name != "password"
+    }
+
+
+def main():
+    """
+    Times serializing and encoding a page of users with both approaches.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200, help="users per page")
+    parser.add_argument("--repeat", type=int, default=500, help="pages per timing run")
+    args = parser.parse_args()
+
+    users = [
+        User(id=i, username=f"user{i}", email=f"user{i}@example.com", password="secret")
+        for i in range(args.users)
+    ]
+    fields = USER_SERIALIZER.parse_fields("id,username")
+    app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:"})
+
+    with app.app_context():
+        cases = {
+            "naive dict": lambda: [naive_to_json(u) for u in users],
+            "naive dict + jsonify": lambda: jsonify([naive_to_json(u) for u in users]),
+            "compiled dict": lambda: [u.to_json() for u in users],
+            "compiled dict + json_response": lambda: json_response(
+                [u.to_json() for u in users]
+            ),
+            "compiled sparse (id,username)": lambda: [u.to_json(fields=fields) for u in users],
+        }
+        for name, case in cases.items():
+            seconds = min(timeit.repeat(case, number=args.repeat, repeat=3))
+            per_user = seconds / (args.repeat * args.users) * 1e9
+            print(f"{name:<32} {per_user:8.0f} ns/user")
+
+
+if __name__ == "__main__":
+    main()
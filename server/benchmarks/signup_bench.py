@@ -0,0 +1,95 @@
+"""
+Benchmark of signup throughput with password hashing inline and in the process pool.
+
+For each mode, builds the app on a temporary SQLite file and replays POST /user signups
+interleaved with GET /user/<id> reads from several threads, reporting throughput and latency
+of both. The reads show how much hashing slows down the requests that don't hash.
+
+Run with:
+python -m server.benchmarks.signup_bench
+python -m server.benchmarks.signup_bench --signups 500 --threads 16 --cost 14 --workers 4
+"""
+
+import argparse
+import os
+import tempfile
+from server.src.app import create_app
+from server.src.database import db
+from server.src.passwords import DEFAULT_COST
+from server.benchmarks.replay import client_sender, replay
+
+
+def _requests(signups, reads_per_signup):
+    for number in range(signups):
+        yield "POST", "/user", {
+            "name": f"user{number}",
+            "email": f"user{number}@example.com",
+            "password": f"password {number}",
+        }
+        for _ in range(reads_per_signup):
+            yield "GET", "/user/1", None
+
+
+def run(workers, cost, signups, threads, reads_per_signup):
+    """
+    Benchmark one hashing mode on a fresh database.
+
+    :param workers: The number of hashing processes, 0 to hash in the request threads.
+    :return: The replay report, mapping routes to summaries.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(temp_dir, 'signup.db')}",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+                "USER_CACHE_ENABLED": False,
+                "PASSWORD_HASH_COST": cost,
+                "PASSWORD_HASH_WORKERS": workers,
+            }
+        )
+        hasher = app.extensions["password_hasher"]
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        client.post("/user", json={"name": "reader", "email": "reader@example.com",
+                                   "password": "password"})
+        # start the worker processes before timing
+        hasher.hash_many(["warmup"] * max(workers, 1))
+        try:
+            report, _ = replay(
+                _requests(signups, reads_per_signup), client_sender(app), workers=threads
+            )
+        finally:
+            hasher.shutdown()
+            with app.app_context():
+                db.engine.dispose()
+    return report
+
+
+def main():
+    """
+    Run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--signups", type=int, default=200, help="signups per mode")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent request threads")
+    parser.add_argument("--reads", type=int, default=4, help="reads sent per signup")
+    parser.add_argument("--cost", type=int, default=DEFAULT_COST, help="PASSWORD_HASH_COST")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="hashing processes in pool mode")
+    args = parser.parse_args()
+
+    print(f"cost {args.cost}, {args.threads} threads, {os.cpu_count()} CPUs")
+    print(f"{'mode':<8} {'route':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode, workers in (("inline", 0), ("pool", args.workers)):
+        report = run(workers, args.cost, args.signups, args.threads, args.reads)
+        for route, summary in report.items():
+            print(
+                f"{mode:<8} {route:<16} {summary['throughput']:8.1f} {summary['p50_ms']:8.2f} "
+                f"{summary['p95_ms']:8.2f} {summary['p99_ms']:8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
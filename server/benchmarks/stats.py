@@ -0,0 +1,67 @@
+"""
+Helpers for summarizing latency samples and comparing benchmark results against a baseline.
+"""
+
+import math
+
+
+def percentile(sorted_values, fraction):
+    """
+    Get a percentile using the nearest rank method.
+
+    :param sorted_values: The samples, sorted ascending.
+    :param fraction: The percentile as a fraction, e.g. 0.95.
+    :return: The sample at that rank, or 0.0 if there are no samples.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """
+    Summarize the latencies of a run of requests.
+
+    :param latencies: The latency of each request in seconds.
+    :param elapsed: The wall clock duration of the run in seconds.
+    :return: A dict with the request count, throughput in requests per second and the
+             p50, p95 and p99 latencies in milliseconds.
+    """
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compare results against a baseline.
+
+    A scenario regresses if its p95 latency grew, or its throughput shrank, by more than
+    threshold relative to the baseline. Scenarios missing from either side are skipped.
+
+    :param results: Maps scenario names to summaries from summarize().
+    :param baseline: Results of an earlier run, in the same shape.
+    :param threshold: The allowed relative change, e.g. 0.2 for 20%.
+    :return: A list of human readable regression messages, empty if there are none.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']:.2f} ms vs baseline {base['p95_ms']:.2f} ms"
+            )
+        if result["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.0f}/s "
+                f"vs baseline {base['throughput']:.0f}/s"
+            )
+    return regressions
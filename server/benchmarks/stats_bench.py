@@ -0,0 +1,142 @@
+"""
+Benchmark of GET /stats/leaderboard as the habit table grows.
+
+Creates the schema with the migrations, then grows the user and habit tables through each
+size (by default 1k, 10k and 100k users with 0 to 9 habits each), fills user_stats with the
+reconciliation job, and times the leaderboard through the Flask test client, served from
+user_stats, against the same ranking computed with COUNT/GROUP BY over habit.
+
+Run with:
+python -m server.benchmarks.stats_bench
+python -m server.benchmarks.stats_bench --sizes 1000,10000 --requests 200
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import func, insert, select
+from server.src.app import create_app
+from server.src.database import db
+from server.src.migrations import upgrade
+from server.src.models.models import Habit, User
+from server.src.stats import reconcile
+from server.benchmarks.stats import summarize
+
+INSERT_CHUNK = 10000
+HABITS_PER_USER = 5
+
+
+def grow(users, size, rng):
+    """
+    Insert users, each with 0 to 2 * HABITS_PER_USER - 1 habits, until there are size users.
+    The inserts bypass the session, so user_stats is filled by reconciling afterwards.
+
+    :param users: The number of benchmark users already inserted.
+    :param size: The number of benchmark users wanted.
+    :param rng: The random generator picking the number of habits of each user.
+    """
+    for start in range(users, size, INSERT_CHUNK):
+        numbers = range(start, min(start + INSERT_CHUNK, size))
+        db.session.execute(
+            insert(User.__table__),
+            [{"id": n + 1, "username": f"bench{n}", "email": f"bench{n}@example.com",
+              "password": "password"} for n in numbers],
+        )
+        db.session.execute(
+            insert(Habit.__table__),
+            [{"name": f"habit {i}", "user_id": n + 1}
+             for n in numbers for i in range(rng.randrange(HABITS_PER_USER * 2))],
+        )
+        db.session.commit()
+    with db.engine.connect() as connection:
+        reconcile(connection, commit=True)
+
+
+def _aggregate_leaderboard(limit):
+    habit_count = func.count(Habit.id)  # pylint: disable=not-callable
+    return db.session.execute(
+        select(User.id, User.username, habit_count)
+        .join(Habit, Habit.user_id == User.id)
+        .group_by(User.id, User.username)
+        .order_by(habit_count.desc(), User.id.desc())
+        .limit(limit)
+    ).all()
+
+
+def time_calls(call, requests):
+    """
+    Time repeated calls.
+
+    :param call: Function to time, taking no arguments.
+    :param requests: The number of calls.
+    :return: The summary of the calls.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run(database_uri, sizes, requests, limit, rng_seed=0):
+    """
+    Grow the tables through each size and time both leaderboards.
+
+    :return: A dict mapping each size to the summaries of the "counters" and "group by"
+             leaderboards.
+    """
+    # pylint: disable=too-many-arguments
+    app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": database_uri})
+    client = app.test_client()
+    rng = random.Random(rng_seed)
+
+    def counters():
+        if client.get(f"/stats/leaderboard?limit={limit}").status_code != 200:
+            raise RuntimeError("The leaderboard failed")
+
+    def group_by():
+        _aggregate_leaderboard(limit)
+        db.session.remove()
+
+    results = {}
+    users = 0
+    with app.app_context():
+        upgrade(db.engine)
+        for size in sorted(sizes):
+            grow(users, size, rng)
+            users = size
+            db.session.remove()
+            results[size] = {
+                "counters": time_calls(counters, requests),
+                "group by": time_calls(group_by, requests),
+            }
+    return results
+
+
+def main():
+    """
+    Run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated user counts to measure at")
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per size")
+    parser.add_argument("--limit", type=int, default=20, help="users on the leaderboard")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_uri = f"sqlite:///{os.path.join(temp_dir, 'stats.db')}"
+        results = run(database_uri, sizes, args.requests, args.limit)
+
+    print(f"{'users':>9} {'counters p50 ms':>16} {'group by p50 ms':>16} {'speedup':>8}")
+    for size, result in results.items():
+        counters, group_by = result["counters"]["p50_ms"], result["group by"]["p50_ms"]
+        print(f"{size:9d} {counters:16.3f} {group_by:16.3f} {group_by / counters:7.1f}x")
+
+if __name__ == "__main__":
+    main()
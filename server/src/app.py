@@ -5,8 +5,21 @@ Main application module to start application and load config
 import os
 from flask import Flask
 from dotenv import load_dotenv
-from server.src.database import db
+from server.src.database import db, engine_options, init_db
+from server.src.cache import init_cache
+from server.src.metrics import init_metrics
+from server.src.capture import init_capture
+from server.src.idempotency import init_idempotency
+from server.src.migrations import main as migrate, pending
+from server.src.passwords import init_passwords
+from server.src.checkin_buffer import init_checkin_buffer
+from server.src.today import init_today
+from server.src.stats import init_stats
+from server.src.events import init_events
 from server.src.controllers.user_controller import user_controller
+from server.src.controllers.metrics_controller import metrics_controller
+from server.src.controllers.backup_controller import backup_controller
+from server.src.controllers.stats_controller import stats_controller
 from server.src.exceptions.error_handler import ERROR_HANDLERS
 
 
@@ -25,30 +38,97 @@ def create_app(test_config=None):
     - Creates a Flask app instance
     - Configures the app from environment variables if test_config is None
     - If test_config is not None, updates the app's configuration with test_config
-    - Initializes the mysql database with the app
+    - Initializes the mysql database with the app, with connection pooling configured from
+      environment variables and optional read replicas, and disposes its pool when the
+      process exits
+    - Refuses to start in production if schema migrations are pending
+    - Attaches the user cache to the app
+    - Starts recording request and SQL metrics
+    - Starts capturing traffic to a JSONL file if configured
+    - Attaches the Idempotency-Key store to the app and starts its sweeper
+    - Attaches the password hasher to the app
+    - Starts the write-behind buffer of habit check-ins if enabled
+    - Starts the scheduler rebuilding the today snapshots at each local midnight
+    - Starts the job reconciling the user stats with the habit and check-in tables
+    - Attaches the broker of user and habit change events to the app
     """
     dailies_app = Flask(__name__)
     if test_config is None:
         dailies_app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
+        dailies_app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+            os.environ, os.getenv("DATABASE_URI")
+        )
         dailies_app.config.from_mapping(
+            DATABASE_REPLICA_URIS=os.environ.get("DATABASE_REPLICA_URIS"),
             SECRET_KEY=os.environ.get("SECRET_KEY") or "dev",
+            USER_CACHE_ENABLED=os.environ.get("USER_CACHE_ENABLED", "true").lower() == "true",
+            USER_CACHE_MAX_ENTRIES=int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000")),
+            USER_CACHE_TTL=float(os.environ.get("USER_CACHE_TTL", "60")),
+            SLOW_REQUEST_THRESHOLD_MS=os.environ.get("SLOW_REQUEST_THRESHOLD_MS"),
+            TRAFFIC_CAPTURE_PATH=os.environ.get("TRAFFIC_CAPTURE_PATH"),
+            TRAFFIC_CAPTURE_SAMPLE=os.environ.get("TRAFFIC_CAPTURE_SAMPLE"),
+            TRAFFIC_CAPTURE_REDACT=os.environ.get("TRAFFIC_CAPTURE_REDACT"),
+            TRAFFIC_CAPTURE_QUERY_ALLOW=os.environ.get("TRAFFIC_CAPTURE_QUERY_ALLOW"),
+            IDEMPOTENCY_TTL=os.environ.get("IDEMPOTENCY_TTL"),
+            IDEMPOTENCY_WAIT_TIMEOUT=os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT"),
+            IDEMPOTENCY_LEASE=os.environ.get("IDEMPOTENCY_LEASE"),
+            IDEMPOTENCY_SWEEP_INTERVAL=os.environ.get("IDEMPOTENCY_SWEEP_INTERVAL", "300"),
+            PASSWORD_HASH_COST=os.environ.get("PASSWORD_HASH_COST"),
+            PASSWORD_HASH_WORKERS=os.environ.get(
+                "PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)
+            ),
+            CHECKIN_WRITE_BEHIND=os.environ.get("CHECKIN_WRITE_BEHIND", "false").lower()
+            == "true",
+            CHECKIN_QUEUE_SIZE=os.environ.get("CHECKIN_QUEUE_SIZE"),
+            CHECKIN_FLUSH_BATCH=os.environ.get("CHECKIN_FLUSH_BATCH"),
+            CHECKIN_FLUSH_INTERVAL_MS=os.environ.get("CHECKIN_FLUSH_INTERVAL_MS"),
+            CHECKIN_ENQUEUE_TIMEOUT=os.environ.get("CHECKIN_ENQUEUE_TIMEOUT"),
+            TODAY_SCHEDULER_INTERVAL=os.environ.get("TODAY_SCHEDULER_INTERVAL", "300"),
+            STATS_RECONCILE_INTERVAL=os.environ.get("STATS_RECONCILE_INTERVAL", "3600"),
+            HABIT_SEARCH_BACKEND=os.environ.get("HABIT_SEARCH_BACKEND"),
+            EVENTS_BUFFER_SIZE=os.environ.get("EVENTS_BUFFER_SIZE"),
+            EVENTS_LOG_SIZE=os.environ.get("EVENTS_LOG_SIZE"),
+            EVENTS_LOG_USERS=os.environ.get("EVENTS_LOG_USERS"),
+            EVENTS_HEARTBEAT_INTERVAL=os.environ.get("EVENTS_HEARTBEAT_INTERVAL"),
+            EVENTS_LONG_POLL_TIMEOUT=os.environ.get("EVENTS_LONG_POLL_TIMEOUT"),
+            BACKUP_TOKEN=os.environ.get("BACKUP_TOKEN"),
         )
     else:
         dailies_app.config.update(test_config)
 
-    db.init_app(dailies_app)
+    init_db(dailies_app)
+    if test_config is None:
+        # an outdated schema would otherwise fail every query, e.g. without version columns
+        with dailies_app.app_context(), db.engine.connect() as connection:
+            missing = pending(connection)
+        if missing:
+            raise RuntimeError(
+                f"The database is missing the migrations {missing}, "
+                "apply them with: python -m server.src.migrations"
+            )
+    init_cache(dailies_app)
+    init_metrics(dailies_app)
+    init_capture(dailies_app)
+    init_idempotency(dailies_app)
+    init_passwords(dailies_app)
+    init_checkin_buffer(dailies_app)
+    init_today(dailies_app)
+    init_stats(dailies_app)
+    init_events(dailies_app)
 
     for exception, handler in ERROR_HANDLERS.items():
         dailies_app.register_error_handler(exception, handler)
 
     dailies_app.register_blueprint(user_controller)
+    dailies_app.register_blueprint(metrics_controller)
+    dailies_app.register_blueprint(backup_controller)
+    dailies_app.register_blueprint(stats_controller)
 
     return dailies_app
 
 
 
 if __name__ == "__main__":
+    migrate()
     app = create_app()
-    with app.app_context():
-        db.create_all()
     app.run(debug=True)
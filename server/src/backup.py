@@ -0,0 +1,295 @@
+"""
+This module exports every user, with their habits and check-ins, as NDJSON, and imports
+such an export, e.g. to back up a database or to move users between environments.
+
+Each line of an export is one user:
+{"name", "email", "password", "timezone", "habits": [{"name", "current_streak",
+"longest_streak", "last_checkin", "checkins": [{"year", "days"}]}]}
+where password is the stored hash, only exported when asked for, last_checkin is left out
+if the habit was never checked in, and days is the base64 check-in bitmap of the year. IDs
+are not exported, imported users and habits get new ones. Users imported without a password
+get one that never matches, so they have to set a new one.
+
+Export reads the users a chunk at a time, and import writes a fixed number of lines per
+transaction, so neither holds more than a chunk in memory. Every
+import transaction also records how many lines of the import it has consumed, under an
+import ID, so an import that stopped part way can be sent again in full with the same ID and
+resumes after the last committed line.
+
+See server.src.backup_cli to run an export or import from the command line.
+"""
+
+import base64
+import binascii
+import json
+import time
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import Conflict
+from server.src.database import db
+from server.src.models.helpers import YEAR_BITMAP_BYTES, Field, Schema, timezone_error
+from server.src.models.models import EMAIL_IN_USE, Habit, HabitCheckin, User
+from server.src.models.serializers import dumps
+from server.src.passwords import is_password_hash, password_hasher, unusable_password
+
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_ID_LENGTH = 64
+# errors listed in an import summary, further ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def _date_error(value):
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return "must be a date in YYYY-MM-DD format"
+    return None
+
+
+def _bitmap_error(value):
+    try:
+        days = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return "must be base64"
+    if len(days) != YEAR_BITMAP_BYTES:
+        return f"must encode {YEAR_BITMAP_BYTES} bytes"
+    return None
+
+
+CHECKIN_RECORD = Schema(
+    "Check-in",
+    {
+        "year": Field(int, required=True),
+        "days": Field(str, required=True, check=_bitmap_error),
+    },
+)
+
+HABIT_RECORD = Schema(
+    "Habit",
+    {
+        "name": Field(str, required=True, max_length=80),
+        "current_streak": Field(int),
+        "longest_streak": Field(int),
+        "last_checkin": Field(str, check=_date_error),
+        "checkins": Field(list, schema=CHECKIN_RECORD),
+    },
+)
+
+USER_RECORD = Schema(
+    "User",
+    {
+        "name": Field(str, required=True, max_length=80),
+        "email": Field(str, required=True, max_length=100),
+        "password": Field(str, max_length=120),
+        "timezone": Field(str, max_length=64, check=timezone_error),
+        "habits": Field(list, schema=HABIT_RECORD),
+    },
+)
+
+
+class ImportCheckpoint(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    The progress of an import.
+
+    Attributes:
+        import_id (str): The ID the import was sent with.
+        lines (int): The number of lines of the import committed so far.
+        created (int): The number of users created by the import so far.
+        updated_at (float): The UNIX time of the last commit of the import.
+    """
+
+    __tablename__ = "import_checkpoint"
+
+    import_id = db.Column(db.String(MAX_IMPORT_ID_LENGTH), primary_key=True)
+    lines = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.Float, nullable=False)
+
+
+def _habit_record(habit):
+    record = {
+        "name": habit.name,
+        "current_streak": habit.current_streak,
+        "longest_streak": habit.longest_streak,
+    }
+    if habit.last_checkin is not None:
+        record["last_checkin"] = habit.last_checkin.isoformat()
+    if habit.checkins:
+        record["checkins"] = [
+            {"year": checkin.year, "days": base64.b64encode(checkin.days).decode()}
+            for checkin in sorted(habit.checkins, key=lambda checkin: checkin.year)
+        ]
+    return record
+
+
+def _user_record(user, include_passwords):
+    record = {"name": user.username, "email": user.email}
+    if include_passwords:
+        record["password"] = user.password
+    record["timezone"] = user.timezone
+    record["habits"] = [
+        _habit_record(habit) for habit in sorted(user.habits, key=lambda habit: habit.id)
+    ]
+    return record
+
+
+def export_lines(chunk_size=EXPORT_CHUNK_SIZE, include_passwords=False):
+    """
+    Export every user, in ID order. Users are read chunk_size at a time, by keyset on their
+    ID like KeysetPaginator, with the habits and check-ins of each chunk loaded by one IN
+    query each, and the session is emptied after every chunk, so memory stays constant
+    however many users there are.
+
+    :param chunk_size: The number of users read and yielded at once.
+    :param include_passwords: Whether to export the password hashes, which are left out by
+                              default.
+    :return: A generator of bytes, each holding the NDJSON lines of a chunk of users.
+    """
+    last_id = 0
+    while True:
+        users = db.session.scalars(
+            select(User)
+            .where(User.id > last_id)
+            .order_by(User.id)
+            .limit(chunk_size)
+            .options(selectinload(User.habits).selectinload(Habit.checkins))
+        ).all()
+        if not users:
+            return
+        last_id = users[-1].id
+        chunk = b"".join(dumps(_user_record(user, include_passwords)) + b"\n" for user in users)
+        db.session.expunge_all()
+        yield chunk
+
+
+def _habit_from_record(record):
+    checkins = {
+        checkin["year"]: base64.b64decode(checkin["days"])
+        for checkin in record.get("checkins", [])
+    }
+    last_checkin = record.get("last_checkin")
+    return Habit(
+        name=record["name"],
+        current_streak=record.get("current_streak", 0),
+        longest_streak=record.get("longest_streak", 0),
+        last_checkin=date.fromisoformat(last_checkin) if last_checkin else None,
+        checkins=[HabitCheckin(year=year, days=days) for year, days in checkins.items()],
+    )
+
+
+def _fail(summary, line, error):
+    summary["failed"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line, "error": error})
+
+
+def _users_from_records(records, summary):
+    """
+    Build the users of valid (line number, record) pairs, skipping those whose email is
+    already used, and hash together the passwords that are not hashes yet.
+    """
+    emails = [record["email"] for _, record in records]
+    taken = set(db.session.scalars(select(User.email).where(User.email.in_(emails))))
+    pending = []
+    for line, record in records:
+        if record["email"] in taken:
+            _fail(summary, line, EMAIL_IN_USE)
+            continue
+        taken.add(record["email"])
+        pending.append(record)
+
+    users = [
+        User(
+            username=record["name"],
+            email=record["email"],
+            password=record.get("password") or unusable_password(),
+            timezone=record.get("timezone", "UTC"),
+            habits=[_habit_from_record(habit) for habit in record.get("habits", [])],
+        )
+        for record in pending
+    ]
+    plain = [user for user in users if not is_password_hash(user.password)]
+    if plain:
+        hashes = password_hasher().hash_many([user.password for user in plain])
+        for user, password_hash in zip(plain, hashes):
+            user.password = password_hash
+    return users
+
+
+def _import_batch(checkpoint, batch, last_line, summary, clock):
+    """
+    Create the users of a batch of (line number, line) pairs and move the checkpoint to
+    last_line, in one transaction.
+    """
+    # pylint: disable=too-many-arguments
+    records = []
+    for line, text in batch:
+        try:
+            record = json.loads(text)
+        except ValueError:
+            _fail(summary, line, "Invalid JSON")
+            continue
+        error = USER_RECORD.errors(record)
+        if error is not None:
+            _fail(summary, line, error)
+            continue
+        records.append((line, record))
+
+    users = _users_from_records(records, summary) if records else []
+    db.session.add_all(users)
+    checkpoint.lines = last_line
+    checkpoint.created += len(users)
+    checkpoint.updated_at = clock()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        raise Conflict(
+            f"Import {checkpoint.import_id} conflicts with another write, send it again to resume"
+        ) from e
+    summary["created"] += len(users)
+
+
+def import_lines(lines, import_id, batch_size=IMPORT_BATCH_SIZE, clock=time.time):
+    """
+    Create users, with their habits and check-ins, from the lines of an export, committing
+    every batch_size lines. Lines already committed under the same import ID are skipped.
+    Invalid lines, and users whose email is already used, are reported and skipped.
+
+    :param lines: An iterable of NDJSON lines, as bytes or str, consumed lazily.
+    :param import_id: The ID of the import, to resume it if it is sent again.
+    :param batch_size: The number of lines written per transaction.
+    :param clock: Function returning the current UNIX time.
+    :return: A dict with the import_id, the line it resumed_from, the number of lines read,
+             the number of users created and failed in this run, and the errors of the
+             first failed lines, each as {"line", "error"}.
+    :raises Conflict: If a batch conflicts with another import or write, in which case the
+                      batches before it stay committed.
+    """
+    checkpoint = db.session.get(ImportCheckpoint, import_id)
+    if checkpoint is None:
+        checkpoint = ImportCheckpoint(import_id=import_id, lines=0, created=0, updated_at=clock())
+        db.session.add(checkpoint)
+    resumed_from = checkpoint.lines
+    summary = {
+        "import_id": import_id,
+        "resumed_from": resumed_from,
+        "lines": 0,
+        "created": 0,
+        "failed": 0,
+        "errors": [],
+    }
+    batch = []
+    for number, text in enumerate(lines, 1):
+        summary["lines"] = number
+        if number <= resumed_from or not text.strip():
+            continue
+        batch.append((number, text))
+        if len(batch) == batch_size:
+            _import_batch(checkpoint, batch, number, summary, clock)
+            batch = []
+    _import_batch(checkpoint, batch, max(resumed_from, summary["lines"]), summary, clock)
+    return summary
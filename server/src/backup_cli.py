@@ -0,0 +1,72 @@
+"""
+This module exports every user as NDJSON, or imports such an export, from the command line,
+on the database configured by DATABASE_URI. See server.src.backup for the format.
+
+Run with:
+python -m server.src.backup_cli export --output users.ndjson [--include-passwords]
+python -m server.src.backup_cli import users.ndjson --import-id users-2024-03-10
+"""
+
+import argparse
+import json
+import os
+import sys
+from sqlalchemy import create_engine
+from server.src.app import create_app
+from server.src.migrations import upgrade
+from server.src.backup import (
+    EXPORT_CHUNK_SIZE, IMPORT_BATCH_SIZE, MAX_IMPORT_ID_LENGTH, export_lines, import_lines
+)
+
+
+def _export(output, chunk_size, include_passwords):
+    for chunk in export_lines(chunk_size, include_passwords):
+        output.write(chunk)
+
+
+def main():
+    """
+    Export or import the database configured by DATABASE_URI from the command line, after
+    bringing its schema up to date.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write every user as NDJSON")
+    export_parser.add_argument("--output", help="the file to write, defaults to stdout")
+    export_parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    export_parser.add_argument("--include-passwords", action="store_true",
+                               help="export the password hashes, left out by default")
+    import_parser = commands.add_parser("import", help="create users from an export")
+    import_parser.add_argument("path", help="the NDJSON file to import")
+    import_parser.add_argument("--import-id", help="the ID to resume by, defaults to the path")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    # a one-off command has no today snapshots or stats to keep up to date
+    os.environ["TODAY_SCHEDULER_INTERVAL"] = "0"
+    os.environ["STATS_RECONCILE_INTERVAL"] = "0"
+    engine = create_engine(os.environ["DATABASE_URI"])
+    try:
+        upgrade(engine)
+    finally:
+        engine.dispose()
+    app = create_app()
+    with app.app_context():
+        if args.command == "export" and args.output:
+            with open(args.output, "wb") as output:
+                _export(output, args.chunk_size, args.include_passwords)
+        elif args.command == "export":
+            _export(sys.stdout.buffer, args.chunk_size, args.include_passwords)
+        else:
+            with open(args.path, "rb") as lines:
+                summary = import_lines(
+                    lines, (args.import_id or args.path)[-MAX_IMPORT_ID_LENGTH:],
+                    args.batch_size,
+                )
+            print(json.dumps(summary, indent=2))
+            if summary["failed"]:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
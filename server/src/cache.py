@@ -0,0 +1,264 @@
+"""
+This module provides the cache layer that sits in front of user reads.
+
+A CacheBackend is a key value store with a per entry time to live. LRUCache keeps entries in
+process, other backends (e.g. one shared between workers) only need to implement the same
+get/peek/set/delete/stats interface. UserCache uses a backend as a read-through cache of
+serialized users, keyed by user id and a version token that writers replace to invalidate.
+"""
+
+import abc
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 60
+
+
+class CacheBackend(abc.ABC):
+    """
+    Interface for cache backends. Implementations must be safe to call from several threads.
+    """
+
+    @abc.abstractmethod
+    def get(self, key):
+        """
+        Get a value from the cache.
+
+        :param key: The key to look up.
+        :return: The cached value, or None if the key is missing or expired.
+        """
+
+    @abc.abstractmethod
+    def peek(self, key):
+        """
+        Get a value from the cache without counting a hit or miss, for bookkeeping entries
+        such as version tokens.
+
+        :param key: The key to look up.
+        :return: The cached value, or None if the key is missing or expired.
+        """
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl=None):
+        """
+        Store a value in the cache.
+
+        :param key: The key to store the value under.
+        :param value: The value to store, which must not be None.
+        :param ttl: Seconds until the entry expires, or None for the backend default.
+        """
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """
+        Remove a key from the cache if it is present.
+
+        :param key: The key to remove.
+        """
+
+    @abc.abstractmethod
+    def stats(self):
+        """
+        Get the cache counters.
+
+        :return: A dict with at least hits, misses, evictions and size.
+        """
+
+
+class NullCache(CacheBackend):
+    """
+    Backend that stores nothing, used when caching is disabled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            self._misses += 1
+
+    def peek(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def stats(self):
+        return {"hits": 0, "misses": self._misses, "evictions": 0, "size": 0}
+
+
+class LRUCache(CacheBackend):
+    """
+    In process backend that evicts the least recently used entry once max_entries is reached
+    and treats entries older than their ttl as missing.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        """
+        :param max_entries: The maximum number of entries to hold.
+        :param ttl: The default number of seconds an entry lives for.
+        :param clock: Function returning the current time in seconds, replaceable in tests.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        return self._get(key, count=True)
+
+    def peek(self, key):
+        return self._get(key, count=False)
+
+    def _get(self, key, count):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    if count:
+                        self._counters["hits"] += 1
+                    return value
+                del self._entries[key]
+            if count:
+                self._counters["misses"] += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "size": len(self._entries)}
+
+
+class UserCache:
+    """
+    Read-through cache of serialized users.
+
+    Each user has a version token stored in the backend, and entries are keyed by user id,
+    version and the requested includes. Invalidating a user replaces its token, so entries
+    written by readers that loaded the user before the write are never served again and age
+    out of the backend. Tokens are random rather than counters so a token that was evicted
+    can never be recreated with the value of an older one.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: The CacheBackend to store versions and users in.
+        """
+        self.backend = backend
+
+    @property
+    def enabled(self):
+        """
+        Whether entries are kept, False with a NullCache backend.
+        """
+        return not isinstance(self.backend, NullCache)
+
+    def _version(self, user_id):
+        key = f"user:{user_id}:version"
+        # not counted, so the stats only count lookups of users
+        version = self.backend.peek(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.backend.set(key, version)
+        return version
+
+    def key(self, user_id, include):
+        """
+        Get the key a user's entry is stored under for its current version.
+        Read the key before loading the user from the database, so that if a write commits
+        in between the entry is stored under the version it replaced.
+
+        :param user_id: The ID of the user.
+        :param include: The relationships nested in the serialized user.
+        :return: The cache key.
+        """
+        return f"user:{user_id}:{self._version(user_id)}:{','.join(sorted(include))}"
+
+    def lookup(self, key):
+        """
+        Get a cached entry.
+
+        :param key: The key returned by key().
+        :return: The cached entry, or None on a miss. Callers must not mutate the entry as
+                 it is shared with other requests.
+        """
+        return self.backend.get(key)
+
+    def store(self, key, entry):
+        """
+        Cache an entry.
+
+        :param key: The key returned by key() before the entry was loaded.
+        :param entry: The entry to cache.
+        """
+        self.backend.set(key, entry)
+
+    def invalidate(self, user_id):
+        """
+        Invalidate every cached entry for a user. Call after a write to the user or any of
+        its habits has been committed.
+
+        :param user_id: The ID of the user that changed.
+        """
+        self.backend.set(f"user:{user_id}:version", uuid.uuid4().hex)
+
+    def stats(self):
+        """
+        Get the backend's hit, miss and eviction counters.
+
+        :return: A dict of counters.
+        """
+        return self.backend.stats()
+
+
+def init_cache(app, backend=None):
+    """
+    Attach a UserCache to the app.
+
+    :param app: The Flask app.
+    :param backend: The CacheBackend to use. If None one is built from the app config:
+                    an LRUCache sized by USER_CACHE_MAX_ENTRIES and USER_CACHE_TTL, or a
+                    NullCache if USER_CACHE_ENABLED is False.
+    """
+    if backend is None:
+        if app.config.get("USER_CACHE_ENABLED", True):
+            backend = LRUCache(
+                max_entries=int(app.config.get("USER_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                ttl=float(app.config.get("USER_CACHE_TTL", DEFAULT_TTL)),
+            )
+        else:
+            backend = NullCache()
+    app.extensions["user_cache"] = UserCache(backend)
+
+
+def user_cache():
+    """
+    Get the UserCache of the current app.
+
+    :return: The UserCache attached by init_cache.
+    """
+    return current_app.extensions["user_cache"]
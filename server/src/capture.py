@@ -0,0 +1,138 @@
+"""
+This module records the requests an app handles to a JSONL file, one request per line, in
+the format consumed by the replay tool in server/benchmarks/replay.py:
+
+{"ts": 1700000000.0, "method": "POST", "path": "/user", "body": {...}, "status": 201}
+
+Fields named in TRAFFIC_CAPTURE_REDACT (by default password) are replaced in captured bodies.
+Query strings can carry personal data too, e.g. GET /user?email=, so only the values of the
+query parameters named in TRAFFIC_CAPTURE_QUERY_ALLOW are recorded, others are replaced.
+"""
+
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode
+from flask import current_app, request
+
+REDACTED = "[REDACTED]"
+# query parameters that identify no one, recorded as sent
+DEFAULT_QUERY_ALLOW = (
+    "cursor", "limit", "include", "fields", "ids", "from", "to", "metric", "timeout"
+)
+
+
+class TrafficRecorder:
+    """
+    Appends captured requests to a JSONL file. Safe to use from several threads.
+    """
+
+    def __init__(self, path, sample_rate=1.0, redact=("password",),
+                 query_allow=DEFAULT_QUERY_ALLOW):
+        """
+        :param path: The file to append requests to.
+        :param sample_rate: The fraction of requests to record, between 0 and 1.
+        :param redact: Body field names whose values are replaced before writing.
+        :param query_allow: Query parameter names whose values are written as sent, unless
+                            also named in redact.
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.redact = frozenset(redact)
+        self.query_allow = frozenset(query_allow) - self.redact
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+    def _redacted(self, body):
+        if isinstance(body, dict):
+            return {
+                key: REDACTED if key in self.redact else self._redacted(value)
+                for key, value in body.items()
+            }
+        if isinstance(body, list):
+            return [self._redacted(item) for item in body]
+        return body
+
+    def captured_path(self, path, args):
+        """
+        Build the path to record for a request, replacing the values of the query
+        parameters not in query_allow.
+
+        :param path: The path without its query string.
+        :param args: The query parameters, as a MultiDict.
+        :return: The path with the redacted query string, if any.
+        """
+        query = urlencode(
+            [(name, value if name in self.query_allow else REDACTED)
+             for name, value in args.items(multi=True)],
+            safe=",[]",
+        )
+        return f"{path}?{query}" if query else path
+
+    def record(self, method, path, body, status):
+        """
+        Record a request, subject to the sample rate.
+
+        :param method: The HTTP method.
+        :param path: The path including any query string, from captured_path.
+        :param body: The parsed JSON body, or None.
+        :param status: The HTTP status code of the response.
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        line = json.dumps(
+            {
+                "ts": time.time(),
+                "method": method,
+                "path": path,
+                "body": self._redacted(body),
+                "status": status,
+            },
+            separators=(",", ":"),
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        """
+        Close the capture file.
+        """
+        with self._lock:
+            self._file.close()
+
+
+def _capture_request(response):
+    recorder = current_app.extensions["traffic_recorder"]
+    body = request.get_json(silent=True) if request.is_json else None
+    recorder.record(
+        request.method, recorder.captured_path(request.path, request.args), body,
+        response.status_code,
+    )
+    return response
+
+
+def init_capture(app):
+    """
+    Start recording requests if TRAFFIC_CAPTURE_PATH is configured. TRAFFIC_CAPTURE_SAMPLE
+    sets the fraction of requests recorded, TRAFFIC_CAPTURE_REDACT the comma separated
+    body fields to redact and TRAFFIC_CAPTURE_QUERY_ALLOW the comma separated query
+    parameters recorded as sent.
+
+    :param app: The Flask app.
+    """
+    path = app.config.get("TRAFFIC_CAPTURE_PATH")
+    if not path:
+        return
+    redact = app.config.get("TRAFFIC_CAPTURE_REDACT") or "password"
+    query_allow = app.config.get("TRAFFIC_CAPTURE_QUERY_ALLOW")
+    app.extensions["traffic_recorder"] = TrafficRecorder(
+        path,
+        sample_rate=float(app.config.get("TRAFFIC_CAPTURE_SAMPLE") or 1.0),
+        redact=[field.strip() for field in redact.split(",") if field.strip()],
+        query_allow=[
+            name.strip() for name in query_allow.split(",") if name.strip()
+        ] if query_allow is not None else DEFAULT_QUERY_ALLOW,
+    )
+    app.after_request(_capture_request)
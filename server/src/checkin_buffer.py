@@ -0,0 +1,247 @@
+"""
+This module buffers habit check-ins in memory and writes them to the database in batches.
+
+With CHECKIN_WRITE_BEHIND enabled, POST /user/<id>/habit/<habit_id>/checkin queues the
+check-in and answers at once. A flusher thread writes the queued check-ins in one
+transaction every CHECKIN_FLUSH_INTERVAL_MS, or as soon as CHECKIN_FLUSH_BATCH of them are
+waiting, dropping repeats of the same habit and day. When CHECKIN_QUEUE_SIZE check-ins are
+waiting, requests wait up to CHECKIN_ENQUEUE_TIMEOUT seconds for room and then fail with 503,
+so a database that falls behind slows clients down instead of growing the queue.
+
+The queue is flushed when the process exits normally. Check-ins still queued when the
+process is killed are lost, which is the price of acknowledging them before they are written.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.exceptions import HTTPException
+from server.src.cache import user_cache
+from server.src.histogram import Histogram
+from server.src.models.models import Habit
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_ENQUEUE_TIMEOUT = 1.0
+FLUSH_ATTEMPTS = 3
+FLUSH_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+EVENTS = ("queued", "coalesced", "rejected", "written", "failed")
+
+logger = logging.getLogger(__name__)
+
+
+class _Marker:  # pylint: disable=too-few-public-methods
+    """
+    Queued by flush and close, and set once the check-ins queued before it are written.
+    """
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class CheckinBuffer:  # pylint: disable=too-many-instance-attributes
+    """
+    A bounded queue of check-ins, written to the database in batches by a flusher thread.
+    """
+
+    def __init__(self, app, max_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 interval=DEFAULT_FLUSH_INTERVAL_MS / 1000,
+                 enqueue_timeout=DEFAULT_ENQUEUE_TIMEOUT):
+        """
+        :param app: The Flask app whose database the check-ins are written to.
+        :param max_size: The number of check-ins that can wait to be written.
+        :param batch_size: The number of check-ins that triggers a write.
+        :param interval: The longest time in seconds a check-in waits to be written.
+        :param enqueue_timeout: The time in seconds to wait for room in a full queue.
+        """
+        # pylint: disable=too-many-arguments
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(EVENTS, 0)
+        self._flush_seconds = Histogram(FLUSH_BUCKETS)
+        self._thread = threading.Thread(target=self._run, name="checkin-flusher", daemon=True)
+        self._closed = False
+
+    def start(self):
+        """
+        Start the flusher thread.
+        """
+        self._thread.start()
+
+    def put(self, habit_id, day):
+        """
+        Queue a check-in, waiting for room if the queue is full.
+
+        :param habit_id: The ID of the habit.
+        :param day: The date the habit was completed.
+        :return: True if the check-in was queued, False if the queue stayed full or the
+                 buffer is closed.
+        """
+        if self._closed:
+            self._count("rejected")
+            return False
+        try:
+            self._queue.put((habit_id, day), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("queued")
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until every check-in queued so far is written.
+
+        :param timeout: The longest time in seconds to wait, None to wait until done.
+        :return: True if the check-ins were written within the timeout.
+        """
+        return self._send(_Marker(), timeout)
+
+    def close(self, timeout=30):
+        """
+        Write the queued check-ins and stop the flusher thread. Check-ins queued afterwards
+        are never written.
+
+        :param timeout: The longest time in seconds to wait.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._send(_Marker(stop=True), timeout)
+
+    def _send(self, marker, timeout):
+        if not self._thread.is_alive():
+            # nothing would take the marker off the queue, write from this thread instead
+            self._write(self._drain())
+            return True
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return [item for item in batch if not isinstance(item, _Marker)]
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, markers = self._collect()
+            try:
+                self._write(batch)
+            except Exception:  # pylint: disable=broad-exception-caught
+                self._count("failed", len(batch))
+                logger.exception("Writing %d check-ins failed", len(batch))
+            for marker in markers:
+                stop = stop or marker.stop
+                marker.done.set()
+
+    def _collect(self):
+        """
+        Wait for a check-in, then take more until the batch is full, the interval is up or
+        a marker asks for the batch to be written now.
+        """
+        batch, markers = [], []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.interval
+        while True:
+            if isinstance(item, _Marker):
+                markers.append(item)
+                return batch, markers
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                return batch, markers
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, markers
+
+    def _write(self, batch):
+        if not batch:
+            return
+        days_by_habit = {}
+        for habit_id, day in batch:
+            days_by_habit.setdefault(habit_id, set()).add(day)
+        unique = sum(len(days) for days in days_by_habit.values())
+        self._count("coalesced", len(batch) - unique)
+
+        started = time.perf_counter()
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                with self.app.app_context():
+                    changed = Habit.check_in_many(days_by_habit)
+                    cache = user_cache()
+                    for user_id in changed:
+                        cache.invalidate(user_id)
+                break
+            except (HTTPException, SQLAlchemyError):
+                # a conflict with a concurrent habit update, or a lost connection
+                logger.warning("Writing %d check-ins failed, attempt %d of %d", unique,
+                               attempt, FLUSH_ATTEMPTS, exc_info=True)
+        else:
+            self._count("failed", unique)
+            logger.error("Dropped %d check-ins after %d attempts", unique, FLUSH_ATTEMPTS)
+            return
+        with self._lock:
+            self._flush_seconds.observe(time.perf_counter() - started)
+            self._counts["written"] += unique
+
+    def _count(self, event, amount=1):
+        with self._lock:
+            self._counts[event] += amount
+
+    def stats(self):
+        """
+        Get the queue depth and counters of the buffer.
+
+        :return: A dict with depth, capacity, the count of every event in EVENTS under
+                 events, and flush_buckets, flush_sum and flush_count for the time taken
+                 by each batch write.
+        """
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "events": dict(self._counts),
+                "flush_buckets": self._flush_seconds.cumulative_counts(),
+                "flush_sum": self._flush_seconds.sum,
+                "flush_count": self._flush_seconds.count,
+            }
+
+
+def init_checkin_buffer(app):
+    """
+    Attach a CheckinBuffer to the app and start its flusher if CHECKIN_WRITE_BEHIND is set,
+    configured with CHECKIN_QUEUE_SIZE, CHECKIN_FLUSH_BATCH, CHECKIN_FLUSH_INTERVAL_MS and
+    CHECKIN_ENQUEUE_TIMEOUT. The buffer is flushed when the process exits.
+
+    :param app: The Flask app.
+    """
+    if not app.config.get("CHECKIN_WRITE_BEHIND"):
+        return
+    buffer = CheckinBuffer(
+        app,
+        max_size=int(app.config.get("CHECKIN_QUEUE_SIZE") or DEFAULT_QUEUE_SIZE),
+        batch_size=int(app.config.get("CHECKIN_FLUSH_BATCH") or DEFAULT_BATCH_SIZE),
+        interval=float(
+            app.config.get("CHECKIN_FLUSH_INTERVAL_MS") or DEFAULT_FLUSH_INTERVAL_MS
+        ) / 1000,
+        enqueue_timeout=float(
+            app.config.get("CHECKIN_ENQUEUE_TIMEOUT") or DEFAULT_ENQUEUE_TIMEOUT
+        ),
+    )
+    buffer.start()
+    app.extensions["checkin_buffer"] = buffer
+    atexit.register(buffer.close)
@@ -0,0 +1,71 @@
+"""
+This module is a controller for exporting every user as NDJSON and importing such exports.
+Both are only served when BACKUP_TOKEN is set, to requests sending it as a bearer token.
+"""
+
+import hmac
+import uuid
+from flask import Blueprint, current_app, request, stream_with_context
+from werkzeug.exceptions import BadRequest, Forbidden, NotFound, UnsupportedMediaType
+from server.src.backup import MAX_IMPORT_ID_LENGTH, export_lines, import_lines
+from server.src.models.serializers import json_response
+
+backup_controller = Blueprint("backup_controller", __name__)
+
+NDJSON = "application/x-ndjson"
+
+
+@backup_controller.before_request
+def require_backup_token():
+    """
+    Refuse backup requests unless BACKUP_TOKEN is set and sent as the bearer token, since an
+    export holds every user's email and an import creates users.
+
+    :raises NotFound: If BACKUP_TOKEN is not set.
+    :raises Forbidden: If the request does not send BACKUP_TOKEN.
+    """
+    token = current_app.config.get("BACKUP_TOKEN")
+    if not token:
+        raise NotFound("Backups are not enabled")
+    credentials = request.authorization
+    sent = credentials.token if credentials is not None and credentials.type == "bearer" else None
+    if not sent or not hmac.compare_digest(sent.encode(), token.encode()):
+        raise Forbidden("A valid backup token is required")
+
+
+@backup_controller.route("/export", methods=["GET"])
+def export_users():
+    """
+    Export every user, with their habits and check-ins, one user per line. The body is
+    streamed as it is read from the primary, so it has every committed write, a chunk of
+    users at a time. Password hashes are only exported with ?include_passwords=true.
+
+    :return: An NDJSON stream of users and a 200 HTTP status code.
+    """
+    include_passwords = request.args.get("include_passwords", "").lower() == "true"
+    lines = export_lines(include_passwords=include_passwords)
+    return current_app.response_class(stream_with_context(lines), mimetype=NDJSON)
+
+
+@backup_controller.route("/import", methods=["POST"])
+def import_users():
+    """
+    Create users, with their habits and check-ins, from an NDJSON export in the body. The
+    body is read line by line and written a batch of lines per transaction, each recording
+    how far the import got under its import_id, so sending the same body again with the
+    same import_id resumes after the last committed batch.
+
+    :return: A JSON object with the import_id, the line the import resumed_from, the number
+             of lines read, the number of users created and failed, and the errors of the
+             first failed lines, with a 200 HTTP status code if no line failed, else a 207
+             HTTP status code, 415 if the body is not NDJSON, or 409 if a batch conflicted
+             with another write.
+    """
+    if request.mimetype != NDJSON:
+        raise UnsupportedMediaType(f"The body must be {NDJSON}")
+    import_id = request.args.get("import_id") or uuid.uuid4().hex
+    if len(import_id) > MAX_IMPORT_ID_LENGTH:
+        raise BadRequest(f"import_id must be at most {MAX_IMPORT_ID_LENGTH} characters")
+
+    summary = import_lines(request.stream, import_id)
+    return json_response(summary, 207 if summary["failed"] else 200)
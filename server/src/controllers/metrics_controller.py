@@ -0,0 +1,35 @@
+"""
+This module is a controller for operational endpoints.
+It serves the metrics recorded for every request in the Prometheus text format.
+"""
+
+from flask import Blueprint, current_app
+from server.src.cache import user_cache
+from server.src.database import all_engines
+from server.src.metrics import checkin_buffer_lines, pool_lines
+
+metrics_controller = Blueprint("metrics_controller", __name__)
+
+
+@metrics_controller.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Get the request, SQL, cache, connection pool and check-in buffer metrics of this process.
+
+    :return: The metrics in the Prometheus text exposition format and a 200 HTTP status code.
+    """
+    cache_stats = user_cache().stats()
+    cache_lines = [
+        "# HELP dailies_user_cache_events_total User cache lookups and evictions.",
+        "# TYPE dailies_user_cache_events_total counter",
+        f'dailies_user_cache_events_total{{event="hit"}} {cache_stats["hits"]}',
+        f'dailies_user_cache_events_total{{event="miss"}} {cache_stats["misses"]}',
+        f'dailies_user_cache_events_total{{event="eviction"}} {cache_stats["evictions"]}',
+        "# HELP dailies_user_cache_entries Entries held by the user cache.",
+        "# TYPE dailies_user_cache_entries gauge",
+        f'dailies_user_cache_entries {cache_stats["size"]}',
+    ]
+    pool = pool_lines(all_engines(current_app))
+    checkins = checkin_buffer_lines(current_app.extensions.get("checkin_buffer"))
+    body = current_app.extensions["metrics"].render(cache_lines + pool + checkins)
+    return current_app.response_class(body, mimetype="text/plain; version=0.0.4"), 200
@@ -0,0 +1,62 @@
+"""
+This module is a controller for the per-user aggregates kept in the user_stats table.
+"""
+
+from flask import Blueprint, request
+from werkzeug.exceptions import BadRequest, NotFound
+from server.src.database import db, replica_reads
+from server.src.models.helpers import KeysetPaginator
+from server.src.models.models import User
+from server.src.models.serializers import json_response
+from server.src.stats import METRICS, UserStats
+
+stats_controller = Blueprint("stats_controller", __name__)
+
+
+@stats_controller.route("/user/<int:user_id>/stats", methods=["GET"])
+@replica_reads
+def get_user_stats(user_id):
+    """
+    Get the aggregates of a user.
+
+    :param user_id: The ID of the user.
+    :return: A JSON object with the user_id, habit_count, checkin_count and longest_streak
+             of the user and a 200 HTTP status code, or 404 if the user does not exist.
+    """
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        raise NotFound("User not found")
+    return json_response(stats.to_json())
+
+
+@stats_controller.route("/stats/leaderboard", methods=["GET"])
+@replica_reads
+def get_leaderboard():
+    """
+    Get the users ranking highest by a metric, habit_count by default, ties broken by the
+    most recent user first. The limit query parameter caps the number of users like a page
+    of GET /users.
+
+    :return: A JSON object with the metric and the users under "data", each as
+             {"rank", "user_id", "name", "value"}, and a 200 HTTP status code, or 400 if
+             the metric or limit is not valid.
+    """
+    metric = request.args.get("metric", "habit_count")
+    if metric not in METRICS:
+        raise BadRequest(f"metric must be one of {', '.join(METRICS)}")
+    limit = KeysetPaginator.parse_limit(request.args.get("limit"))
+
+    column = getattr(UserStats, metric)
+    rows = db.session.execute(
+        db.select(UserStats.user_id, User.username, column)
+        .join(User, User.id == UserStats.user_id)
+        .order_by(column.desc(), UserStats.user_id.desc())
+        .limit(limit)
+    )
+    return json_response({
+        "metric": metric,
+        "data": [
+            {"rank": rank, "user_id": user_id, "name": name, "value": value}
+            for rank, (user_id, name, value) in enumerate(rows, 1)
+        ],
+    })
@@ -3,35 +3,330 @@ This module is a controller for the user model and its associated habits.
 It handles the requests for creating, updating, and getting users and habits.
 """
 
-from flask import request, jsonify, Blueprint
-from werkzeug.exceptions import NotFound, BadRequest
-from server.src.models.models import User, Habit
-from server.src.database import db
+import json
+from datetime import timedelta
+from flask import current_app, request, Blueprint
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import NotFound, BadRequest, PreconditionFailed, ServiceUnavailable
+from server.src.models.models import User, Habit, USER_SERIALIZER, HABIT_SERIALIZER
+from server.src.models.helpers import (
+    KeysetPaginator, local_today, make_etag, parse_date, parse_ids, parse_include
+)
+from server.src.models.serializers import dumps, json_response
+from server.src.database import db, on_replica, replica_reads, stick_to_primary
+from server.src.cache import user_cache
+from server.src.idempotency import idempotent
+from server.src.today import today_snapshot
+from server.src.events import (
+    DEFAULT_HEARTBEAT_INTERVAL, DEFAULT_LONG_POLL_TIMEOUT, MAX_LONG_POLL_TIMEOUT, event_broker
+)
+from server.src.search import (
+    DEFAULT_SEARCH_LIMIT, MAX_QUERY_LENGTH, MIN_QUERY_LENGTH, habit_index
+)
 
 user_controller = Blueprint("user_controller", __name__)
 
+DEFAULT_HISTORY_DAYS = 30
+EVENT_STREAM = "text/event-stream"
+# milliseconds an EventSource waits before reconnecting
+EVENT_STREAM_RETRY = 3000
+MAX_HISTORY_DAYS = 5 * 366
+
 
 @user_controller.route("/user/<int:user_id>", methods=["GET"])
+@replica_reads
 def get_user(user_id):
     """
     Get a user by ID.
 
+    Query parameters:
+        include: Comma separated relationships to nest in the user, e.g. "habits".
+        fields: Comma separated user fields to return, e.g. "id,username".
+
+    The response carries a strong ETag. A request whose If-None-Match matches it gets an
+    empty 304 response instead of the body.
+
     :param user_id: The ID of the user to retrieve.
     :return: A JSON object of the user and a 200 HTTP status code if the user is found,
-             else 404.
+             304 if it is unchanged, else 404.
+    """
+    include = parse_include(request.args.get("include"), User.INCLUDES)
+    fields = USER_SERIALIZER.parse_fields(request.args.get("fields"))
+
+    cache = user_cache()
+    key = cache.key(user_id, include)
+    entry = cache.lookup(key)
+    if entry is None:
+        user = _load_user(user_id, include)
+        if user is None:
+            raise NotFound("User not found")
+        if cache.enabled and on_replica() and not _is_current(user, include):
+            # the replica has not caught up with the write that replaced the version token,
+            # and its stale row would be cached under the new token until it expires
+            stick_to_primary()
+            db.session.expire_all()
+            user = _load_user(user_id, include)
+            if user is None:
+                raise NotFound("User not found")
+        user_etag = user.etag(include)
+        etag = _representation_etag(user_etag, fields)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+        entry = {"etag": user_etag, "data": user.to_json(include)}
+        cache.store(key, entry)
+
+    etag = _representation_etag(entry["etag"], fields)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    user_data = entry["data"]
+    if fields is not None:
+        # fields selects user columns, the included relationships are kept as to_json does
+        user_data = {name: user_data[name] for name in (*fields, *sorted(include))}
+    response, status = json_response(user_data, 200)
+    response.set_etag(etag)
+    return response, status
+
+
+def _load_user(user_id, include):
+    if include:
+        return User.query.options(*User.load_options(include)).get(user_id)
+    return User.query.get(user_id)
+
+
+def _is_current(user, include):
+    """
+    Check a user read from a replica against the primary. Only the versions of its row, and
+    of its habits if they are included, are read from the primary.
+
+    :param user: The User loaded from the replica.
+    :param include: The relationships nested in the representation.
+    :return: True if the replica has every write of the user.
+    """
+    primary = {"bind": db.engine}
+    version = db.session.execute(
+        db.select(User.version).where(User.id == user.id), bind_arguments=primary
+    ).scalar()
+    if version != user.version:
+        return False
+    if "habits" not in include:
+        return True
+    habits = db.session.execute(
+        db.select(Habit.id, Habit.version).where(Habit.user_id == user.id),
+        bind_arguments=primary,
+    ).all()
+    return set(map(tuple, habits)) == {(habit.id, habit.version) for habit in user.habits}
+
+
+@user_controller.route("/user", methods=["GET"])
+@replica_reads
+def get_user_by_email():
+    """
+    Get a user by email address, served from the unique index on the email column.
+
+    Query parameters:
+        email: The email address of the user.
+        include: Comma separated relationships to nest in the user, e.g. "habits".
+        fields: Comma separated user fields to return, e.g. "id,username".
+
+    :return: A JSON object of the user and a 200 HTTP status code if the user is found,
+             304 if it is unchanged, 400 if email is missing, else 404.
     """
+    email = request.args.get("email")
+    if not email:
+        raise BadRequest("Missing query parameter: email")
+    include = parse_include(request.args.get("include"), User.INCLUDES)
+    fields = USER_SERIALIZER.parse_fields(request.args.get("fields"))
+
+    user = User.find_by_email(email, include)
+    if user is None:
+        raise NotFound("User not found")
+    etag = _representation_etag(user.etag(include), fields)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    response, status = json_response(user.to_json(include, fields), 200)
+    response.set_etag(etag)
+    return response, status
+
+
+def _representation_etag(etag, fields):
+    """
+    Get the ETag of one sparse fieldset of a resource.
+
+    :param etag: The ETag of the resource's full representation.
+    :param fields: The requested fields, or None for every field.
+    :return: The ETag value of the requested representation.
+    """
+    return make_etag(etag, ",".join(fields or ()))
+
+
+def _not_modified(etag):
+    """
+    Build an empty 304 response for a conditional GET.
+
+    :param etag: The ETag value of the unchanged representation.
+    :return: The response and a 304 HTTP status code.
+    """
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response, 304
+
+
+def _check_if_match(etag, resource_name):
+    """
+    Enforce the request's If-Match header, if it has one, against the current ETag.
+
+    :param etag: The ETag value of the resource as currently stored.
+    :param resource_name: The resource name used in the error message.
+    """
+    if request.if_match and not request.if_match.contains(etag):
+        raise PreconditionFailed(f"{resource_name} has been modified")
+
+
+@user_controller.route("/users", methods=["GET"])
+@replica_reads
+def list_users():
+    """
+    List users ordered by ID, one page at a time, or get the users with the given IDs.
+
+    Query parameters:
+        ids: Comma separated IDs of the users to get, at most MAX_MULTI_GET_IDS. Replaces
+             cursor and limit, and the users are fetched with a single IN query.
+        cursor: The next_cursor returned with the previous page, omit for the first page.
+        limit: The maximum number of users to return, capped at MAX_PAGE_LIMIT.
+        include: Comma separated relationships to nest in each user, e.g. "habits".
+        fields: Comma separated user fields to return, e.g. "id,username".
+
+    :return: A JSON object with the page of users and the next_cursor, which is null on the
+             last page, and a 200 HTTP status code, else 400 if a parameter is invalid.
+             With ids, the data holds one entry per requested ID, in the requested order,
+             null for IDs with no user, which are also listed in missing.
+    """
+    include = parse_include(request.args.get("include"), User.INCLUDES)
+    fields = USER_SERIALIZER.parse_fields(request.args.get("fields"))
+    if "ids" in request.args:
+        return _get_users(parse_ids(request.args["ids"]), include, fields)
+    users, next_cursor = KeysetPaginator.paginate(
+        User.query.options(*User.load_options(include)),
+        User.id,
+        request.args.get("cursor"),
+        request.args.get("limit"),
+    )
+    return json_response(
+        {"data": [user.to_json(include, fields) for user in users], "next_cursor": next_cursor},
+        200,
+    )
+
+
+def _get_users(user_ids, include, fields):
+    """
+    Build the multi-get response of list_users.
+
+    :param user_ids: The requested IDs, in order.
+    :param include: The relationships to nest in each user.
+    :param fields: The user fields to return, or None for every field.
+    :return: A JSON object with the users and the missing IDs, and a 200 HTTP status code.
+    """
+    users = User.find_many(user_ids, include)
+    data = {user_id: user.to_json(include, fields) for user_id, user in users.items()}
+    return json_response(
+        {
+            "data": [data.get(user_id) for user_id in user_ids],
+            "missing": [user_id for user_id in dict.fromkeys(user_ids) if user_id not in data],
+        },
+        200,
+    )
+
+
+@user_controller.route("/user/<int:user_id>/habits", methods=["GET"])
+@replica_reads
+def list_habits(user_id):
+    """
+    List a user's habits ordered by ID, one page at a time.
+
+    Query parameters:
+        cursor: The next_cursor returned with the previous page, omit for the first page.
+        limit: The maximum number of habits to return, capped at MAX_PAGE_LIMIT.
+        fields: Comma separated habit fields to return, e.g. "id,name".
+
+    :param user_id: The ID of the user who owns the habits.
+    :return: A JSON object with the page of habits and the next_cursor, which is null on the
+             last page, and a 200 HTTP status code, else 404 if the user is not found.
+    """
+    fields = HABIT_SERIALIZER.parse_fields(request.args.get("fields"))
     user = User.query.get(user_id)
     if user is None:
-        print("Testting")
         raise NotFound("User not found")
-    return jsonify(user.to_json()), 200
+    habits, next_cursor = KeysetPaginator.paginate(
+        Habit.query.filter(Habit.user_id == user_id),
+        Habit.id,
+        request.args.get("cursor"),
+        request.args.get("limit"),
+    )
+    return json_response(
+        {"data": [habit.to_json(fields) for habit in habits], "next_cursor": next_cursor}, 200
+    )
+
+
+def _search_args():
+    """
+    Parse the q and limit query parameters of a habit search.
+
+    :return: The query and the number of habits to return.
+    """
+    query = request.args.get("q", "").strip()
+    if not MIN_QUERY_LENGTH <= len(query) <= MAX_QUERY_LENGTH:
+        raise BadRequest(
+            f"q must be between {MIN_QUERY_LENGTH} and {MAX_QUERY_LENGTH} characters"
+        )
+    return query, KeysetPaginator.parse_limit(request.args.get("limit", str(DEFAULT_SEARCH_LIMIT)))
+
+
+@user_controller.route("/habits/search", methods=["GET"])
+@replica_reads
+def search_habits():
+    """
+    Search every habit by name, tolerating typos and incomplete words, e.g. to suggest
+    habits as a user types. See server.src.search for the matching and ranking.
+
+    Query parameters:
+        q: The text to search for, 3 to 80 characters.
+        limit: The maximum number of habits to return, 10 by default.
+
+    :return: A JSON object with the best matching habits under "data", best first, and a
+             200 HTTP status code, else 400 if q or limit is not valid.
+    """
+    query, limit = _search_args()
+    habits = habit_index().search(query, limit=limit)
+    return json_response({"data": [habit.to_json() for habit in habits]}, 200)
+
+
+@user_controller.route("/user/<int:user_id>/habits/search", methods=["GET"])
+@replica_reads
+def search_user_habits(user_id):
+    """
+    Search a user's habits by name, like GET /habits/search.
+
+    :param user_id: The ID of the user who owns the habits.
+    :return: A JSON object with the best matching habits under "data", best first, and a
+             200 HTTP status code, else 400 if q or limit is not valid, or 404 if the user
+             is not found.
+    """
+    query, limit = _search_args()
+    if User.query.get(user_id) is None:
+        raise NotFound("User not found")
+    habits = habit_index().search(query, user_id=user_id, limit=limit)
+    return json_response({"data": [habit.to_json() for habit in habits]}, 200)
 
 
 @user_controller.route("/user", methods=["POST"])
+@idempotent
 def create_user():
     """
     Create a new user.
 
+    A request with an Idempotency-Key header is only processed once. Repeats get the first
+    response back, with an Idempotent-Replayed: true header.
+
     :return: A JSON object of the created user and a 201 HTTP status code if the user
              is created successfully, else an error message and a 400 HTTP status code.
     """
@@ -40,9 +335,52 @@ def create_user():
         raise BadRequest("No user data provided")
 
     user = User.create(user_data)
-    db.session.commit()
+    User.commit()
+
+    return json_response(user.to_json(), 201)
+
+
+@user_controller.route("/users/bulk", methods=["POST"])
+def bulk_create_users():
+    """
+    Create many users, with their nested habits, in a single transaction.
 
-    return jsonify(user.to_json()), 201
+    Accepts either a JSON array of user objects or an NDJSON stream
+    (Content-Type: application/x-ndjson) with one user object per line.
+
+    :return: A JSON object with a result per submitted user, in submission order, and a 201
+             HTTP status code if every user was created, else a 207 HTTP status code.
+    """
+    if request.mimetype == "application/x-ndjson":
+        users_data = list(_read_ndjson(request.stream))
+    else:
+        users_data = request.get_json(silent=True)
+        if not isinstance(users_data, list):
+            raise BadRequest("User data must be a JSON array")
+    if not users_data:
+        raise BadRequest("No user data provided")
+
+    results = User.bulk_create(users_data)
+
+    status = 201 if all(result["status"] == 201 for result in results) else 207
+    return json_response({"results": results}, status)
+
+
+def _read_ndjson(stream):
+    """
+    Lazily parse an NDJSON stream, skipping blank lines.
+    Lines that are not valid JSON are yielded as None so they are reported as invalid rows.
+
+    :param stream: A binary file-like object to read lines from.
+    :return: A generator of parsed JSON values.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
 
 
 @user_controller.route("/user/<int:user_id>", methods=["PUT"])
@@ -50,9 +388,13 @@ def update_user(user_id):
     """
     Update a user by ID.
 
+    An If-Match header, with the ETag of GET /user/<id> without include or fields, makes the
+    update conditional on the user not having changed since it was read.
+
     :param user_id: The ID of the user to update.
     :return: A JSON object of the updated user and a 201 HTTP status code if the user is
-             updated successfully, else an error message and a 400 HTTP status code.
+             updated successfully, 412 if If-Match does not match, 409 if another request
+             updated the user concurrently, else an error message and a 400 HTTP status code.
     """
     user_data = request.get_json()
     if not user_data:
@@ -60,15 +402,52 @@ def update_user(user_id):
     user = User.query.get(user_id)
     if user is None:
         raise NotFound("User not found")
-    user.update(user_data)
+    _check_if_match(_representation_etag(user.etag(), None), "User")
+    version = user.version
+    # a rehashed password bumps the version without changing a field
+    if user.update(user_data) or user.version != version:
+        user_cache().invalidate(user_id)
 
-    return jsonify(user.to_json()), 201
+    response, status = json_response(user.to_json(), 201)
+    response.set_etag(_representation_etag(user.etag(), None))
+    return response, status
+
+
+@user_controller.route("/user/<int:user_id>", methods=["PATCH"])
+def patch_user(user_id):
+    """
+    Partially update a user by ID. Only the fields present in the body are considered, and
+    only those whose values differ from the stored ones are written. Honours If-Match like
+    PUT /user/<id>.
+
+    :param user_id: The ID of the user to update.
+    :return: A JSON object with the user under "data" and the names of the fields that
+             changed under "changed", and a 200 HTTP status code, else an error message and
+             a 400, 404, 409 or 412 HTTP status code.
+    """
+    user_data = request.get_json(silent=True)
+    if not isinstance(user_data, dict) or not user_data:
+        raise BadRequest("No user data provided")
+    user = User.query.get(user_id)
+    if user is None:
+        raise NotFound("User not found")
+    _check_if_match(_representation_etag(user.etag(), None), "User")
+    version = user.version
+    changed = user.patch(user_data)
+    # a rehashed password bumps the version without changing a field
+    if changed or user.version != version:
+        user_cache().invalidate(user_id)
+
+    response, status = json_response({"data": user.to_json(), "changed": changed}, 200)
+    response.set_etag(_representation_etag(user.etag(), None))
+    return response, status
 
 
 @user_controller.route("/user/<int:user_id>/habit", methods=["POST"])
+@idempotent
 def create_habit(user_id):
     """
-    Create a new habit for a user.
+    Create a new habit for a user. Honours Idempotency-Key like POST /user.
 
     :param user_id: The ID of the user to create the habit for.
     :return: A JSON object of the created habit and a 201 HTTP status code if the habit is
@@ -79,8 +458,11 @@ def create_habit(user_id):
         raise BadRequest("No habit data provided")
 
     habit = Habit.create(habit_data, user_id)
+    user_cache().invalidate(user_id)
 
-    return jsonify(habit.to_json()), 201
+    response, status = json_response(habit.to_json(), 201)
+    response.set_etag(habit.etag())
+    return response, status
 
 
 @user_controller.route("/user/<int:user_id>/habit/<int:habit_id>", methods=["PUT"])
@@ -91,7 +473,10 @@ def update_habit(user_id, habit_id):
     :param user_id: The ID of the user who owns the habit.
     :param habit_id: The ID of the habit to update.
     :return: A JSON object of the updated habit and a 201 HTTP status code if the
-             habit is updated successfully, else an error message and a 400 HTTP status code.
+             habit is updated successfully, 404 if the user or their habit is not found,
+             412 if an If-Match header does not match the habit's ETag, 409 if another
+             request updated the habit concurrently, else an error message and a 400 HTTP
+             status code.
     """
     habit_data = request.get_json()
     if not habit_data:
@@ -99,10 +484,332 @@ def update_habit(user_id, habit_id):
     user = User.query.get(user_id)
     if user is None:
         raise NotFound("User not found")
-    habit = Habit.query.get(habit_id)
+    habit = Habit.query.filter_by(id=habit_id, user_id=user_id).first()
+    if habit is None:
+        raise NotFound("Habit not found")
+    _check_if_match(habit.etag(), "Habit")
+
+    if habit.update(habit_data):
+        user_cache().invalidate(user_id)
+
+    response, status = json_response(habit.to_json(), 201)
+    response.set_etag(habit.etag())
+    return response, status
+
+
+@user_controller.route("/user/<int:user_id>/habit/<int:habit_id>", methods=["PATCH"])
+def patch_habit(user_id, habit_id):
+    """
+    Partially update a habit for a user. Only the fields present in the body are considered,
+    and only those whose values differ from the stored ones are written. Honours If-Match
+    like PUT /user/<id>/habit/<habit_id>.
+
+    :param user_id: The ID of the user who owns the habit.
+    :param habit_id: The ID of the habit to update.
+    :return: A JSON object with the habit under "data" and the names of the fields that
+             changed under "changed", and a 200 HTTP status code, else an error message and
+             a 400, 404, 409 or 412 HTTP status code.
+    """
+    habit_data = request.get_json(silent=True)
+    if not isinstance(habit_data, dict) or not habit_data:
+        raise BadRequest("No habit data provided")
+    habit = Habit.query.filter_by(id=habit_id, user_id=user_id).first()
+    if habit is None:
+        raise NotFound("Habit not found")
+    _check_if_match(habit.etag(), "Habit")
+
+    changed = habit.patch(habit_data)
+    if changed:
+        user_cache().invalidate(user_id)
+
+    response, status = json_response({"data": habit.to_json(), "changed": changed}, 200)
+    response.set_etag(habit.etag())
+    return response, status
+
+
+@user_controller.route("/user/<int:user_id>/habit/<int:habit_id>/checkin", methods=["POST"])
+def check_in_habit(user_id, habit_id):
+    """
+    Check a habit in for a day, updating its streaks.
+
+    Body (optional):
+        date: The day the habit was completed, in YYYY-MM-DD format, defaults to today in the
+              user's time zone. Past days may be backfilled, future days are refused beyond
+              tomorrow, a day of slack for clients whose clock is ahead.
+
+    With CHECKIN_WRITE_BEHIND set, the check-in is queued to be written with others in a
+    batch, and acknowledged without streaks as soon as it is queued.
+
+    :param user_id: The ID of the user who owns the habit.
+    :param habit_id: The ID of the habit to check in.
+    :return: A JSON object with the date checked in and the habit's streaks, and a 201 HTTP
+             status code if the day was recorded, 200 if it already was, 202 if it was queued,
+             else an error message and a 400, 404 or 409 HTTP status code, or 503 if the
+             queue stayed full.
+    """
+    checkin_data = request.get_json(silent=True)
+    if checkin_data is None:
+        checkin_data = {}
+    if not isinstance(checkin_data, dict):
+        raise BadRequest("Check-in data must be a JSON object")
+    day = None
+    if "date" in checkin_data:
+        day = parse_date(checkin_data["date"], "date")
+    habit = _owned_habit_with_user(user_id, habit_id)
+    today = local_today(habit.user.timezone)
+    if day is None:
+        day = today
+    elif day > today + timedelta(days=1):
+        raise BadRequest("date must not be in the future")
+
+    buffer = current_app.extensions.get("checkin_buffer")
+    if buffer is not None:
+        if not buffer.put(habit.id, day):
+            raise ServiceUnavailable(
+                "Too many check-ins are waiting to be written, retry later", retry_after=1
+            )
+        return json_response({"habit_id": habit.id, "date": day.isoformat()}, 202)
+
+    recorded = habit.check_in(day)
+    if recorded:
+        user_cache().invalidate(user_id)
+
+    return json_response(
+        {"habit_id": habit.id, "date": day.isoformat(), **habit.streaks(today)},
+        201 if recorded else 200,
+    )
+
+
+@user_controller.route("/user/<int:user_id>/habit/<int:habit_id>/history", methods=["GET"])
+@replica_reads
+def get_habit_history(user_id, habit_id):
+    """
+    Get the days a habit was checked in on, and its streaks.
+
+    Query parameters:
+        from: The first day of the range, in YYYY-MM-DD format, defaults to 29 days before to.
+        to: The last day of the range, included, defaults to today in the user's time zone.
+
+    :param user_id: The ID of the user who owns the habit.
+    :param habit_id: The ID of the habit.
+    :return: A JSON object with the range, the days checked in on within it and the habit's
+             streaks, and a 200 HTTP status code, else an error message and a 400 or 404
+             HTTP status code.
+    """
+    end = parse_date(request.args["to"], "to") if "to" in request.args else None
+    start = parse_date(request.args["from"], "from") if "from" in request.args else None
+    habit = _owned_habit_with_user(user_id, habit_id)
+    today = local_today(habit.user.timezone)
+    if end is None:
+        end = today
+    if start is None:
+        start = end - timedelta(days=DEFAULT_HISTORY_DAYS - 1)
+    if start > end:
+        raise BadRequest("from must not be after to")
+    if (end - start).days >= MAX_HISTORY_DAYS:
+        raise BadRequest(f"The range must not exceed {MAX_HISTORY_DAYS} days")
+
+    return json_response(
+        {
+            "habit_id": habit.id,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "days": [day.isoformat() for day in habit.history(start, end)],
+            **habit.streaks(today),
+        },
+        200,
+    )
+
+
+def _owned_habit_with_user(user_id, habit_id):
+    """
+    Load a habit of a user along with the user, in one query.
+
+    :return: The habit.
+    """
+    habit = (
+        Habit.query.options(joinedload(Habit.user)).filter_by(id=habit_id, user_id=user_id).first()
+    )
     if habit is None:
         raise NotFound("Habit not found")
+    return habit
+
 
-    habit.update(habit_data)
+@user_controller.route("/user/<int:user_id>/today", methods=["GET"])
+def get_today(user_id):
+    """
+    Get the user's habits for the current day in their time zone, with whether each was
+    checked in on it and its streaks. The view is served from a snapshot kept up to date
+    as habits change, see server.src.today.
+
+    The response carries a strong ETag. A request whose If-None-Match matches it gets an
+    empty 304 response instead of the body.
+
+    :param user_id: The ID of the user.
+    :return: A JSON object with user_id, date, timezone and habits, each habit with id,
+             name, done, current_streak and longest_streak, and a 200 HTTP status code,
+             304 if it is unchanged, else 404.
+    """
+    body, etag = today_snapshot(user_id)
+    if etag is not None and request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    response = current_app.response_class(body, mimetype="application/json")
+    if etag is not None:
+        response.set_etag(etag)
+    return response, 200
+
+
+@user_controller.route("/user/<int:user_id>/events", methods=["GET"])
+def get_user_events(user_id):
+    """
+    Follow the changes to a user and their habits: user.updated, habit.created and
+    habit.updated events, each with the changed user or habit as data, or a reset event when
+    the events missed since the given event ID are no longer known, after which the user
+    should be fetched again. See server.src.events.
+
+    With "Accept: text/event-stream" the events are streamed as Server-Sent Events, with a
+    comment every EVENTS_HEARTBEAT_INTERVAL seconds to keep the connection open. Otherwise
+    the request long polls, returning as soon as there are events.
+
+    Query parameters:
+        last_event_id: The ID of the last event received, to get the events after it
+                       first. The Last-Event-ID header, as sent by EventSource when it
+                       reconnects, takes precedence.
+        timeout: The number of seconds a long poll waits for events, at most
+                 MAX_LONG_POLL_TIMEOUT.
+
+    :param user_id: The ID of the user.
+    :return: A stream of events, or for a long poll a JSON object with the events, each
+             with id, event and data, and the last_event_id to send with the next poll, and
+             a 200 HTTP status code. 400 if timeout is invalid, 404 if the user is not found.
+    """
+    if User.query.get(user_id) is None:
+        raise NotFound("User not found")
+    # the connection is not needed while waiting for events
+    db.session.close()
+    last_event_id = request.headers.get("Last-Event-ID", request.args.get("last_event_id"))
+    broker = event_broker()
+
+    if request.accept_mimetypes.best_match(["application/json", EVENT_STREAM]) == EVENT_STREAM:
+        heartbeat = float(
+            current_app.config.get("EVENTS_HEARTBEAT_INTERVAL") or DEFAULT_HEARTBEAT_INTERVAL
+        )
+        subscription = broker.subscribe(user_id, last_event_id)
+
+        def stream():
+            try:
+                yield f"retry: {EVENT_STREAM_RETRY}\n\n"
+                while True:
+                    events = subscription.get(heartbeat)
+                    if not events:
+                        yield ": keep-alive\n\n"
+                    for published in events:
+                        yield (
+                            f"id: {broker.event_id(published.seq)}\n"
+                            f"event: {published.type}\n"
+                            f"data: {dumps(published.data).decode()}\n\n"
+                        )
+            finally:
+                subscription.close()
+
+        response = current_app.response_class(stream(), mimetype=EVENT_STREAM)
+        response.headers["Cache-Control"] = "no-cache"
+        # keeps proxies such as nginx from buffering the stream
+        response.headers["X-Accel-Buffering"] = "no"
+        return response, 200
+
+    timeout = _long_poll_timeout()
+    subscription = broker.subscribe(user_id, last_event_id)
+    try:
+        events = subscription.get(timeout)
+    finally:
+        subscription.close()
+    return json_response(
+        {
+            "data": [
+                {"id": broker.event_id(published.seq), "event": published.type,
+                 "data": published.data}
+                for published in events
+            ],
+            "last_event_id": broker.event_id(subscription.last_seq),
+        },
+        200,
+    )
+
+
+def _long_poll_timeout():
+    """
+    Parse the timeout of a long poll.
+
+    :return: The number of seconds to wait for events.
+    """
+    timeout = request.args.get("timeout")
+    if timeout is None:
+        return float(
+            current_app.config.get("EVENTS_LONG_POLL_TIMEOUT") or DEFAULT_LONG_POLL_TIMEOUT
+        )
+    try:
+        timeout = float(timeout)
+    except ValueError:
+        timeout = -1.0
+    if not 0 <= timeout <= MAX_LONG_POLL_TIMEOUT:
+        raise BadRequest(f"timeout must be between 0 and {MAX_LONG_POLL_TIMEOUT} seconds")
+    return timeout
+
+
+@user_controller.route("/user/<int:user_id>/habits/batch", methods=["POST"])
+def batch_create_habits(user_id):
+    """
+    Create many habits for a user with a single commit.
+
+    :param user_id: The ID of the user to create the habits for.
+    :return: A JSON object with a result per submitted habit, in submission order, and a 201
+             HTTP status code if every habit was created, else a 207 HTTP status code.
+             404 if the user is not found.
+    """
+    habits_data = _get_batch_data()
+    user = User.query.get(user_id)
+    if user is None:
+        raise NotFound("User not found")
 
-    return jsonify(habit.to_json()), 201
+    results = Habit.batch_create(habits_data, user)
+    user_cache().invalidate(user_id)
+
+    status = 201 if all(result["status"] == 201 for result in results) else 207
+    return json_response({"results": results}, status)
+
+
+@user_controller.route("/user/<int:user_id>/habits/batch", methods=["PATCH"])
+def batch_update_habits(user_id):
+    """
+    Update many habits for a user with a single commit. Each habit must include its id.
+
+    :param user_id: The ID of the user who owns the habits.
+    :return: A JSON object with a result per submitted habit, in submission order, and a 200
+             HTTP status code if every habit was updated, else a 207 HTTP status code.
+             404 if the user is not found.
+    """
+    habits_data = _get_batch_data()
+    user = User.query.get(user_id)
+    if user is None:
+        raise NotFound("User not found")
+
+    results = Habit.batch_update(habits_data, user)
+    user_cache().invalidate(user_id)
+
+    status = 200 if all(result["status"] == 200 for result in results) else 207
+    return json_response({"results": results}, status)
+
+
+def _get_batch_data():
+    """
+    Read a non-empty JSON array of habit objects from the request body.
+
+    :return: The list of habit payloads.
+    """
+    habits_data = request.get_json(silent=True)
+    if not isinstance(habits_data, list):
+        raise BadRequest("Habit data must be a JSON array")
+    if not habits_data:
+        raise BadRequest("No habit data provided")
+    return habits_data
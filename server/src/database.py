@@ -1,7 +1,258 @@
 """
 This module initializes the database for the server.
+
+Connection pooling is configured from the environment with engine_options, and pools created
+that way record how long requests wait for a connection, which /metrics exposes along with
+the number of connections in use.
+
+With DATABASE_REPLICA_URIS set, views decorated with replica_reads query a read replica,
+picked round robin once per request. Everything else uses the primary, and so does the rest
+of a request once it has flushed a write, or when it sends the STICK_TO_PRIMARY_HEADER.
 """
 
+import atexit
+import functools
+import itertools
+import threading
+import time
+import weakref
+from flask import current_app, g, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import QueuePool
+from server.src.histogram import Histogram
+
+STICK_TO_PRIMARY_HEADER = "X-Stick-To-Primary"
+
+
+class RoutingSession(Session):  # pylint: disable=too-few-public-methods
+    """
+    Session sending the reads of replica_reads views to a replica engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing:
+            replica = _request_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records the time spent checking out a connection, including waiting for
+    one to be returned when the pool and its overflow are exhausted, and the number of
+    checkouts that timed out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkout_wait = Histogram(POOL_WAIT_BUCKETS)
+        self.checkout_timeouts = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.checkout_wait.observe(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps in a recreated pool, keep the counters across it
+        pool = super().recreate()
+        pool.checkout_wait = self.checkout_wait
+        pool.checkout_timeouts = self.checkout_timeouts
+        return pool
+
+    def stats(self):
+        """
+        Get a snapshot of the pool.
+
+        :return: A dict with the configured size, the connections checked out, idle and in
+                 overflow, the checkout timeouts and the cumulative (bound, count) buckets,
+                 sum and count of the checkout wait in seconds.
+        """
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "timeouts": self.checkout_timeouts,
+                "wait_buckets": self.checkout_wait.cumulative_counts(),
+                "wait_sum": self.checkout_wait.sum,
+                "wait_count": self.checkout_wait.count,
+            }
+
+
+def engine_options(environ, database_uri):
+    """
+    Build the SQLAlchemy engine options from environment variables:
+    DB_POOL_SIZE (default 10), DB_MAX_OVERFLOW (20), DB_POOL_TIMEOUT in seconds (10),
+    DB_POOL_RECYCLE in seconds (1800), DB_POOL_PRE_PING (true) and DB_CONNECT_TIMEOUT in
+    seconds (unset, the driver's default).
+
+    :param environ: The environment, e.g. os.environ.
+    :param database_uri: The database URI. SQLite keeps Flask-SQLAlchemy's default pool.
+    :return: A dict for SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    if not database_uri or database_uri.startswith("sqlite"):
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(environ.get("DB_POOL_SIZE", "10")),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", "10")),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+    connect_timeout = environ.get("DB_CONNECT_TIMEOUT")
+    if connect_timeout:
+        options["connect_args"] = {"connect_timeout": int(connect_timeout)}
+    return options
+
+
+class ReplicaRouter:
+    """
+    Thread safe round robin over the engines of the read replicas.
+    """
+
+    def __init__(self, engines):
+        """
+        :param engines: A dict mapping replica names to their engines.
+        """
+        self.engines = engines
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(engines.values())
+
+    def next_engine(self):
+        """
+        Get the replica to use next.
+
+        :return: An engine.
+        """
+        with self._lock:
+            return next(self._cycle)
+
+    def dispose(self):
+        """
+        Close every pooled connection of the replicas.
+        """
+        for engine in self.engines.values():
+            engine.dispose()
+
+
+def _request_replica():
+    if not has_request_context() or not g.get("db_replica_reads") or "db_primary" in g:
+        return None
+    if request.headers.get(STICK_TO_PRIMARY_HEADER, "").lower() in ("1", "true"):
+        return None
+    router = current_app.extensions.get("db_replicas")
+    if router is None:
+        return None
+    if "db_replica" not in g:
+        g.db_replica = router.next_engine()
+    return g.db_replica
+
+
+def on_replica():
+    """
+    Check whether the queries of the current request run on a read replica.
+
+    :return: True if they go to a replica.
+    """
+    return _request_replica() is not None
+
+
+def stick_to_primary():
+    """
+    Send every further query of the current request to the primary.
+    """
+    if has_request_context():
+        g.db_primary = True
+
+
+def replica_reads(view):
+    """
+    Decorate a read only view so its queries run on a read replica, if any are configured.
+
+    :param view: The view function.
+    :return: The decorated view.
+    """
+
+    @functools.wraps(view)
+    def decorated(*args, **kwargs):
+        g.db_replica_reads = True
+        return view(*args, **kwargs)
+
+    return decorated
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):  # pylint: disable=unused-argument
+    # read your own writes: replicas may not have them yet
+    stick_to_primary()
+
+
+def all_engines(app):
+    """
+    Get the engines of the app, including its read replicas.
+
+    :param app: The Flask app, in an app context.
+    :return: A dict mapping bind keys, or replica names, to engines.
+    """
+    router = app.extensions.get("db_replicas")
+    return {**db.engines, **(router.engines if router is not None else {})}
+
+
+def dispose_engines(app):
+    """
+    Close every pooled connection of the app's engines.
+
+    :param app: The Flask app.
+    """
+    with app.app_context():
+        for engine in all_engines(app).values():
+            engine.dispose()
+
+
+def _dispose_on_exit(app_ref):
+    app = app_ref()
+    if app is not None:
+        dispose_engines(app)
+
+
+def init_db(app):
+    """
+    Initialize db with the app, and close its pooled connections when the process exits so
+    the database server isn't left with connections it has to time out.
+
+    DATABASE_REPLICA_URIS, a comma separated list of database URIs, adds an engine per read
+    replica named replica_0, replica_1 and so on, using the primary's engine options.
 
-db = SQLAlchemy()
+    :param app: The Flask app.
+    """
+    replica_uris = [
+        uri.strip() for uri in (app.config.get("DATABASE_REPLICA_URIS") or "").split(",")
+        if uri.strip()
+    ]
+    if replica_uris:
+        options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+        app.extensions["db_replicas"] = ReplicaRouter({
+            f"replica_{index}": create_engine(uri, **options)
+            for index, uri in enumerate(replica_uris)
+        })
+    db.init_app(app)
+    atexit.register(_dispose_on_exit, weakref.ref(app))
@@ -0,0 +1,292 @@
+"""
+This module publishes the changes made to users and their habits, for GET /user/<id>/events.
+
+Every commit that updates a user, or creates or updates a habit, publishes one event per
+changed row to an in-process EventBroker once it has committed, so rolled back changes are
+never seen. Only changes to fields served by GET /user/<id> count, so check-ins, which only
+move the streaks of a habit, publish nothing.
+
+The broker keeps the last EVENTS_LOG_SIZE events of each user, for the
+EVENTS_LOG_USERS users with the most recent events, so a client reconnecting with the
+ID of the last event it received gets the events it missed. Event IDs are "<epoch>-<seq>",
+the epoch changing with each broker, so an ID from before a restart is recognized. When the
+missed events are no longer in the log, or the ID is from another epoch, the client gets a
+single "reset" event instead and should fetch the user again.
+
+Each subscriber has a queue of at most EVENTS_BUFFER_SIZE events. A subscriber too slow to
+keep up does not hold up publishing: the events that do not fit are left out of its queue,
+and read back from the log once it catches up.
+
+The broker lives in one process, so with several server processes a client only sees the
+changes committed by the process it is connected to.
+"""
+
+import collections
+import itertools
+import secrets
+import threading
+from typing import NamedTuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from server.src.database import RoutingSession
+from server.src.models.models import HABIT_SERIALIZER, USER_SERIALIZER, Habit, User
+
+DEFAULT_BUFFER_SIZE = 100
+DEFAULT_LOG_SIZE = 100
+DEFAULT_LOG_USERS = 10000
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+DEFAULT_LONG_POLL_TIMEOUT = 25.0
+MAX_LONG_POLL_TIMEOUT = 60
+RESET = "reset"
+# session.info key of the events flushed in the current transaction
+_EVENTS = "pending_events"
+
+
+class Event(NamedTuple):
+    """
+    One change to a user or one of their habits.
+    """
+
+    seq: int
+    user_id: int
+    type: str
+    data: dict
+
+
+class _UserLog:  # pylint: disable=too-few-public-methods
+    __slots__ = ("events", "dropped_seq")
+
+    def __init__(self, size, dropped_seq):
+        self.events = collections.deque(maxlen=size)
+        # events up to this sequence number may have been dropped from the log
+        self.dropped_seq = dropped_seq
+
+
+class Subscription:
+    """
+    The queue of events of one user for one client, filled by EventBroker.publish.
+    """
+
+    def __init__(self, broker, user_id, last_seq, buffer_size):
+        """
+        :param broker: The EventBroker.
+        :param user_id: The ID of the user whose events to receive.
+        :param last_seq: The sequence number of the last event the client has.
+        :param buffer_size: The number of events the queue holds.
+        """
+        self.broker = broker
+        self.user_id = user_id
+        self.last_seq = last_seq
+        self.buffer_size = buffer_size
+        self.queue = collections.deque()
+        self.overflowed = False
+        self.ready = threading.Condition(broker.lock)
+
+    def get(self, timeout):
+        """
+        Wait for events published since the last ones taken.
+
+        :param timeout: The number of seconds to wait for an event.
+        :return: The list of events, empty if none came before the timeout, or a single
+                 reset event if the missed events are no longer in the log.
+        """
+        with self.broker.lock:
+            if not self.queue and not self.overflowed:
+                self.ready.wait(timeout)
+            if self.overflowed:
+                # the events that did not fit in the queue are read back from the log
+                self.overflowed = False
+                after = self.queue[-1].seq if self.queue else self.last_seq
+                self.queue.extend(self.broker.since(self.user_id, after))
+            events = list(self.queue)
+            self.queue.clear()
+            if events:
+                self.last_seq = events[-1].seq
+            return events
+
+    def close(self):
+        """
+        Stop receiving events.
+        """
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps the recent events of each user and hands new ones to their subscribers.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, log_size=DEFAULT_LOG_SIZE,
+                 log_users=DEFAULT_LOG_USERS):
+        """
+        :param buffer_size: The number of events queued per subscriber.
+        :param log_size: The number of events kept per user for resuming.
+        :param log_users: The number of users whose events are kept, the most recently
+                          changed ones.
+        """
+        self.buffer_size = buffer_size
+        self.log_size = log_size
+        self.log_users = log_users
+        self.epoch = secrets.token_hex(4)
+        self.lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._logs = collections.OrderedDict()
+        # the last event of any user whose log was evicted
+        self._evicted_seq = 0
+        self._subscriptions = collections.defaultdict(set)
+
+    def event_id(self, seq):
+        """
+        Format the ID of an event, as sent to clients.
+
+        :param seq: The sequence number of the event.
+        :return: The "<epoch>-<seq>" ID.
+        """
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, event_id):
+        """
+        Get the sequence number of an event ID sent back by a client.
+
+        :param event_id: The event ID.
+        :return: The sequence number, or None if the ID is not from this broker.
+        """
+        epoch, _, seq = (event_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._last_seq:
+            return None
+        return int(seq)
+
+    def publish(self, events):
+        """
+        Log events and queue them for the subscribers of their users.
+
+        :param events: (user_id, type, data) tuples, in the order they happened.
+        """
+        with self.lock:
+            for user_id, event_type, data in events:
+                published = Event(next(self._seq), user_id, event_type, data)
+                self._last_seq = published.seq
+                self._log(user_id).events.append(published)
+                for subscription in self._subscriptions.get(user_id, ()):
+                    if len(subscription.queue) < subscription.buffer_size:
+                        subscription.queue.append(published)
+                    else:
+                        subscription.overflowed = True
+                    subscription.ready.notify()
+
+    def _log(self, user_id):
+        log = self._logs.get(user_id)
+        if log is None:
+            log = self._logs[user_id] = _UserLog(self.log_size, self._evicted_seq)
+            if len(self._logs) > self.log_users:
+                _, evicted = self._logs.popitem(last=False)
+                if evicted.events:
+                    self._evicted_seq = max(self._evicted_seq, evicted.events[-1].seq)
+        else:
+            self._logs.move_to_end(user_id)
+        if len(log.events) == log.events.maxlen:
+            log.dropped_seq = log.events[0].seq
+        return log
+
+    def since(self, user_id, last_seq):
+        """
+        Get the logged events of a user after a sequence number. Must hold the lock.
+
+        :param user_id: The ID of the user.
+        :param last_seq: The sequence number of the last event the client has, or None if
+                         it is unknown.
+        :return: The events, or a single reset event if some of them may have been
+                 dropped from the log.
+        """
+        log = self._logs.get(user_id)
+        dropped_seq = log.dropped_seq if log else self._evicted_seq
+        if last_seq is None or last_seq < dropped_seq:
+            return [Event(self._last_seq, user_id, RESET, {})]
+        return [logged for logged in (log.events if log else ()) if logged.seq > last_seq]
+
+    def subscribe(self, user_id, last_event_id=None):
+        """
+        Start receiving the events of a user.
+
+        :param user_id: The ID of the user.
+        :param last_event_id: The ID of the last event the client received, to get the
+                              logged events after it first, or None to start from now.
+        :return: The Subscription, with the events to replay already queued.
+        """
+        with self.lock:
+            subscription = Subscription(self, user_id, self._last_seq, self.buffer_size)
+            if last_event_id is not None:
+                subscription.queue.extend(self.since(user_id, self.parse_event_id(last_event_id)))
+            self._subscriptions[user_id].add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop queuing events for a subscription.
+
+        :param subscription: The Subscription.
+        """
+        with self.lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+
+def event_broker():
+    """
+    Get the EventBroker of the current app.
+
+    :return: The EventBroker.
+    """
+    return current_app.extensions["events"]
+
+
+def _changed(obj, serializer):
+    attrs = inspect(obj).attrs
+    return any(attrs[field].history.has_changes() for field in serializer.fields)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_events(session, flush_context):  # pylint: disable=unused-argument
+    events = session.info.setdefault(_EVENTS, [])
+    # nobody follows users created in this transaction yet
+    new_users = {obj.id for obj in session.new if isinstance(obj, User)}
+    for obj in session.new:
+        if isinstance(obj, Habit) and obj.user_id not in new_users:
+            events.append((obj.user_id, "habit.created", obj.to_json()))
+    for obj in session.dirty:
+        if isinstance(obj, User) and _changed(obj, USER_SERIALIZER):
+            events.append((obj.id, "user.updated", obj.to_json()))
+        elif isinstance(obj, Habit) and _changed(obj, HABIT_SERIALIZER):
+            events.append((obj.user_id, "habit.updated", obj.to_json()))
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    events = session.info.pop(_EVENTS, None)
+    if events and has_app_context():
+        broker = current_app.extensions.get("events")
+        if broker is not None:
+            broker.publish(events)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_EVENTS, None)
+
+
+def init_events(app):
+    """
+    Attach an EventBroker to the app, configured with EVENTS_BUFFER_SIZE, EVENTS_LOG_SIZE
+    and EVENTS_LOG_USERS.
+
+    :param app: The Flask app.
+    """
+    app.extensions["events"] = EventBroker(
+        buffer_size=int(app.config.get("EVENTS_BUFFER_SIZE") or DEFAULT_BUFFER_SIZE),
+        log_size=int(app.config.get("EVENTS_LOG_SIZE") or DEFAULT_LOG_SIZE),
+        log_users=int(app.config.get("EVENTS_LOG_USERS") or DEFAULT_LOG_USERS),
+    )
@@ -3,7 +3,10 @@ This module provides an error handler for handling common exceptions in a Flask
 """
 
 from flask import jsonify
-from werkzeug.exceptions import NotFound, BadRequest
+from werkzeug.exceptions import (
+    NotFound, BadRequest, Conflict, PreconditionFailed, UnprocessableEntity, ServiceUnavailable,
+    UnsupportedMediaType, Forbidden,
+)
 
 
 def handle_not_found_error(error):
@@ -30,7 +33,87 @@ def handle_bad_request_error(error):
     return response
 
 
+def handle_conflict_error(error):
+    """
+    Handle a conflict error.
+
+    :param error: The exception that was raised.
+    :return: A JSON object with an error message and a 409 HTTP status code.
+    """
+    response = jsonify({"error": str(error.description)})
+    response.status_code = Conflict.code
+    return response
+
+
+def handle_precondition_failed_error(error):
+    """
+    Handle a precondition failed error.
+
+    :param error: The exception that was raised.
+    :return: A JSON object with an error message and a 412 HTTP status code.
+    """
+    response = jsonify({"error": str(error.description)})
+    response.status_code = PreconditionFailed.code
+    return response
+
+
+def handle_unprocessable_entity_error(error):
+    """
+    Handle an unprocessable entity error.
+
+    :param error: The exception that was raised.
+    :return: A JSON object with an error message and a 422 HTTP status code.
+    """
+    response = jsonify({"error": str(error.description)})
+    response.status_code = UnprocessableEntity.code
+    return response
+
+
+def handle_service_unavailable_error(error):
+    """
+    Handle a service unavailable error, passing on its Retry-After header if it has one.
+
+    :param error: The exception that was raised.
+    :return: A JSON object with an error message and a 503 HTTP status code.
+    """
+    response = jsonify({"error": str(error.description)})
+    response.status_code = ServiceUnavailable.code
+    if error.retry_after is not None:
+        response.retry_after = error.retry_after
+    return response
+
+
+def handle_unsupported_media_type_error(error):
+    """
+    Handle an unsupported media type error.
+
+    :param error: The exception that was raised.
+    :return: A JSON object with an error message and a 415 HTTP status code.
+    """
+    response = jsonify({"error": str(error.description)})
+    response.status_code = UnsupportedMediaType.code
+    return response
+
+
+def handle_forbidden_error(error):
+    """
+    Handle a forbidden error.
+
+    :param error: The exception that was raised.
+    :return: A JSON object with an error message and a 403 HTTP status code.
+    """
+    response = jsonify({"error": str(error.description)})
+    response.status_code = Forbidden.code
+    return response
+
+
 ERROR_HANDLERS = {
     NotFound: handle_not_found_error,
     BadRequest: handle_bad_request_error,
+    Conflict: handle_conflict_error,
+    PreconditionFailed: handle_precondition_failed_error,
+    UnprocessableEntity: handle_unprocessable_entity_error,
+    ServiceUnavailable: handle_service_unavailable_error,
+    UnsupportedMediaType: handle_unsupported_media_type_error,
+    Forbidden: handle_forbidden_error,
 }
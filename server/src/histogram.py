@@ -0,0 +1,43 @@
+"""
+This module provides the histogram type shared by the request and connection pool metrics.
+"""
+
+from bisect import bisect_left
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed upper bounds, as exposed by Prometheus.
+    """
+
+    def __init__(self, buckets):
+        """
+        :param buckets: The sorted upper bounds of the buckets, +Inf is implied.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Record a value.
+
+        :param value: The observed value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        Get the number of observations at or below each bound, ending with +Inf.
+
+        :return: A list of (bound, count) tuples.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
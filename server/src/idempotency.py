@@ -0,0 +1,264 @@
+"""
+This module makes POST requests safe to retry with an Idempotency-Key header.
+
+The first request with a key claims it by inserting a pending row, whose primary key makes
+the claim atomic across threads and processes. Once the view returns, the status, body and
+ETag of its response are stored on the row, and repeats of the request get them back
+without running the view again. A repeat arriving while the first request is still running
+waits for it to finish. Completed rows expire after IDEMPOTENCY_TTL seconds and are deleted
+by a background sweeper every IDEMPOTENCY_SWEEP_INTERVAL seconds.
+
+A pending claim is only a lease of IDEMPOTENCY_LEASE seconds: if the process running the
+request dies before storing its response, a retry after the lease has expired claims the
+key again and runs the request, rather than getting 409 until the TTL is over.
+"""
+
+import functools
+import hashlib
+import logging
+import threading
+import time
+from flask import current_app, request
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import BadRequest, Conflict, UnprocessableEntity
+from server.src.database import db
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 86400
+DEFAULT_WAIT_TIMEOUT = 10.0
+# longer than any request should run, so a live request does not lose its claim
+DEFAULT_LEASE = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyRecord(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    The stored outcome of a request made with an Idempotency-Key.
+
+    Attributes:
+        key (str): The Idempotency-Key header of the request.
+        fingerprint (str): Hash of the method, path and body, to detect a key reused for a
+            different request.
+        status (int): The HTTP status code of the response, None while in flight.
+        body (bytes): The body of the response.
+        etag (str): The ETag header of the response, if any.
+        expires_at (float): Unix time after which the record is discarded.
+    """
+
+    __tablename__ = "idempotency_record"
+
+    key = db.Column(db.String(MAX_KEY_LENGTH), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    etag = db.Column(db.String(100), nullable=True)
+    expires_at = db.Column(db.Float, nullable=False, index=True)
+
+
+class IdempotencyStore:
+    """
+    Claims keys and stores responses in the idempotency_record table. Must be used within
+    an app context.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, wait_timeout=DEFAULT_WAIT_TIMEOUT, poll_interval=0.05,
+                 clock=time.time, lease=DEFAULT_LEASE):
+        """
+        :param ttl: The number of seconds the response of a key is remembered for.
+        :param wait_timeout: The number of seconds a repeat waits for the first request.
+        :param poll_interval: The number of seconds between checks while waiting.
+        :param clock: A function returning the current Unix time.
+        :param lease: The number of seconds a pending claim holds the key, after which a
+                      repeat may claim it again.
+        """
+        # pylint: disable=too-many-arguments
+        self.ttl = ttl
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.clock = clock
+
+    def claim(self, key, fingerprint):
+        """
+        Claim a key for a request, or get the response stored for it.
+
+        :param key: The Idempotency-Key.
+        :param fingerprint: The fingerprint of the request.
+        :return: None if the key was claimed and the request should run, else a tuple of
+                 the stored (status, body, etag).
+        :raises UnprocessableEntity: If the key was used for a different request.
+        :raises Conflict: If the request holding the key didn't finish in time.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            now = self.clock()
+            row = db.session.execute(
+                select(
+                    IdempotencyRecord.fingerprint,
+                    IdempotencyRecord.status,
+                    IdempotencyRecord.body,
+                    IdempotencyRecord.etag,
+                    IdempotencyRecord.expires_at,
+                ).where(IdempotencyRecord.key == key)
+            ).first()
+            if row is not None and row.expires_at <= now:
+                db.session.execute(
+                    delete(IdempotencyRecord).where(
+                        IdempotencyRecord.key == key, IdempotencyRecord.expires_at <= now
+                    )
+                )
+                db.session.commit()
+                row = None
+            if row is None:
+                db.session.add(
+                    IdempotencyRecord(
+                        key=key, fingerprint=fingerprint, expires_at=now + self.lease
+                    )
+                )
+                try:
+                    db.session.commit()
+                    return None
+                except IntegrityError:
+                    # another request claimed it first, look again
+                    db.session.rollback()
+                    continue
+            if row.fingerprint != fingerprint:
+                raise UnprocessableEntity(
+                    f"{IDEMPOTENCY_HEADER} was already used for a different request"
+                )
+            if row.status is not None:
+                return row.status, row.body, row.etag
+            if time.monotonic() >= deadline:
+                raise Conflict(f"A request with this {IDEMPOTENCY_HEADER} is still in progress")
+            db.session.rollback()
+            time.sleep(self.poll_interval)
+
+    def complete(self, key, status, body, etag=None):
+        """
+        Store the response of a claimed key, keeping it for the TTL. If the lease ran out and
+        a repeat completed first, its response is kept.
+
+        :param key: The Idempotency-Key.
+        :param status: The HTTP status code.
+        :param body: The response body as bytes.
+        :param etag: The ETag header, if any.
+        """
+        db.session.execute(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key, IdempotencyRecord.status.is_(None))
+            .values(status=status, body=body, etag=etag, expires_at=self.clock() + self.ttl)
+        )
+        db.session.commit()
+
+    def release(self, key):
+        """
+        Give up a claimed key, so the request can be retried.
+
+        :param key: The Idempotency-Key.
+        """
+        db.session.rollback()
+        db.session.execute(
+            delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == key, IdempotencyRecord.status.is_(None)
+            )
+        )
+        db.session.commit()
+
+    def sweep(self):
+        """
+        Delete the expired records.
+
+        :return: The number of records deleted.
+        """
+        result = db.session.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= self.clock())
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+def _fingerprint():
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def idempotent(view):
+    """
+    Decorate a view so requests carrying an Idempotency-Key run at most once, and repeats
+    get the first response back with an Idempotent-Replayed: true header. Responses with a
+    5xx status code, and errors raised by the view, are not stored so the request can be
+    retried.
+
+    :param view: The view function, returning a (response, status) tuple.
+    :return: The decorated view.
+    """
+
+    @functools.wraps(view)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise BadRequest(
+                f"{IDEMPOTENCY_HEADER} must be between 1 and {MAX_KEY_LENGTH} characters"
+            )
+        store = current_app.extensions["idempotency"]
+        stored = store.claim(key, _fingerprint())
+        if stored is not None:
+            status, body, etag = stored
+            response = current_app.response_class(body, mimetype="application/json")
+            if etag:
+                response.set_etag(etag)
+            response.headers[REPLAYED_HEADER] = "true"
+            return response, status
+
+        try:
+            response, status = view(*args, **kwargs)
+        except Exception:
+            store.release(key)
+            raise
+        if status >= 500:
+            store.release(key)
+        else:
+            store.complete(key, status, response.get_data(), response.get_etag()[0])
+        return response, status
+
+    return decorated
+
+
+def _sweep_forever(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                deleted = app.extensions["idempotency"].sweep()
+            if deleted:
+                logger.info("Deleted %d expired idempotency records", deleted)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Idempotency sweep failed")
+
+
+def init_idempotency(app):
+    """
+    Attach an IdempotencyStore to the app, configured with IDEMPOTENCY_TTL,
+    IDEMPOTENCY_WAIT_TIMEOUT and IDEMPOTENCY_LEASE, and start the sweeper thread if
+    IDEMPOTENCY_SWEEP_INTERVAL is set.
+
+    :param app: The Flask app.
+    """
+    app.extensions["idempotency"] = IdempotencyStore(
+        ttl=float(app.config.get("IDEMPOTENCY_TTL") or DEFAULT_TTL),
+        wait_timeout=float(app.config.get("IDEMPOTENCY_WAIT_TIMEOUT") or DEFAULT_WAIT_TIMEOUT),
+        lease=float(app.config.get("IDEMPOTENCY_LEASE") or DEFAULT_LEASE),
+    )
+    interval = float(app.config.get("IDEMPOTENCY_SWEEP_INTERVAL") or 0)
+    if interval > 0:
+        threading.Thread(
+            target=_sweep_forever, args=(app, interval), name="idempotency-sweeper", daemon=True
+        ).start()
@@ -0,0 +1,299 @@
+"""
+This module records per request metrics and renders them in the Prometheus text format.
+
+For every endpoint it tracks a latency histogram, the number of SQL statements issued, the
+time spent in the database and the size of the responses. SQL is counted with SQLAlchemy
+engine events, so it covers every query regardless of where it is issued from.
+"""
+
+import logging
+import threading
+import time
+from typing import NamedTuple
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from server.src.database import InstrumentedQueuePool, all_engines
+from server.src.histogram import Histogram
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestSample(NamedTuple):
+    """
+    Measurements of one finished request.
+    """
+
+    endpoint: str
+    method: str
+    status: int
+    seconds: float
+    sql_statements: int
+    db_seconds: float
+    size: int
+
+
+class EndpointStats:
+    """
+    Metrics of one endpoint and method.
+    """
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statuses = {}
+        self.sql_statements = 0
+        self.db_seconds = 0.0
+        self.response_bytes = 0
+
+    def observe(self, sample):
+        """
+        Add a finished request to the metrics.
+
+        :param sample: The RequestSample of the request.
+        """
+        self.latency.observe(sample.seconds)
+        self.statuses[sample.status] = self.statuses.get(sample.status, 0) + 1
+        self.sql_statements += sample.sql_statements
+        self.db_seconds += sample.db_seconds
+        self.response_bytes += sample.size
+
+    def samples(self, labels):
+        """
+        Get the exposition lines of these metrics, grouped by metric name.
+
+        :param labels: The label pairs identifying the endpoint, e.g. 'endpoint="x"'.
+        :return: A dict mapping metric names to lists of sample lines.
+        """
+        latency = []
+        for bound, count in self.latency.cumulative_counts():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            latency.append(f'dailies_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+        latency.append(f"dailies_request_duration_seconds_sum{{{labels}}} {self.latency.sum}")
+        latency.append(f"dailies_request_duration_seconds_count{{{labels}}} {self.latency.count}")
+        return {
+            "dailies_request_duration_seconds": latency,
+            "dailies_requests_total": [
+                f'dailies_requests_total{{{labels},status="{status}"}} {count}'
+                for status, count in sorted(self.statuses.items())
+            ],
+            "dailies_request_sql_statements_total": [
+                f"dailies_request_sql_statements_total{{{labels}}} {self.sql_statements}"
+            ],
+            "dailies_request_db_seconds_total": [
+                f"dailies_request_db_seconds_total{{{labels}}} {self.db_seconds}"
+            ],
+            "dailies_response_size_bytes_total": [
+                f"dailies_response_size_bytes_total{{{labels}}} {self.response_bytes}"
+            ],
+        }
+
+
+# name, type and help text of every metric, in exposition order
+METRICS = (
+    ("dailies_request_duration_seconds", "histogram", "Request latency by endpoint."),
+    ("dailies_requests_total", "counter", "Requests by endpoint and status."),
+    ("dailies_request_sql_statements_total", "counter", "SQL statements by endpoint."),
+    ("dailies_request_db_seconds_total", "counter", "Time spent in SQL by endpoint."),
+    ("dailies_response_size_bytes_total", "counter", "Response bytes by endpoint."),
+)
+
+
+class Metrics:
+    """
+    Thread safe registry of the metrics of every endpoint of an app.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, sample):
+        """
+        Record a finished request.
+
+        :param sample: The RequestSample of the request.
+        """
+        with self._lock:
+            stats = self._endpoints.get((sample.endpoint, sample.method))
+            if stats is None:
+                stats = self._endpoints[(sample.endpoint, sample.method)] = EndpointStats()
+            stats.observe(sample)
+
+    def render(self, extra_lines=()):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        :param extra_lines: Further lines of exposition text to append.
+        :return: The exposition text.
+        """
+        grouped = {name: [] for name, _, _ in METRICS}
+        with self._lock:
+            for (endpoint, method), stats in sorted(self._endpoints.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                for name, lines in stats.samples(labels).items():
+                    grouped[name].extend(lines)
+
+        lines = []
+        for name, kind, description in METRICS:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(grouped[name])
+        lines.extend(extra_lines)
+        return "\n".join(lines) + "\n"
+
+
+# name, type and help text of the connection pool metrics, in exposition order
+POOL_METRICS = (
+    ("dailies_db_pool_size", "gauge", "Configured connection pool size."),
+    ("dailies_db_pool_checked_out", "gauge", "Connections in use."),
+    ("dailies_db_pool_checked_in", "gauge", "Idle connections held by the pool."),
+    ("dailies_db_pool_overflow", "gauge", "Connections opened beyond the pool size."),
+    ("dailies_db_pool_checkout_timeouts_total", "counter", "Checkouts that timed out."),
+    ("dailies_db_pool_checkout_wait_seconds", "histogram", "Time to check out a connection."),
+)
+
+
+def pool_lines(engines):
+    """
+    Get the exposition lines of the connection pools of engines using InstrumentedQueuePool.
+
+    :param engines: A dict mapping bind keys to engines, as returned by all_engines.
+    :return: A list of exposition lines, empty if no pool is instrumented.
+    """
+    grouped = {name: [] for name, _, _ in POOL_METRICS}
+    for key, engine in engines.items():
+        if not isinstance(engine.pool, InstrumentedQueuePool):
+            continue
+        stats = engine.pool.stats()
+        labels = f'bind="{key or "default"}"'
+        for name, field in (
+            ("dailies_db_pool_size", "size"),
+            ("dailies_db_pool_checked_out", "checked_out"),
+            ("dailies_db_pool_checked_in", "checked_in"),
+            ("dailies_db_pool_overflow", "overflow"),
+            ("dailies_db_pool_checkout_timeouts_total", "timeouts"),
+        ):
+            grouped[name].append(f"{name}{{{labels}}} {stats[field]}")
+        name = "dailies_db_pool_checkout_wait_seconds"
+        for bound, count in stats["wait_buckets"]:
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            grouped[name].append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+        grouped[name].append(f"{name}_sum{{{labels}}} {stats['wait_sum']}")
+        grouped[name].append(f"{name}_count{{{labels}}} {stats['wait_count']}")
+
+    lines = []
+    for name, kind, description in POOL_METRICS:
+        if grouped[name]:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(grouped[name])
+    return lines
+
+
+def checkin_buffer_lines(buffer):
+    """
+    Get the exposition lines of the write-behind buffer of habit check-ins.
+
+    :param buffer: The CheckinBuffer of the app, or None if write-behind is disabled.
+    :return: A list of exposition lines, empty without a buffer.
+    """
+    if buffer is None:
+        return []
+    stats = buffer.stats()
+    name = "dailies_checkin_flush_seconds"
+    flush = []
+    for bound, count in stats["flush_buckets"]:
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        flush.append(f'{name}_bucket{{le="{le}"}} {count}')
+    flush.append(f"{name}_sum {stats['flush_sum']}")
+    flush.append(f"{name}_count {stats['flush_count']}")
+    return [
+        "# HELP dailies_checkin_queue_depth Check-ins waiting to be written.",
+        "# TYPE dailies_checkin_queue_depth gauge",
+        f"dailies_checkin_queue_depth {stats['depth']}",
+        "# HELP dailies_checkin_queue_capacity Check-ins that can wait before requests block.",
+        "# TYPE dailies_checkin_queue_capacity gauge",
+        f"dailies_checkin_queue_capacity {stats['capacity']}",
+        "# HELP dailies_checkin_events_total Check-ins queued, coalesced, rejected, written "
+        "and failed.",
+        "# TYPE dailies_checkin_events_total counter",
+        *(
+            f'dailies_checkin_events_total{{event="{event}"}} {count}'
+            for event, count in stats["events"].items()
+        ),
+        f"# HELP {name} Time to write a batch of check-ins.",
+        f"# TYPE {name} histogram",
+        *flush,
+    ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=too-many-arguments,unused-argument
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=too-many-arguments,unused-argument
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context() and "sql_statements" in g:
+        g.sql_statements.append((statement, elapsed))
+
+
+def _handle_error(exception_context):
+    # the statement failed so after_cursor_execute will not pop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.sql_statements = []
+
+
+def _after_request(response):
+    if "request_start" not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    statements = g.sql_statements
+    db_seconds = sum(elapsed for _, elapsed in statements)
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+    endpoint = request.endpoint or "unmatched"
+    current_app.extensions["metrics"].record(
+        RequestSample(
+            endpoint, request.method, response.status_code, seconds, len(statements), db_seconds,
+            size,
+        )
+    )
+
+    threshold = current_app.config.get("SLOW_REQUEST_THRESHOLD_MS")
+    if threshold is not None and seconds * 1000 >= float(threshold):
+        logger.warning(
+            "Slow request %s %s took %.1f ms with %d SQL statements (%.1f ms):\n%s",
+            request.method,
+            request.full_path,
+            seconds * 1000,
+            len(statements),
+            db_seconds * 1000,
+            "\n".join(f"  [{elapsed * 1000:.1f} ms] {sql}" for sql, elapsed in statements),
+        )
+    return response
+
+
+def init_metrics(app):
+    """
+    Start recording metrics for every request handled by the app and every SQL statement
+    issued on its database engines. Requests slower than SLOW_REQUEST_THRESHOLD_MS, if set,
+    are logged along with their SQL.
+
+    :param app: The Flask app, which must already be initialized with db.
+    """
+    app.extensions["metrics"] = Metrics()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    with app.app_context():
+        for engine in all_engines(app).values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,179 @@
+"""
+This module brings an existing database schema up to date with the models.
+
+Every migration runs once, in order, and is recorded in the schema_migrations table. Tables
+missing altogether are created from the models first, so on a new database the migrations
+find nothing left to do and are only recorded. Each migration therefore checks the current
+schema before changing it, which also makes it safe to run again after a failure: MySQL
+commits DDL statements immediately, so a failed upgrade can leave some changes applied
+without recording them.
+
+Run with:
+python -m server.src.migrations
+"""
+
+import os
+import time
+from dotenv import load_dotenv
+from sqlalchemy import (
+    Column, Float, Integer, MetaData, String, Table, create_engine, func, inspect, select, text
+)
+from server.src.backup import ImportCheckpoint
+from server.src.database import db
+from server.src.idempotency import IdempotencyRecord
+from server.src.models.models import Habit, HabitCheckin, User
+from server.src.search import install as install_habit_search
+from server.src.stats import UserStats, reconcile
+from server.src.today import TodaySnapshot
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", Float, nullable=False),
+)
+
+
+def _add_version_columns(connection):
+    inspector = inspect(connection)
+    for table in (User.__table__, Habit.__table__):
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        if "version" not in columns:
+            name = connection.dialect.identifier_preparer.quote(table.name)
+            connection.execute(
+                text(f"ALTER TABLE {name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            )
+
+
+def _create_idempotency_table(connection):
+    IdempotencyRecord.__table__.create(connection, checkfirst=True)
+
+
+def _add_lookup_indexes(connection):
+    duplicates = connection.execute(
+        select(User.email, func.count(User.id))  # pylint: disable=not-callable
+        .group_by(User.email)
+        .having(func.count(User.id) > 1)  # pylint: disable=not-callable
+        .limit(5)
+    ).all()
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add a unique index on user.email, these emails are used more than once: "
+            + ", ".join(f"{email} ({count})" for email, count in duplicates)
+        )
+    inspector = inspect(connection)
+    for table in (User.__table__, Habit.__table__):
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+
+def _add_checkins(connection):
+    HabitCheckin.__table__.create(connection, checkfirst=True)
+    columns = {column["name"] for column in inspect(connection).get_columns("habit")}
+    for column, definition in (
+        ("current_streak", "INTEGER NOT NULL DEFAULT 0"),
+        ("longest_streak", "INTEGER NOT NULL DEFAULT 0"),
+        ("last_checkin", "DATE"),
+    ):
+        if column not in columns:
+            connection.execute(text(f"ALTER TABLE habit ADD COLUMN {column} {definition}"))
+
+
+def _add_timezones(connection):
+    TodaySnapshot.__table__.create(connection, checkfirst=True)
+    if "timezone" not in {column["name"] for column in inspect(connection).get_columns("user")}:
+        name = connection.dialect.identifier_preparer.quote("user")
+        connection.execute(
+            text(f"ALTER TABLE {name} ADD COLUMN timezone VARCHAR(64) NOT NULL DEFAULT 'UTC'")
+        )
+
+
+def _create_import_checkpoints(connection):
+    ImportCheckpoint.__table__.create(connection, checkfirst=True)
+
+
+def _add_user_stats(connection):
+    UserStats.__table__.create(connection, checkfirst=True)
+    reconcile(connection)
+
+
+def _add_habit_search(connection):
+    install_habit_search(connection)
+
+
+# version, description and function of every migration, in the order they are applied
+MIGRATIONS = (
+    (1, "Add version columns to user and habit", _add_version_columns),
+    (2, "Create the idempotency_record table", _create_idempotency_table),
+    (3, "Add a unique index on user.email and an index on habit.user_id", _add_lookup_indexes),
+    (4, "Create the habit_checkin table and add streak columns to habit", _add_checkins),
+    (5, "Add a timezone column to user and create the today_snapshot table", _add_timezones),
+    (6, "Create the import_checkpoint table", _create_import_checkpoints),
+    (7, "Create the user_stats table and fill it from the habit tables", _add_user_stats),
+    (8, "Create the full-text index of habit names", _add_habit_search),
+)
+
+
+def pending(connection):
+    """
+    Get the migrations not yet applied to a database.
+
+    :param connection: The connection to inspect.
+    :return: The versions of the migrations not recorded in schema_migrations.
+    """
+    done = set()
+    if inspect(connection).has_table(schema_migrations.name):
+        done = set(connection.scalars(select(schema_migrations.c.version)))
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def upgrade(engine):
+    """
+    Create missing tables and apply the migrations not yet recorded in schema_migrations.
+
+    :param engine: The engine of the database to upgrade.
+    :return: The versions of the migrations applied by this call.
+    :raises RuntimeError: If a migration cannot be applied to the existing data.
+    """
+    applied = []
+    with engine.begin() as connection:
+        _metadata.create_all(connection)
+        # only creates missing tables, existing ones are left to the migrations below
+        db.metadata.create_all(connection)
+        done = set(connection.scalars(select(schema_migrations.c.version)))
+        for version, description, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            migrate(connection)
+            connection.execute(
+                schema_migrations.insert(),
+                {"version": version, "description": description, "applied_at": time.time()},
+            )
+            applied.append(version)
+    return applied
+
+
+def main():
+    """
+    Upgrade the database configured by DATABASE_URI.
+    """
+    load_dotenv()
+    engine = create_engine(os.environ["DATABASE_URI"])
+    try:
+        applied = upgrade(engine)
+    finally:
+        engine.dispose()
+    if applied:
+        for version, description, _ in MIGRATIONS:
+            if version in applied:
+                print(f"Applied {version}: {description}")
+    else:
+        print("The database is up to date")
+
+
+if __name__ == "__main__":
+    main()
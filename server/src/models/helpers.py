@@ -2,57 +2,470 @@
 Module for helper classes and functions.
 """
 
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date, datetime, timezone
+from typing import Callable, NamedTuple, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from werkzeug.exceptions import BadRequest
 
-class DataValidator:
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+# IDs one multi-get request may ask for
+MAX_MULTI_GET_IDS = 100
+# one bit per day of a year, leap years included
+YEAR_BITMAP_BYTES = 46
+
+
+class Field(NamedTuple):
     """
-    Class for validating data.
+    Describes one field of a request payload.
+
+    Attributes:
+        kind (type): The expected JSON type, one of str, int or list.
+        required (bool): Whether the field must be present.
+        max_length (int): The maximum length of a str field, matching its column size.
+        schema (Schema): The schema of each item of a list field.
+        check (callable): For a str field, a function returning the error of an invalid
+                          value, e.g. "must be ...", or None if the value is valid.
+    """
+
+    kind: type
+    required: bool = False
+    max_length: Optional[int] = None
+    schema: Optional["Schema"] = None
+    check: Optional[Callable[[str], Optional[str]]] = None
+
+
+class Schema:
+    """
+    Class for validating request payloads against a declarative description of their fields.
+
+    The field descriptions are compiled once, when the schema is built, into a tuple of
+    mandatory names, a set of allowed names and one check function per field, so validating a
+    payload is a single pass over its keys that collects every error rather than stopping at
+    the first.
     """
 
-    # TODO don't need multiple methods for these, just pass in mandatory fields
-    # and data then check data has all mandatory fields
+    def __init__(self, name, fields):
+        """
+        Compiles the schema.
+
+        Args:
+            name (str): The name of the payload used in error messages, e.g. "User".
+            fields (dict): Maps field names to their Field description.
+        """
+        self.name = name
+        self.fields = fields
+        self._mandatory = tuple(field for field, spec in fields.items() if spec.required)
+        self._checks = {field: self._compile(field, spec) for field, spec in fields.items()}
+
     @staticmethod
-    def validate_user_data(user_data):
+    def _compile(field, spec):
         """
-        Validates the user data.
+        Builds the function that checks a single value of a field, appending any errors for
+        the value to a list. Errors are prefixed with path, the location of the payload being
+        validated.
+        """
+        if spec.kind is str:
+            max_length = spec.max_length
+            check_value = spec.check
+
+            def check_str(value, path, errors):
+                if not isinstance(value, str):
+                    errors.append(f"{path}{field} must be a string")
+                elif max_length is not None and len(value) > max_length:
+                    errors.append(f"{path}{field} must be at most {max_length} characters")
+                elif check_value is not None:
+                    error = check_value(value)
+                    if error is not None:
+                        errors.append(f"{path}{field} {error}")
+
+            return check_str
+
+        if spec.kind is int:
+
+            def check_int(value, path, errors):
+                if not isinstance(value, int) or isinstance(value, bool):
+                    errors.append(f"{path}{field} must be an integer")
+
+            return check_int
+
+        if spec.kind is list:
+            item_schema = spec.schema
+
+            def check_list(value, path, errors):
+                if not isinstance(value, list):
+                    errors.append(f"{path}{field} must be a list")
+                    return
+                for index, item in enumerate(value):
+                    item_schema.collect_errors(item, f"{path}{field}[{index}]", errors)
+
+            return check_list
+
+        raise ValueError(f"Unsupported field type {spec.kind!r} for {field}")
+
+    def collect_errors(self, data, path, errors, partial=False):
+        """
+        Validates data, appending every error found to errors.
 
         Args:
-            user_data (dict): The user data to be validated.
+            data: The payload to validate.
+            path (str): The location of the payload, e.g. "habits[0]", or "" at the top level.
+            errors (list): The list to append error messages to.
+            partial (bool): Whether mandatory fields may be omitted, as in a PATCH.
+        """
+        if not isinstance(data, dict):
+            errors.append(f"{path or self.name + ' data'} must be a JSON object")
+            return
+        prefix = f"{path}." if path else ""
+
+        missing = () if partial else [
+            prefix + field for field in self._mandatory if field not in data
+        ]
+        if missing:
+            errors.append(f"Missing mandatory fields: {', '.join(missing)}")
+
+        checks = self._checks
+        unknown = []
+        for field, value in data.items():
+            check = checks.get(field)
+            if check is None:
+                unknown.append(prefix + field)
+            else:
+                check(value, prefix, errors)
+        if unknown:
+            errors.append(f"Unknown fields: {', '.join(unknown)}")
+
+    def errors(self, data, partial=False):
+        """
+        Validates data.
+
+        Args:
+            data: The payload to validate.
+            partial (bool): Whether mandatory fields may be omitted, as in a PATCH.
 
         Returns:
-            tuple: A tuple containing a boolean value indicating whether the validation passed or
-                    not, and an error message if validation failed, error message contains a list
-                    of all missing mandatory fields.
+            str: Every validation error joined into one message, or None if data is valid.
+        """
+        errors = []
+        self.collect_errors(data, "", errors, partial)
+        return "; ".join(errors) if errors else None
+
+    def validate(self, data, partial=False):
         """
-        mandatory_fields = ["name", "email", "password"]
-        missing_fields = []
+        Validates data, raising if it is not valid.
 
-        for field in mandatory_fields:
-            if field not in user_data:
-                missing_fields.append(field)
+        Args:
+            data: The payload to validate.
+            partial (bool): Whether mandatory fields may be omitted, as in a PATCH.
+
+        Raises:
+            BadRequest: With every validation error if data is not valid.
+        """
+        error = self.errors(data, partial)
+        if error is not None:
+            raise BadRequest(error)
+
+
+HABIT_SCHEMA = Schema(
+    "Habit",
+    {
+        "id": Field(int),
+        "name": Field(str, required=True, max_length=80),
+        "user_id": Field(int),
+    },
+)
+
+
+def timezone_error(name):
+    """
+    Checks that a time zone name is known to the IANA time zone database.
+
+    Args:
+        name (str): The time zone name, e.g. "Europe/Paris".
 
-        if len(missing_fields) > 0:
-            return False, f"Missing mandatory fields: {', '.join(missing_fields)}"
-        return True, None
+    Returns:
+        str: The error if the time zone is unknown, else None.
+    """
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return "must be an IANA time zone, e.g. Europe/Paris"
+    return None
+
+
+USER_SCHEMA = Schema(
+    "User",
+    {
+        "id": Field(int),
+        "name": Field(str, required=True, max_length=80),
+        "email": Field(str, required=True, max_length=100),
+        "password": Field(str, required=True, max_length=120),
+        "timezone": Field(str, max_length=64, check=timezone_error),
+        "habits": Field(list, schema=HABIT_SCHEMA),
+    },
+)
+
+
+class KeysetPaginator:
+    """
+    Class for paginating queries by their integer primary key.
+
+    Pages are selected with "WHERE id > :last_id ORDER BY id LIMIT :limit" rather than an
+    OFFSET, so every page is a primary key range scan and deep pages cost the same as the
+    first. The position is handed to clients as an opaque cursor.
+    """
 
     @staticmethod
-    def validate_habit_data(habit_data):
+    def encode_cursor(last_id):
         """
-        Validates the habit data.
+        Encodes the id of the last item on a page into an opaque cursor.
 
         Args:
-            habit_data (dict): The habit data to be validated.
+            last_id (int): The id of the last item returned.
 
         Returns:
-            tuple: A tuple containing a boolean value indicating whether the validation passed or
-                    not, and an error message with missing mandatory fields.
+            str: A URL safe cursor string.
         """
-        mandatory_fields = ["name"]
-        missing_fields = []
+        raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-        for field in mandatory_fields:
-            if field not in habit_data:
-                missing_fields.append(field)
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decodes a cursor produced by encode_cursor.
+
+        Args:
+            cursor (str): The cursor string, or None for the first page.
 
-        if len(missing_fields) > 0:
-            return False, f"Missing mandatory fields: {', '.join(missing_fields)}"
-        return True, None
+        Raises:
+            BadRequest: If the cursor is malformed.
+
+        Returns:
+            int: The id to continue after, or None for the first page.
+        """
+        if not cursor:
+            return None
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+        except (binascii.Error, ValueError, TypeError, KeyError) as e:
+            raise BadRequest("Invalid cursor") from e
+        if not isinstance(last_id, int):
+            raise BadRequest("Invalid cursor")
+        return last_id
+
+    @staticmethod
+    def parse_limit(limit):
+        """
+        Parses the requested page size, capping it at MAX_PAGE_LIMIT.
+
+        Args:
+            limit (str): The raw limit query parameter, or None for the default.
+
+        Raises:
+            BadRequest: If the limit is not a positive integer.
+
+        Returns:
+            int: The page size to use.
+        """
+        if limit is None:
+            return DEFAULT_PAGE_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError as e:
+            raise BadRequest("Limit must be a positive integer") from e
+        if limit < 1:
+            raise BadRequest("Limit must be a positive integer")
+        return min(limit, MAX_PAGE_LIMIT)
+
+    @staticmethod
+    def paginate(query, id_column, cursor=None, limit=None):
+        """
+        Fetches one page of the query ordered by id_column.
+
+        Args:
+            query (Query): The query to paginate, with any filters already applied.
+            id_column (Column): The integer primary key column to page on.
+            cursor (str): The cursor returned with the previous page, or None.
+            limit (str): The raw requested page size, or None.
+
+        Returns:
+            tuple: The list of items on the page and the cursor for the next page,
+                   which is None on the last page.
+        """
+        last_id = KeysetPaginator.decode_cursor(cursor)
+        limit = KeysetPaginator.parse_limit(limit)
+        if last_id is not None:
+            query = query.filter(id_column > last_id)
+        # fetch one extra row to find out whether there is another page
+        items = query.order_by(id_column).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = KeysetPaginator.encode_cursor(items[-1].id)
+        return items, next_cursor
+
+
+def parse_include(include, allowed):
+    """
+    Parses a comma separated include query parameter.
+
+    Args:
+        include (str): The raw include parameter, or None.
+        allowed (frozenset): The names that may be included.
+
+    Raises:
+        BadRequest: If an unknown name is requested.
+
+    Returns:
+        frozenset: The requested names.
+    """
+    if not include:
+        return frozenset()
+    names = frozenset(name.strip() for name in include.split(",") if name.strip())
+    unknown = names - allowed
+    if unknown:
+        raise BadRequest(f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+
+def parse_ids(ids, max_ids=MAX_MULTI_GET_IDS):
+    """
+    Parses a comma separated ids query parameter, keeping the requested order.
+
+    Args:
+        ids (str): The raw ids parameter.
+        max_ids (int): The maximum number of IDs that may be requested.
+
+    Raises:
+        BadRequest: If an ID is not a positive integer, or more than max_ids are requested.
+
+    Returns:
+        list: The requested IDs, repeats included.
+    """
+    parts = [part.strip() for part in ids.split(",") if part.strip()]
+    if not parts or not all(part.isdigit() and int(part) > 0 for part in parts):
+        raise BadRequest("ids must be comma separated positive integers")
+    if len(parts) > max_ids:
+        raise BadRequest(f"ids must list at most {max_ids} IDs")
+    return [int(part) for part in parts]
+
+
+def make_etag(*parts):
+    """
+    Builds an opaque ETag value from the given parts, e.g. a row id and version.
+
+    Args:
+        *parts: Values identifying one representation of a resource.
+
+    Returns:
+        str: A short hex digest of the parts, suitable for a strong ETag.
+    """
+    raw = "|".join(str(part) for part in parts).encode()
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def utc_today():
+    """
+    Gets the current date in UTC.
+
+    Returns:
+        date: Today's date in UTC.
+    """
+    return datetime.now(timezone.utc).date()
+
+
+def local_today(timezone_name, now=None):
+    """
+    Gets the current date in a time zone.
+
+    Args:
+        timezone_name (str): The IANA time zone name, e.g. "Europe/Paris".
+        now (datetime): The aware current time, defaults to the clock.
+
+    Returns:
+        date: Today's date in the time zone.
+    """
+    zone = ZoneInfo(timezone_name)
+    return (now or datetime.now(timezone.utc)).astimezone(zone).date()
+
+
+def parse_date(value, name):
+    """
+    Parses a date query parameter or body field.
+
+    Args:
+        value (str): The date in YYYY-MM-DD format.
+        name (str): The name of the parameter, for the error message.
+
+    Raises:
+        BadRequest: If the value is not a date in YYYY-MM-DD format.
+
+    Returns:
+        date: The parsed date.
+    """
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise BadRequest(f"{name} must be a date in YYYY-MM-DD format") from e
+
+
+def day_of_year(day):
+    """
+    Gets the position of a date in its year's bitmap.
+
+    Args:
+        day (date): The date.
+
+    Returns:
+        int: 0 for January 1st up to 365 for December 31st of a leap year.
+    """
+    return day.timetuple().tm_yday - 1
+
+
+def bitmap_has(bitmap, index):
+    """
+    Checks a bit of a bitmap.
+
+    Args:
+        bitmap (bytes): The bitmap, with bit 0 as the lowest bit of the first byte.
+        index (int): The bit to check.
+
+    Returns:
+        bool: True if the bit is set.
+    """
+    return bool(bitmap[index >> 3] & (1 << (index & 7)))
+
+
+def bitmap_set(bitmap, index):
+    """
+    Sets a bit of a bitmap.
+
+    Args:
+        bitmap (bytes): The bitmap, with bit 0 as the lowest bit of the first byte.
+        index (int): The bit to set.
+
+    Returns:
+        bytes: A copy of the bitmap with the bit set.
+    """
+    updated = bytearray(bitmap)
+    updated[index >> 3] |= 1 << (index & 7)
+    return bytes(updated)
+
+
+def bitmap_count(bitmap):
+    """
+    Counts the bits set in a bitmap.
+
+    Args:
+        bitmap (bytes): The bitmap.
+
+    Returns:
+        int: The number of bits set.
+    """
+    return int.from_bytes(bitmap, "little").bit_count()
@@ -4,10 +4,30 @@ such as updating and creating.
 """
 
 import logging
-from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.exceptions import BadRequest, NotFound
+from datetime import timedelta
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import BadRequest, Conflict, NotFound
 from server.src.database import db
-from ..models.helpers import DataValidator
+from server.src.passwords import password_hasher
+from ..models.helpers import (
+    HABIT_SCHEMA, USER_SCHEMA, YEAR_BITMAP_BYTES, bitmap_has, bitmap_set, day_of_year, make_etag
+)
+from ..models.serializers import ModelSerializer
+
+BULK_INSERT_BATCH_SIZE = 500
+
+# maps user and habit payload fields onto the columns they are stored in
+USER_COLUMNS = {
+    "name": "username", "email": "email", "password": "password", "timezone": "timezone"
+}
+# the columns compared and copied as is, the password is hashed instead
+PROFILE_COLUMNS = {"name": "username", "email": "email", "timezone": "timezone"}
+HABIT_COLUMNS = {"name": "name"}
+
+EMAIL_IN_USE = "Email is already in use"
 
 
 class User(db.Model):
@@ -18,16 +38,79 @@ class User(db.Model):
         id (int): The unique identifier of the user.
         username (str): The username of the user.
         email (str): The email address of the user.
-        password (str): The password of the user.
+        password (str): The scrypt hash of the user's password, see server.src.passwords.
+        timezone (str): The IANA time zone the user's days start and end in.
+        version (int): Incremented by every update, used for ETags and optimistic locking.
         habits (list): The list of habits associated with the user.
     """
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=False, nullable=False)
-    email = db.Column(db.String(100), unique=False, nullable=False)
+    email = db.Column(db.String(100), unique=True, index=True, nullable=False)
     password = db.Column(db.String(120), nullable=False)
+    timezone = db.Column(db.String(64), nullable=False, default="UTC", server_default="UTC")
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
     habits = db.relationship("Habit", backref="user", lazy=True)
 
+    __mapper_args__ = {"version_id_col": version}
+
+    INCLUDES = frozenset({"habits"})
+
+    def etag(self, include=()):
+        """
+        Builds the ETag of the user's representation from its version column, and from the
+        versions of its habits if they are included.
+
+        Args:
+            include (iterable): Names of relationships from User.INCLUDES nested in the
+                                representation.
+
+        Returns:
+            str: The ETag value, which changes whenever the representation does.
+        """
+        parts = [self.id, self.version, ",".join(sorted(include))]
+        if "habits" in include:
+            parts.extend(f"{habit.id}.{habit.version}" for habit in self.habits)
+        return make_etag(*parts)
+
+    def to_json(self, include=(), fields=None):
+        """
+        Serializes the user, never including the password.
+
+        Args:
+            include (iterable): Names of relationships from User.INCLUDES to nest in the
+                                output. These should have been eager loaded with
+                                User.load_options to avoid a query per user.
+            fields (tuple): Column names from USER_SERIALIZER.parse_fields to restrict the
+                            output to, or None for every column.
+
+        Returns:
+            dict: The JSON serializable representation of the user.
+        """
+        data = USER_SERIALIZER.serialize(self, fields)
+        if "habits" in include:
+            data["habits"] = [habit.to_json() for habit in self.habits]
+        return data
+
+    @staticmethod
+    def load_options(include=()):
+        """
+        Builds the loader options that eager load the requested relationships.
+
+        Relationships are loaded with a single "WHERE user_id IN (...)" query for all users
+        returned by the parent query, rather than one lazy query per user.
+
+        Args:
+            include (iterable): Names of relationships from User.INCLUDES to load.
+
+        Returns:
+            list: The options to pass to Query.options.
+        """
+        options = []
+        if "habits" in include:
+            options.append(selectinload(User.habits))
+        return options
+
     def update(self, user_data):
         """
         Updates the user with the given data.
@@ -36,20 +119,104 @@ class User(db.Model):
             user_data (dict): The data to update the user with.
 
         Raises:
-            ValueError: If the user data is not valid.
+            BadRequest: If the user data is not valid.
 
         Returns:
-            None
+            list: The names of the fields whose values changed.
         """
-        valid, error = DataValidator.validate_user_data(user_data)
-        if not valid:
-            raise BadRequest(error)
-        for field in user_data:
-            if field == "id":
-                continue
-            setattr(self, field, user_data[field])
+        USER_SCHEMA.validate(user_data)
+        return self._save_changes(user_data)
 
-        db.session.commit()
+    def patch(self, user_data):
+        """
+        Updates the user with the fields present in the given data. Only columns whose value
+        differs from the stored one are written, and nothing is written or committed if no
+        value changed.
+
+        Args:
+            user_data (dict): The fields to update the user with.
+
+        Raises:
+            BadRequest: If the user data is not valid or includes habits.
+
+        Returns:
+            list: The names of the fields whose values changed.
+        """
+        USER_SCHEMA.validate(user_data, partial=True)
+        if "habits" in user_data:
+            raise BadRequest("Habits cannot be patched on the user, use /habits/batch")
+        return self._save_changes(user_data)
+
+    def _save_changes(self, user_data):
+        changed = _apply_changes(self, user_data, PROFILE_COLUMNS)
+        password = user_data.get("password")
+        if password is not None and not self.check_password(password):
+            self.password = password_hasher().hash(password)
+            changed.append("password")
+        if changed or db.session.is_modified(self):
+            User.commit()
+        return changed
+
+    def check_password(self, password):
+        """
+        Checks a password against the stored hash. A matching password whose hash was made
+        with another cost than the configured one, or that was stored in plain text, is
+        rehashed, leaving the change for the caller to commit.
+
+        Args:
+            password (str): The password to check.
+
+        Returns:
+            bool: True if the password matches.
+        """
+        hasher = password_hasher()
+        if not hasher.verify(password, self.password):
+            return False
+        if hasher.needs_rehash(self.password):
+            self.password = hasher.hash(password)
+        return True
+
+    @staticmethod
+    def commit():
+        """
+        Commits the session after creating or updating users.
+
+        Raises:
+            Conflict: If an email is already used by another user, or the user was updated
+                      by another request.
+        """
+        _commit_update("User", EMAIL_IN_USE)
+
+    @staticmethod
+    def find_by_email(email, include=()):
+        """
+        Finds a user by email, using the unique index on the email column.
+
+        Args:
+            email (str): The email address to look up.
+            include (iterable): Names of relationships from User.INCLUDES to eager load.
+
+        Returns:
+            User: The user, or None if no user has this email.
+        """
+        return User.query.options(*User.load_options(include)).filter_by(email=email).first()
+
+    @staticmethod
+    def find_many(user_ids, include=()):
+        """
+        Finds users by ID with a single "WHERE id IN (...)" query.
+
+        Args:
+            user_ids (iterable): The IDs to look up.
+            include (iterable): Names of relationships from User.INCLUDES to eager load.
+
+        Returns:
+            dict: The users found, keyed by ID. IDs with no user are left out.
+        """
+        users = User.query.options(*User.load_options(include)).filter(
+            User.id.in_(set(user_ids))
+        )
+        return {user.id: user for user in users}
 
     @staticmethod
     def create(user_data):
@@ -66,28 +233,117 @@ class User(db.Model):
         Returns:
             User: The created user object.
         """
-        # TODO look into using either marshamllow or pydantic for validation
-        valid, error = DataValidator.validate_user_data(user_data)
-        if not valid:
-            raise BadRequest(error)
-        if "id" in user_data:
-            user_data.pop("id")
-
-        habits = []
-        if "habits" in user_data:
-            habits_data = user_data.pop("habits")
-            for habit_data in habits_data:
-                valid, error = DataValidator.validate_habit_data(habit_data)
-                if not valid:
-                    raise BadRequest(error)
-                habit = Habit(name=habit_data["name"])
-                habits.append(habit)
-
-        user = User(**user_data, habits=habits)
+        user = User.from_data(user_data)
 
         db.session.add(user)
         return user
 
+    @staticmethod
+    def from_data(user_data):
+        """
+        Builds a new, unsaved user from the given data, including its habits where applicable,
+        with its password hashed. If id is passed in user_data this is ignored.
+
+        Args:
+            user_data (dict): The data to build the user from.
+
+        Raises:
+            BadRequest: If the user data or any nested habit data is not valid.
+
+        Returns:
+            User: The built user object, not yet added to the session.
+        """
+        columns, habit_names = User.parse(user_data)
+        columns["password"] = password_hasher().hash(columns["password"])
+        return User(**columns, habits=[Habit(name=name) for name in habit_names])
+
+    @staticmethod
+    def parse(user_data):
+        """
+        Validates user data and maps it onto user columns and nested habit names.
+
+        Args:
+            user_data (dict): The user data to parse.
+
+        Raises:
+            BadRequest: If the user data or any nested habit data is not valid.
+
+        Returns:
+            tuple: A dict of user column values and a list of habit names.
+        """
+        USER_SCHEMA.validate(user_data)
+        columns = {
+            column: user_data[field]
+            for field, column in USER_COLUMNS.items()
+            if field in user_data
+        }
+        habit_names = [habit_data["name"] for habit_data in user_data.get("habits", [])]
+        return columns, habit_names
+
+    @staticmethod
+    def bulk_create(users_data, batch_size=BULK_INSERT_BATCH_SIZE):
+        """
+        Creates many users, and their nested habits, in a single transaction.
+
+        Every payload is validated before anything is written, invalid payloads are reported
+        back rather than aborting the batch. The passwords of the valid ones are then hashed
+        together, in parallel if the password hasher has a process pool. Users are flushed in
+        chunks of batch_size, which SQLAlchemy turns into multi-row INSERTs where the dialect
+        can return the generated ids in order. Habits need no ids back, so they are written
+        with one executemany per chunk, which the MySQL drivers rewrite into a single
+        multi-row INSERT.
+
+        Args:
+            users_data (iterable): The user payloads to create.
+            batch_size (int): The number of users written per INSERT batch.
+
+        Raises:
+            BadRequest: If the transaction fails, in which case no users are created.
+
+        Returns:
+            list: One result per payload, in input order. Created users are reported as
+                  {"index", "status": 201, "id"}, invalid payloads as
+                  {"index", "status": 400, "error"} and payloads whose email is already
+                  in use, or used by an earlier payload, as {"index", "status": 409, "error"}.
+        """
+        results = []
+        pending = []
+        for index, user_data in enumerate(users_data):
+            try:
+                columns, habit_names = User.parse(user_data)
+            except BadRequest as e:
+                results.append(
+                    {"index": index, "status": BadRequest.code, "error": e.description}
+                )
+                continue
+            result = {"index": index, "status": 201, "id": None}
+            results.append(result)
+            pending.append((result, User(**columns), habit_names))
+
+        pending = _without_duplicate_emails(pending)
+        _hash_passwords([user for _, user, _ in pending])
+        try:
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start : start + batch_size]
+                db.session.add_all(user for _, user, _ in chunk)
+                db.session.flush()
+                habit_rows = [
+                    {"name": name, "user_id": user.id}
+                    for _, user, habit_names in chunk
+                    for name in habit_names
+                ]
+                if habit_rows:
+                    db.session.execute(insert(Habit), habit_rows)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error("An error occurred while bulk creating users: %s", e)
+            raise BadRequest("An error occurred while bulk creating users") from e
+
+        for result, user, _ in pending:
+            result["id"] = user.id
+        return results
+
 
 class Habit(db.Model):
     """
@@ -97,11 +353,45 @@ class Habit(db.Model):
         id (int): The unique identifier of the habit.
         name (str): The name of the habit.
         user_id (int): The ID of the user associated with the habit.
+        version (int): Incremented by every update, used for ETags and optimistic locking.
+        current_streak (int): The number of consecutive days checked in up to last_checkin.
+        longest_streak (int): The longest run of consecutive days ever checked in.
+        last_checkin (date): The latest day the habit was checked in on, if any.
+        checkins (list): The HabitCheckin rows of the habit, one per year.
     """
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    current_streak = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    longest_streak = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_checkin = db.Column(db.Date, nullable=True)
+    checkins = db.relationship("HabitCheckin", lazy=True)
+
+    __mapper_args__ = {"version_id_col": version}
+
+    def etag(self):
+        """
+        Builds the ETag of the habit's representation from its version column.
+
+        Returns:
+            str: The ETag value, which changes whenever the habit is updated.
+        """
+        return make_etag(self.id, self.version)
+
+    def to_json(self, fields=None):
+        """
+        Serializes the habit.
+
+        Args:
+            fields (tuple): Column names from HABIT_SERIALIZER.parse_fields to restrict the
+                            output to, or None for every column.
+
+        Returns:
+            dict: The JSON serializable representation of the habit.
+        """
+        return HABIT_SERIALIZER.serialize(self, fields)
 
     def update(self, habit_data):
         """
@@ -111,20 +401,182 @@ class Habit(db.Model):
             habit_data (dict): The data to update the habit with.
 
         Raises:
-            ValueError: If the habit data is not valid.
+            BadRequest: If the habit data is not valid.
 
         Returns:
-            None
+            list: The names of the fields whose values changed.
         """
-        valid, error = DataValidator.validate_habit_data(habit_data)
-        if not valid:
-            raise BadRequest(error)
-        for field in habit_data:
-            if field in ("id", "user_id"):
-                continue
-            setattr(self, field, habit_data[field])
+        changed = self.apply(habit_data)
+        if changed:
+            _commit_update("Habit")
+        return changed
 
-        db.session.commit()
+    def patch(self, habit_data):
+        """
+        Updates the habit with the fields present in the given data. Only columns whose value
+        differs from the stored one are written, and nothing is written or committed if no
+        value changed.
+
+        Args:
+            habit_data (dict): The fields to update the habit with.
+
+        Raises:
+            BadRequest: If the habit data is not valid.
+
+        Returns:
+            list: The names of the fields whose values changed.
+        """
+        HABIT_SCHEMA.validate(habit_data, partial=True)
+        changed = _apply_changes(self, habit_data, HABIT_COLUMNS)
+        if changed:
+            _commit_update("Habit")
+        return changed
+
+    def apply(self, habit_data):
+        """
+        Validates the given data and sets it on the habit without committing.
+
+        Args:
+            habit_data (dict): The data to update the habit with.
+
+        Raises:
+            BadRequest: If the habit data is not valid.
+
+        Returns:
+            list: The names of the fields whose values changed.
+        """
+        HABIT_SCHEMA.validate(habit_data)
+        return _apply_changes(self, habit_data, HABIT_COLUMNS)
+
+    def streaks(self, today):
+        """
+        Gets the streaks of the habit from its stored fields, without reading its history.
+
+        Args:
+            today (date): The current date. The current streak is broken, and reported as 0,
+                          if the habit was last checked in before yesterday.
+
+        Returns:
+            dict: The current_streak, longest_streak and last_checkin in ISO format.
+        """
+        current = self.current_streak
+        if self.last_checkin is None or self.last_checkin < today - timedelta(days=1):
+            current = 0
+        return {
+            "current_streak": current,
+            "longest_streak": self.longest_streak,
+            "last_checkin": self.last_checkin.isoformat() if self.last_checkin else None,
+        }
+
+    def check_in(self, day):
+        """
+        Records that the habit was completed on a day and commits, updating the streaks
+        incrementally. Checking in the day after last_checkin extends the current streak
+        without reading any history. Only a day before last_checkin, which may join runs of
+        days together, reads the bitmaps of the runs next to it.
+
+        Args:
+            day (date): The day the habit was completed.
+
+        Raises:
+            Conflict: If another request checked the habit in concurrently.
+
+        Returns:
+            bool: True if the day was recorded, False if it already was.
+        """
+        if not self._record_checkin(day, _CheckinBitmaps(self.id)):
+            return False
+        _commit_update("Habit")
+        return True
+
+    @staticmethod
+    def check_in_many(days_by_habit):
+        """
+        Records check-ins of many habits with a single commit, as check_in does for one.
+        Habits that no longer exist are skipped.
+
+        Args:
+            days_by_habit (dict): Maps habit IDs to the days they were completed on.
+
+        Raises:
+            Conflict: If another request updated one of the habits concurrently, in which
+                      case none of the check-ins are recorded.
+
+        Returns:
+            set: The IDs of the users whose habits changed.
+        """
+        habit_ids = list(days_by_habit)
+        years = {day.year for days in days_by_habit.values() for day in days}
+        rows = {(habit_id, year): None for habit_id in habit_ids for year in years}
+        for row in HabitCheckin.query.filter(
+            HabitCheckin.habit_id.in_(habit_ids), HabitCheckin.year.in_(years)
+        ):
+            rows[row.habit_id, row.year] = row
+
+        changed = set()
+        for habit in Habit.query.filter(Habit.id.in_(habit_ids)):
+            bitmaps = _CheckinBitmaps(
+                habit.id, {year: rows[habit.id, year] for year in years}
+            )
+            for day in sorted(days_by_habit[habit.id]):
+                if habit._record_checkin(day, bitmaps):  # pylint: disable=protected-access
+                    changed.add(habit.user_id)
+        if changed:
+            _commit_update("Habit")
+        return changed
+
+    def _record_checkin(self, day, bitmaps):
+        """
+        Sets the day in the bitmaps and updates the streaks, without committing.
+        """
+        if bitmaps.has(day):
+            return False
+        bitmaps.set(day)
+
+        last = self.last_checkin
+        if last is None or day > last + timedelta(days=1):
+            run = 1
+        elif day == last + timedelta(days=1):
+            run = self.current_streak + 1
+        else:
+            joins_current = day == last - timedelta(days=self.current_streak)
+            after = self.current_streak if joins_current else bitmaps.run(day, 1)
+            run = bitmaps.run(day, -1) + 1 + after
+            if joins_current:
+                self.current_streak = run
+        if last is None or day > last:
+            self.last_checkin = day
+            self.current_streak = run
+        self.longest_streak = max(self.longest_streak, run)
+        return True
+
+    def history(self, start, end):
+        """
+        Gets the days a habit was checked in on, reading one row per year of the range.
+
+        Args:
+            start (date): The first day of the range.
+            end (date): The last day of the range, included.
+
+        Returns:
+            list: The dates checked in on, in ascending order.
+        """
+        bitmaps = dict(
+            db.session.execute(
+                db.select(HabitCheckin.year, HabitCheckin.days).where(
+                    HabitCheckin.habit_id == self.id,
+                    HabitCheckin.year.between(start.year, end.year),
+                )
+            ).all()
+        )
+        days = []
+        day = start
+        while day <= end:
+            bitmap = bitmaps.get(day.year)
+            if bitmap is not None and bitmap_has(bitmap, day_of_year(day)):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
 
     @staticmethod
     def create(habit_data, user_id):
@@ -145,9 +597,7 @@ class Habit(db.Model):
 
         if user is None:
             raise NotFound("User not found")
-        valid, error = DataValidator.validate_habit_data(habit_data)
-        if not valid:
-            raise BadRequest(error)
+        HABIT_SCHEMA.validate(habit_data)
 
         try:
             habit = Habit(name=habit_data["name"], user_id=user_id)
@@ -162,3 +612,250 @@ class Habit(db.Model):
                 f"An error occurred while creating habit for user {user_id}"
             ) from e
         return habit
+
+    @staticmethod
+    def batch_create(habits_data, user):
+        """
+        Creates many habits for an already loaded user with a single commit.
+        Invalid habit data is reported back rather than aborting the batch.
+
+        Args:
+            habits_data (list): The habit payloads to create.
+            user (User): The user to associate the habits with.
+
+        Raises:
+            BadRequest: If the transaction fails, in which case no habits are created.
+
+        Returns:
+            list: One result per payload, in input order. Created habits are reported as
+                  {"index", "status": 201, "id"}, invalid payloads as
+                  {"index", "status": 400, "error"}.
+        """
+        results = []
+        pending = []
+        for index, habit_data in enumerate(habits_data):
+            error = HABIT_SCHEMA.errors(habit_data)
+            if error is not None:
+                results.append({"index": index, "status": BadRequest.code, "error": error})
+                continue
+            habit = Habit(name=habit_data["name"], user_id=user.id)
+            result = {"index": index, "status": 201, "id": None}
+            results.append(result)
+            pending.append((result, habit))
+
+        _commit_batch(
+            [habit for _, habit in pending],
+            f"An error occurred while creating habits for user {user.id}",
+        )
+        for result, habit in pending:
+            result["id"] = habit.id
+        return results
+
+    @staticmethod
+    def batch_update(habits_data, user):
+        """
+        Updates many habits belonging to an already loaded user with a single query and a
+        single commit. Each payload must carry the id of the habit it updates.
+        Invalid or unknown habits are reported back rather than aborting the batch.
+
+        Args:
+            habits_data (list): The habit payloads to apply.
+            user (User): The user who owns the habits.
+
+        Raises:
+            BadRequest: If the transaction fails, in which case no habits are updated.
+            Conflict: If another request updated one of the habits first, in which case no
+                      habits are updated.
+
+        Returns:
+            list: One result per payload, in input order. Updated habits are reported as
+                  {"index", "status": 200, "id"}, invalid payloads as
+                  {"index", "status": 400, "error"} and unknown habits as
+                  {"index", "status": 404, "error"}.
+        """
+        ids = [
+            habit_data.get("id")
+            for habit_data in habits_data
+            if isinstance(habit_data, dict) and isinstance(habit_data.get("id"), int)
+        ]
+        habits = {
+            habit.id: habit
+            for habit in Habit.query.filter(
+                Habit.id.in_(ids), Habit.user_id == user.id
+            )
+        } if ids else {}
+
+        results = []
+        for index, habit_data in enumerate(habits_data):
+            error = HABIT_SCHEMA.errors(habit_data)
+            if error is None and not isinstance(habit_data.get("id"), int):
+                error = "Missing mandatory fields: id"
+            if error is not None:
+                results.append({"index": index, "status": BadRequest.code, "error": error})
+                continue
+            habit = habits.get(habit_data["id"])
+            if habit is None:
+                results.append(
+                    {"index": index, "status": NotFound.code, "error": "Habit not found"}
+                )
+                continue
+            habit.apply(habit_data)
+            results.append({"index": index, "status": 200, "id": habit.id})
+
+        _commit_batch([], f"An error occurred while updating habits for user {user.id}")
+        return results
+
+
+class HabitCheckin(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    The days of one year a habit was checked in on, as a bitmap, so a year of history is a
+    single small row.
+
+    Attributes:
+        habit_id (int): The ID of the habit.
+        year (int): The year.
+        days (bytes): Bit n is set if the habit was checked in on day n of the year, counting
+                      from 0 for January 1st, see helpers.day_of_year.
+    """
+
+    __tablename__ = "habit_checkin"
+
+    habit_id = db.Column(db.Integer, db.ForeignKey("habit.id"), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    days = db.Column(db.LargeBinary(YEAR_BITMAP_BYTES), nullable=False)
+
+
+class _CheckinBitmaps:
+    """
+    The check-in rows of one habit, loaded by year as they are needed. Rows already loaded,
+    or known not to exist as None, can be passed in as a dict keyed by year.
+    """
+
+    def __init__(self, habit_id, rows=None):
+        self.habit_id = habit_id
+        self._rows = rows or {}
+
+    def _row(self, year, create=False):
+        if year not in self._rows:
+            self._rows[year] = db.session.get(HabitCheckin, (self.habit_id, year))
+        if self._rows[year] is None and create:
+            self._rows[year] = HabitCheckin(
+                habit_id=self.habit_id, year=year, days=bytes(YEAR_BITMAP_BYTES)
+            )
+            db.session.add(self._rows[year])
+        return self._rows[year]
+
+    def has(self, day):
+        """
+        Checks whether the habit was checked in on a day.
+        """
+        row = self._row(day.year)
+        return row is not None and bitmap_has(row.days, day_of_year(day))
+
+    def set(self, day):
+        """
+        Marks a day as checked in.
+        """
+        row = self._row(day.year, create=True)
+        row.days = bitmap_set(row.days, day_of_year(day))
+
+    def run(self, day, step):
+        """
+        Counts the consecutive days checked in next to a day, excluding the day itself.
+        Step is -1 to count the days before and 1 the days after.
+        """
+        count = 0
+        day += timedelta(days=step)
+        while self.has(day):
+            count += 1
+            day += timedelta(days=step)
+        return count
+
+
+USER_SERIALIZER = ModelSerializer(User, exclude=("password", "version"))
+# streaks are served by Habit.streaks, which accounts for streaks broken since the last write
+HABIT_SERIALIZER = ModelSerializer(
+    Habit, exclude=("version", "current_streak", "longest_streak", "last_checkin")
+)
+
+
+def _apply_changes(obj, data, columns):
+    """
+    Sets the fields of data that differ from the object's current values, leaving unchanged
+    columns untouched so the UPDATE only includes what changed.
+
+    Returns the names of the changed fields.
+    """
+    changed = []
+    for field, column in columns.items():
+        if field in data and getattr(obj, column) != data[field]:
+            setattr(obj, column, data[field])
+            changed.append(field)
+    return changed
+
+
+def _commit_update(model_name, duplicate_message=None):
+    """
+    Commits an update, turning a lost optimistic locking race into a Conflict error.
+    The version column makes the UPDATE match no rows if another request committed first.
+    A unique constraint violation also becomes a Conflict error, with duplicate_message.
+    """
+    try:
+        db.session.commit()
+    except StaleDataError as e:
+        db.session.rollback()
+        raise Conflict(f"{model_name} was modified by another request") from e
+    except IntegrityError as e:
+        db.session.rollback()
+        raise Conflict(duplicate_message or f"{model_name} conflicts with existing data") from e
+
+
+def _without_duplicate_emails(pending):
+    """
+    Drops the pending users of a bulk create whose email is already stored, or taken by an
+    earlier user of the batch, marking their results as 409. Stored emails are looked up
+    with one IN query per BULK_INSERT_BATCH_SIZE emails.
+    """
+    emails = list({user.email for _, user, _ in pending})
+    taken = set()
+    for start in range(0, len(emails), BULK_INSERT_BATCH_SIZE):
+        chunk = emails[start : start + BULK_INSERT_BATCH_SIZE]
+        taken.update(db.session.scalars(db.select(User.email).where(User.email.in_(chunk))))
+
+    kept = []
+    for item in pending:
+        result, user, _ = item
+        if user.email in taken:
+            del result["id"]
+            result.update(status=Conflict.code, error=EMAIL_IN_USE)
+            continue
+        taken.add(user.email)
+        kept.append(item)
+    return kept
+
+
+def _hash_passwords(users):
+    """
+    Replaces the plain text passwords of new users with their hashes, hashed together.
+    """
+    hashes = password_hasher().hash_many([user.password for user in users])
+    for user, password_hash in zip(users, hashes):
+        user.password = password_hash
+
+
+def _commit_batch(new_objects, error_message, model_name="Habit"):
+    """
+    Adds the given objects to the session and commits everything in one transaction,
+    rolling back and raising BadRequest with error_message if the commit fails, or
+    Conflict, like _commit_update, if another request updated one of the objects first.
+    """
+    try:
+        db.session.add_all(new_objects)
+        db.session.commit()
+    except StaleDataError as e:
+        db.session.rollback()
+        raise Conflict(f"{model_name} was modified by another request") from e
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error("%s: %s", error_message, e)
+        raise BadRequest(error_message) from e
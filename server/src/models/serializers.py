@@ -0,0 +1,122 @@
+"""
+Module for turning model instances into JSON responses.
+
+Each model gets a ModelSerializer built once at import time, which precomputes the list of
+column names and a single attrgetter over them, so serializing a row is one C level call and
+a zip rather than a walk over the table's columns.
+"""
+
+import json
+from functools import lru_cache
+from operator import attrgetter
+from flask import current_app, jsonify
+from werkzeug.exceptions import BadRequest
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is not installed
+    orjson = None
+
+
+class ModelSerializer:
+    """
+    Class for serializing instances of one model, optionally restricted to a subset of fields.
+
+    Attributes:
+        fields (tuple): The names of all serializable columns, in table order.
+    """
+
+    def __init__(self, model, exclude=()):
+        """
+        Compiles the serializer for a model.
+
+        Args:
+            model (db.Model): The model class to serialize.
+            exclude (iterable): Column names that must never be serialized.
+        """
+        exclude = frozenset(exclude)
+        self.fields = tuple(
+            column.key for column in model.__table__.columns if column.key not in exclude
+        )
+        self._allowed = frozenset(self.fields)
+        self._getter = self._compile(self.fields)
+        # compiled getters for sparse fieldsets, keyed by the requested field tuple
+        self._compile_fields = lru_cache(maxsize=64)(self._compile)
+
+    @staticmethod
+    def _compile(fields):
+        """
+        Builds a function returning the values of the given fields as a tuple.
+        """
+        getter = attrgetter(*fields)
+        if len(fields) == 1:
+            return lambda obj: (getter(obj),)
+        return getter
+
+    def parse_fields(self, fields):
+        """
+        Parses a comma separated fields query parameter.
+
+        Args:
+            fields (str): The raw fields parameter, or None for every field.
+
+        Raises:
+            BadRequest: If an unknown or excluded field is requested.
+
+        Returns:
+            tuple: The requested field names in request order, or None for every field.
+        """
+        if not fields:
+            return None
+        names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in names if name not in self._allowed]
+        if unknown:
+            raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+        return names or None
+
+    def serialize(self, obj, fields=None):
+        """
+        Serializes an instance.
+
+        Args:
+            obj (db.Model): The instance to serialize.
+            fields (tuple): Field names returned by parse_fields, or None for every field.
+
+        Returns:
+            dict: The JSON serializable representation of the instance.
+        """
+        if fields is None:
+            return dict(zip(self.fields, self._getter(obj)))
+        return dict(zip(fields, self._compile_fields(fields)(obj)))
+
+
+def json_response(payload, status=200):
+    """
+    Builds a JSON response, using orjson when it is installed and jsonify otherwise.
+
+    Args:
+        payload: The JSON serializable body.
+        status (int): The HTTP status code.
+
+    Returns:
+        tuple: The response and status code, as returned from a view.
+    """
+    if orjson is None:
+        return jsonify(payload), status
+    body = orjson.dumps(payload)  # pylint: disable=no-member
+    return current_app.response_class(body, mimetype="application/json"), status
+
+
+def dumps(payload):
+    """
+    Serializes a payload to JSON, using orjson when it is installed.
+
+    Args:
+        payload: The JSON serializable value.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    if orjson is None:
+        return json.dumps(payload, separators=(",", ":")).encode()
+    return orjson.dumps(payload)  # pylint: disable=no-member
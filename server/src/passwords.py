@@ -0,0 +1,233 @@
+"""
+This module hashes user passwords with scrypt.
+
+Hashes are stored as "scrypt$<cost>$<r>$<p>$<salt>$<hash>", where cost is log2 of the scrypt
+N parameter, so they carry the parameters they were made with. A password whose hash was
+made with another cost, or stored in plain text by an earlier version, is reported by
+needs_rehash and rehashed the next time the password is seen.
+
+Hashing takes tens of milliseconds of CPU by design. With PASSWORD_HASH_WORKERS set it runs
+in a process pool of that size, and at most PASSWORD_HASH_WORKERS * 4 hashes are queued at
+once, so bursts of signups wait for a slot rather than piling up work and memory.
+"""
+
+import atexit
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+
+ALGORITHM = "scrypt"
+DEFAULT_COST = 15
+BLOCK_SIZE = 8
+PARALLELISM = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, cost, block_size, parallelism):
+    n = 2**cost
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=block_size,
+        p=parallelism,
+        maxmem=256 * block_size * n,
+        dklen=HASH_BYTES,
+    )
+
+
+def hash_password(password, cost=DEFAULT_COST):
+    """
+    Hash a password with a new random salt.
+
+    :param password: The password.
+    :param cost: log2 of the scrypt N parameter, each step doubles the time and memory.
+    :return: The encoded hash.
+    """
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, cost, BLOCK_SIZE, PARALLELISM)
+    return f"{ALGORITHM}${cost}${BLOCK_SIZE}${PARALLELISM}${_encode(salt)}${_encode(digest)}"
+
+
+def unusable_password():
+    """
+    Make a stored password that no password matches, for users whose password is unknown,
+    e.g. imported from an export without password hashes. It is a hash with a random digest,
+    so it is not mistaken for a plain text password either.
+
+    :return: The stored password.
+    """
+    salt, digest = _encode(os.urandom(SALT_BYTES)), _encode(os.urandom(HASH_BYTES))
+    return f"{ALGORITHM}${DEFAULT_COST}${BLOCK_SIZE}${PARALLELISM}${salt}${digest}"
+
+
+def _parse(stored):
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != ALGORITHM:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), _decode(parts[4]), _decode(parts[5])
+    except ValueError:
+        return None
+
+
+def is_password_hash(stored):
+    """
+    Check whether a stored password is a hash made by hash_password, rather than a plain
+    text password.
+
+    :param stored: The stored password.
+    :return: True if it is a hash.
+    """
+    return _parse(stored) is not None
+
+
+def verify_password(password, stored):
+    """
+    Check a password against a stored hash, or against a plain text password stored by an
+    earlier version.
+
+    :param password: The password to check.
+    :param stored: The stored hash.
+    :return: True if the password matches.
+    """
+    parsed = _parse(stored)
+    if parsed is None:
+        return hmac.compare_digest(password.encode(), stored.encode())
+    cost, block_size, parallelism, salt, digest = parsed
+    return hmac.compare_digest(_scrypt(password, salt, cost, block_size, parallelism), digest)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords inline, or in a bounded process pool.
+    """
+
+    def __init__(self, cost=DEFAULT_COST, workers=0):
+        """
+        :param cost: log2 of the scrypt N parameter for new hashes.
+        :param workers: The number of hashing processes, 0 to hash in the calling thread.
+        """
+        self.cost = cost
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max(workers * 4, 1))
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork, the server process runs other threads
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        with self._slots:
+            return self._pool().submit(function, *args).result()
+
+    def hash(self, password):
+        """
+        Hash a password with the configured cost.
+
+        :param password: The password.
+        :return: The encoded hash.
+        """
+        return self._run(hash_password, password, self.cost)
+
+    def hash_many(self, passwords):
+        """
+        Hash many passwords, in parallel when a pool is configured.
+
+        Each hash takes a slot until it is done, like a single one, so a large batch waits
+        for slots rather than queuing every hash in the pool at once.
+
+        :param passwords: A list of passwords.
+        :return: The encoded hashes, in the same order.
+        """
+        if not self.workers:
+            return [hash_password(password, self.cost) for password in passwords]
+        pool = self._pool()
+        futures = []
+        for password in passwords:
+            self._slots.acquire()  # pylint: disable=consider-using-with
+            try:
+                future = pool.submit(hash_password, password, self.cost)
+            except BaseException:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def verify(self, password, stored):
+        """
+        Check a password against a stored hash.
+
+        :param password: The password to check.
+        :param stored: The stored hash.
+        :return: True if the password matches.
+        """
+        return self._run(verify_password, password, stored)
+
+    def needs_rehash(self, stored):
+        """
+        Check whether a stored hash was made with other parameters than the configured ones,
+        or is a plain text password. Doesn't hash anything.
+
+        :param stored: The stored hash.
+        :return: True if the password should be hashed again.
+        """
+        parsed = _parse(stored)
+        return parsed is None or parsed[:3] != (self.cost, BLOCK_SIZE, PARALLELISM)
+
+    def shutdown(self):
+        """
+        Stop the hashing processes, if they were started.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def init_passwords(app):
+    """
+    Attach a PasswordHasher to the app, configured with PASSWORD_HASH_COST and
+    PASSWORD_HASH_WORKERS.
+
+    :param app: The Flask app.
+    """
+    hasher = PasswordHasher(
+        cost=int(app.config.get("PASSWORD_HASH_COST") or DEFAULT_COST),
+        workers=int(app.config.get("PASSWORD_HASH_WORKERS") or 0),
+    )
+    app.extensions["password_hasher"] = hasher
+    if hasher.workers:
+        atexit.register(hasher.shutdown)
+
+
+def password_hasher():
+    """
+    Get the PasswordHasher of the current app.
+
+    :return: The PasswordHasher.
+    """
+    return current_app.extensions["password_hasher"]
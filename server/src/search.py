@@ -0,0 +1,509 @@
+"""
+This module searches habits by name, for GET /habits/search and GET /user/<id>/habits/search.
+
+Queries match habit names word by word, each query word matching the start of a word of
+the name with up to one typo, or two for words of 8 letters or more, so "morn exrcise"
+finds "Morning exercise". The matching habits are ranked by their number of typos, then
+with names starting with the query first, then shortest first.
+
+Searching every habit goes through a HabitIndex, which narrows the habit table down to
+candidates sharing n-grams or words with the query before they are ranked:
+
+- Fts5HabitIndex on SQLite, with an FTS5 table of the words of habit names, kept in sync
+  with the habit table by triggers. Each query word is expanded into the indexed words it
+  is within allowed_typos of, among those with the same first letter, and the candidates
+  match one of them for every query word, the best ranked by FTS5 first.
+- FulltextHabitIndex on MySQL, with a FULLTEXT index on habit.name using the ngram parser,
+  which InnoDB keeps in sync itself.
+- TrieHabitIndex otherwise, or with HABIT_SEARCH_BACKEND=trie, an in-memory trie of the
+  words of every habit name, with the closest matches as candidates. It loads every habit
+  on first use, then applies the habits created and renamed by each commit of this process
+  once it has committed, whatever order the commits end in. Habits inserted in bulk, which
+  it gets no rows for, have the habits of their users reloaded before the next search.
+  Changes made by other processes, or bypassing the session, are only seen after a restart.
+
+Searching the habits of one user ranks all of them, found with the index on habit.user_id.
+"""
+
+import abc
+import re
+import threading
+from typing import NamedTuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select, text
+from server.src.database import RoutingSession, db
+from server.src.models.models import Habit
+
+MIN_QUERY_LENGTH = 3
+MAX_QUERY_LENGTH = 80
+DEFAULT_SEARCH_LIMIT = 10
+# candidates fetched from the index per result, to be ranked
+CANDIDATES_PER_RESULT = 10
+# indexed words a query word with typos expands to, the closest first
+MAX_EXPANSIONS = 50
+FULLTEXT_INDEX = "ix_habit_name_fulltext"
+# session.info keys of the habits created or renamed in the current transaction, and of
+# the users whose habits were inserted in bulk
+_CHANGES = "search_changes"
+_BULK_USERS = "search_bulk_users"
+_WORD = re.compile(r"\w+")
+
+FTS5_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS habit_search USING fts5("
+    "name, content='habit', content_rowid='id', tokenize='unicode61 remove_diacritics 0')",
+    # the distinct words of habit names, to expand query words with typos into
+    "CREATE VIRTUAL TABLE IF NOT EXISTS habit_search_terms USING fts5vocab(habit_search, 'row')",
+    "CREATE TRIGGER IF NOT EXISTS habit_search_insert AFTER INSERT ON habit BEGIN "
+    "INSERT INTO habit_search (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS habit_search_update AFTER UPDATE OF name ON habit BEGIN "
+    "INSERT INTO habit_search (habit_search, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO habit_search (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS habit_search_delete AFTER DELETE ON habit BEGIN "
+    "INSERT INTO habit_search (habit_search, rowid, name) VALUES ('delete', old.id, old.name); "
+    "END",
+    # indexes the habits that existed before the table
+    "INSERT INTO habit_search (habit_search) VALUES ('rebuild')",
+)
+
+
+class HabitRow(NamedTuple):
+    """
+    The columns of a habit returned by a search.
+    """
+
+    id: int
+    user_id: int
+    name: str
+
+    def to_json(self):
+        """
+        Serialize the habit like HABIT_SERIALIZER.
+
+        :return: A dict with the id, name and user_id of the habit.
+        """
+        return {"id": self.id, "name": self.name, "user_id": self.user_id}
+
+
+def tokenize(value):
+    """
+    Split a text into lowercase words.
+
+    :param value: The text.
+    :return: The list of words.
+    """
+    return _WORD.findall(value.lower())
+
+
+def allowed_typos(word):
+    """
+    Get the number of typos tolerated in a query word.
+
+    :param word: The query word.
+    :return: 0 up to 3 letters, 1 up to 7 and 2 from 8.
+    """
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def prefix_distance(word, target, bound=None):
+    """
+    Get the edit distance between a word and the closest start of a target word, so a
+    word typed partially, or with typos, is close to the word it starts.
+
+    :param word: The query word.
+    :param target: The word of a habit name.
+    :param bound: The largest distance of interest, to stop as soon as it is exceeded, or
+                  None to compute the exact distance.
+    :return: The smallest Levenshtein distance between word and a prefix of target, or
+             bound + 1 if it exceeds bound.
+    """
+    previous = list(range(len(target) + 1))
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, target_char in enumerate(target, 1):
+            current.append(min(
+                current[j - 1] + 1, previous[j] + 1, previous[j - 1] + (char != target_char)
+            ))
+        previous = current
+        if bound is not None and min(previous) > bound:
+            return bound + 1
+    return min(previous)
+
+
+def match_cost(words, name):
+    """
+    Get the number of typos of a query in a habit name.
+
+    :param words: The words of the query.
+    :param name: The habit name.
+    :return: The sum of the distances of each query word to its closest word of the name,
+             or None if a query word has more typos than allowed_typos.
+    """
+    targets = tokenize(name)
+    cost = 0
+    for word in words:
+        typos = allowed_typos(word)
+        distance = min(
+            (prefix_distance(word, target, typos) for target in targets), default=None
+        )
+        if distance is None or distance > typos:
+            return None
+        cost += distance
+    return cost
+
+
+def rank(query, rows, limit):
+    """
+    Keep the habits matching a query and order them from the best match.
+
+    :param query: The query.
+    :param rows: The candidate HabitRows.
+    :param limit: The number of habits to return.
+    :return: The best matching HabitRows.
+    """
+    words = tokenize(query)
+    prefix = query.strip().lower()
+    scored = []
+    for row in rows:
+        cost = match_cost(words, row.name)
+        if cost is not None:
+            starts = row.name.lower().startswith(prefix)
+            scored.append((cost, not starts, len(row.name), row.id, row))
+    scored.sort()
+    return [row for *_, row in scored[:limit]]
+
+
+class HabitIndex(abc.ABC):
+    """
+    Finds the candidate habits for a query, for rank to filter and order.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def candidates(self, words, limit):
+        """
+        Find habits sharing n-grams or words with a query, the most similar first.
+
+        :param words: The words of the query.
+        :param limit: The number of candidates wanted.
+        :return: A list of HabitRows.
+        """
+
+    def search(self, query, user_id=None, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Search habits by name.
+
+        :param query: The query.
+        :param user_id: The ID of the user whose habits to search, or None for every habit.
+        :param limit: The number of habits to return.
+        :return: The best matching HabitRows.
+        """
+        if user_id is not None:
+            rows = [
+                HabitRow(*row) for row in db.session.execute(
+                    select(Habit.id, Habit.user_id, Habit.name).where(Habit.user_id == user_id)
+                )
+            ]
+        else:
+            rows = self.candidates(tokenize(query), limit * CANDIDATES_PER_RESULT)
+        return rank(query, rows, limit)
+
+
+class Fts5HabitIndex(HabitIndex):
+    """
+    Finds candidates in the FTS5 table habit_search, matching every query word.
+    """
+
+    name = "fts5"
+
+    @staticmethod
+    def _expand(word):
+        """
+        Get the FTS5 query matching the indexed words that start within allowed_typos of a
+        query word. The words are read from habit_search_terms among those with the same
+        first letter and long enough to be within reach, and their distances are computed
+        once per distinct start, as no prefix longer than the word plus its typos can be
+        closer.
+        """
+        typos = allowed_typos(word)
+        if not typos:
+            return f'"{word}"*'
+        terms = db.session.execute(
+            text(
+                "SELECT term FROM habit_search_terms "
+                "WHERE term >= :low AND term < :high AND length(term) >= :min_length"
+            ),
+            {"low": word[0], "high": chr(ord(word[0]) + 1), "min_length": len(word) - typos},
+        ).scalars().all()
+        reach = len(word) + typos
+        starts = {}
+        distances = []
+        for term in terms:
+            start = term[:reach]
+            if start not in starts:
+                starts[start] = prefix_distance(word, start, typos)
+            if starts[start] <= typos:
+                distances.append((starts[start], term))
+        if not distances:
+            return None
+        distances.sort()
+        return "(" + " OR ".join(f'"{term}"' for _, term in distances[:MAX_EXPANSIONS]) + ")"
+
+    def candidates(self, words, limit):
+        queries = [self._expand(word) for word in words]
+        if not queries or None in queries:
+            return []
+        rows = db.session.execute(
+            text(
+                "SELECT habit.id, habit.user_id, habit.name FROM habit_search "
+                "JOIN habit ON habit.id = habit_search.rowid "
+                "WHERE habit_search MATCH :match ORDER BY habit_search.rank LIMIT :limit"
+            ),
+            {"match": " AND ".join(queries), "limit": limit},
+        ).all()
+        return [HabitRow(*row) for row in rows]
+
+
+class FulltextHabitIndex(HabitIndex):
+    """
+    Finds candidates with the ngram FULLTEXT index on habit.name.
+    """
+
+    name = "fulltext"
+
+    def candidates(self, words, limit):
+        if not words:
+            return []
+        rows = db.session.execute(
+            text(
+                "SELECT id, user_id, name FROM habit "
+                "WHERE MATCH (name) AGAINST (:query IN NATURAL LANGUAGE MODE) "
+                "ORDER BY MATCH (name) AGAINST (:query IN NATURAL LANGUAGE MODE) DESC "
+                "LIMIT :limit"
+            ),
+            {"query": " ".join(words), "limit": limit},
+        ).all()
+        return [HabitRow(*row) for row in rows]
+
+
+class _TrieNode:  # pylint: disable=too-few-public-methods
+    __slots__ = ("children", "habits")
+
+    def __init__(self):
+        self.children = {}
+        self.habits = set()
+
+
+class TrieHabitIndex(HabitIndex):
+    """
+    Finds candidates in an in-memory trie of the words of every habit name.
+    """
+
+    name = "trie"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._root = _TrieNode()
+        self._habits = {}
+        self._loaded = False
+        self._stale_users = set()
+
+    def _words(self, habit_id, add):
+        for word in set(tokenize(self._habits[habit_id].name)):
+            node = self._root
+            for char in word:
+                if add:
+                    node = node.children.setdefault(char, _TrieNode())
+                else:
+                    node = node.children[char]
+            if add:
+                node.habits.add(habit_id)
+            else:
+                node.habits.discard(habit_id)
+
+    def _update(self, rows):
+        for row in rows:
+            if row.id in self._habits:
+                self._words(row.id, add=False)
+            self._habits[row.id] = row
+            self._words(row.id, add=True)
+
+    def update(self, rows):
+        """
+        Index new habits, or the new names of renamed ones.
+
+        :param rows: The HabitRows.
+        """
+        with self._lock:
+            self._update(rows)
+
+    def invalidate(self, user_ids):
+        """
+        Reload the habits of users before the next search, e.g. after inserting habits in
+        bulk, which gives no rows to update with.
+
+        :param user_ids: The IDs of the users.
+        """
+        with self._lock:
+            self._stale_users.update(user_ids)
+
+    def refresh(self):
+        """
+        Load every habit on first use, or the habits of the invalidated users. The habits
+        are read holding the lock, so a commit that ends meanwhile is applied after them.
+        """
+        with self._lock:
+            if self._loaded and not self._stale_users:
+                return
+            query = select(Habit.id, Habit.user_id, Habit.name)
+            if self._loaded:
+                query = query.where(Habit.user_id.in_(self._stale_users))
+            self._update(HabitRow(*row) for row in db.session.execute(query).all())
+            self._loaded = True
+            self._stale_users.clear()
+
+    def _subtree(self, node):
+        found = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            found |= node.habits
+            stack.extend(node.children.values())
+        return found
+
+    def _lookup(self, word):
+        """
+        Find the habits with a word starting within allowed_typos of word, walking the trie
+        with one row of the Levenshtein matrix per node and pruning branches already too far.
+        Returns the smallest distance of each habit found.
+        """
+        typos = allowed_typos(word)
+        found = {}
+        stack = [(child, char, list(range(len(word) + 1)))
+                 for char, child in self._root.children.items()]
+        while stack:
+            node, char, previous = stack.pop()
+            row = [previous[0] + 1]
+            for i, word_char in enumerate(word, 1):
+                row.append(min(row[i - 1] + 1, previous[i] + 1,
+                               previous[i - 1] + (word_char != char)))
+            if row[-1] <= typos:
+                for habit_id in self._subtree(node):
+                    found[habit_id] = min(found.get(habit_id, row[-1]), row[-1])
+            # a longer prefix may still be closer than the distance found here
+            if min(row) < min(row[-1], typos + 1):
+                stack.extend((child, next_char, row) for next_char, child in node.children.items())
+        return found
+
+    def candidates(self, words, limit):
+        self.refresh()
+        if not words:
+            return []
+        with self._lock:
+            distances = [self._lookup(word) for word in words]
+            found = set.intersection(*(set(found) for found in distances))
+            closest = sorted(
+                found, key=lambda habit_id: (sum(d[habit_id] for d in distances), habit_id)
+            )
+            return [self._habits[habit_id] for habit_id in closest[:limit]]
+
+
+def install(connection):
+    """
+    Create the full-text index of habit names if the database supports one, indexing the
+    existing habits.
+
+    :param connection: The connection to run on, in a transaction.
+    :return: True if the database has the index.
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        options = connection.exec_driver_sql("PRAGMA compile_options").scalars().all()
+        if "ENABLE_FTS5" not in options:
+            return False
+        for statement in FTS5_DDL:
+            connection.exec_driver_sql(statement)
+        return True
+    if dialect == "mysql":
+        indexes = {index["name"] for index in inspect(connection).get_indexes("habit")}
+        if FULLTEXT_INDEX not in indexes:
+            connection.exec_driver_sql(
+                f"ALTER TABLE habit ADD FULLTEXT INDEX {FULLTEXT_INDEX} (name) WITH PARSER ngram"
+            )
+        return True
+    return False
+
+
+@event.listens_for(Habit.__table__, "after_create")
+def _after_create(target, connection, **kwargs):  # pylint: disable=unused-argument
+    install(connection)
+
+
+@event.listens_for(Habit.__table__, "before_drop")
+def _before_drop(target, connection, **kwargs):  # pylint: disable=unused-argument
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS habit_search_terms")
+        connection.exec_driver_sql("DROP TABLE IF EXISTS habit_search")
+
+
+def _choose_index(app):
+    if app.config.get("HABIT_SEARCH_BACKEND") != "trie":
+        engine = db.engine
+        if engine.dialect.name == "sqlite" and inspect(engine).has_table("habit_search"):
+            return Fts5HabitIndex()
+        if engine.dialect.name == "mysql" and FULLTEXT_INDEX in {
+            index["name"] for index in inspect(engine).get_indexes("habit")
+        }:
+            return FulltextHabitIndex()
+    return TrieHabitIndex()
+
+
+def habit_index():
+    """
+    Get the habit index of the current app, choosing it on first use from the database and
+    HABIT_SEARCH_BACKEND.
+
+    :return: The HabitIndex.
+    """
+    index = current_app.extensions.get("habit_index")
+    if index is None:
+        index = current_app.extensions["habit_index"] = _choose_index(current_app)
+    return index
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_names(session, flush_context):  # pylint: disable=unused-argument
+    changed = [obj for obj in session.new if isinstance(obj, Habit)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, Habit) and inspect(obj).attrs.name.history.has_changes()
+    ]
+    for obj in changed:
+        session.info.setdefault(_CHANGES, {})[obj.id] = HabitRow(obj.id, obj.user_id, obj.name)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _collect_bulk_users(orm_execute_state):
+    state = orm_execute_state
+    if state.is_insert and state.bind_mapper is inspect(Habit):
+        rows = state.parameters if isinstance(state.parameters, list) else [state.parameters]
+        state.session.info.setdefault(_BULK_USERS, set()).update(row["user_id"] for row in rows)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    changes = session.info.pop(_CHANGES, None)
+    bulk_users = session.info.pop(_BULK_USERS, None)
+    if (changes or bulk_users) and has_app_context():
+        index = current_app.extensions.get("habit_index")
+        if isinstance(index, TrieHabitIndex):
+            index.update((changes or {}).values())
+            index.invalidate(bulk_users or ())
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_CHANGES, None)
+    session.info.pop(_BULK_USERS, None)
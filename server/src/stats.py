@@ -0,0 +1,265 @@
+"""
+This module keeps per-user aggregates, served by GET /user/<id>/stats and
+GET /stats/leaderboard, in the user_stats table rather than computing them per request.
+
+Each user has one row counting their habits and check-in days, and holding the longest
+streak among their habits. The row is inserted in the transaction creating the user, and
+every flush that creates habits or records check-ins adds its deltas to the rows of their
+users with a single UPDATE, in the same transaction, so the counters commit or roll back
+with the changes they count. Habits inserted in bulk with an ORM-enabled INSERT, as
+User.bulk_create does, are counted once the INSERT has run.
+
+Writes that bypass the session, e.g. Core inserts into habit, are not counted. A
+reconciliation job recomputes the aggregates of every user, a chunk of users at a time,
+and repairs the rows that drifted, every STATS_RECONCILE_INTERVAL seconds.
+"""
+
+import collections
+import itertools
+import logging
+import threading
+import time
+from sqlalchemy import bindparam, case, event, func, inspect, insert, select, update
+from sqlalchemy.orm.util import identity_key
+from server.src.database import RoutingSession, db
+from server.src.models.helpers import bitmap_count
+from server.src.models.models import Habit, HabitCheckin, User
+
+# the metrics a leaderboard can rank users by
+METRICS = ("habit_count", "checkin_count", "longest_streak")
+RECONCILE_CHUNK = 1000
+# drifted user IDs logged per reconciliation
+MAX_LOGGED_DRIFTS = 20
+
+logger = logging.getLogger(__name__)
+
+
+class UserStats(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    The aggregates of one user.
+
+    Attributes:
+        user_id (int): The ID of the user.
+        habit_count (int): The number of habits of the user.
+        checkin_count (int): The number of days checked in, over every habit of the user.
+        longest_streak (int): The longest streak of any habit of the user.
+    """
+
+    __tablename__ = "user_stats"
+    # descending, so a leaderboard reads the top of an index in order
+    __table_args__ = tuple(
+        db.Index(f"ix_user_stats_{metric}", db.desc(metric), db.desc("user_id"))
+        for metric in METRICS
+    )
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), primary_key=True, autoincrement=False
+    )
+    habit_count = db.Column(db.Integer, nullable=False, default=0)
+    checkin_count = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_json(self):
+        """
+        Get the aggregates as a dict.
+
+        :return: A dict with the user_id and every metric.
+        """
+        return {"user_id": self.user_id, **{metric: getattr(self, metric) for metric in METRICS}}
+
+
+class _Deltas(collections.defaultdict):
+    """
+    The changes to add to the stats of each user, keyed by user ID.
+    """
+
+    def __init__(self):
+        super().__init__(lambda: {"habits": 0, "checkins": 0, "streak": 0})
+
+    def apply(self, connection):
+        """
+        Add the deltas to the stats rows, with one executemany UPDATE.
+        """
+        if not self:
+            return
+        table = UserStats.__table__
+        streak = bindparam("streak")
+        connection.execute(
+            update(table)
+            .where(table.c.user_id == bindparam("stats_user_id"))
+            .values(
+                habit_count=table.c.habit_count + bindparam("habits"),
+                checkin_count=table.c.checkin_count + bindparam("checkins"),
+                longest_streak=case(
+                    (table.c.longest_streak < streak, streak), else_=table.c.longest_streak
+                ),
+            ),
+            [{"stats_user_id": user_id, **delta} for user_id, delta in self.items()],
+        )
+
+
+def _user_of_habit(session, habit_id):
+    habit = session.identity_map.get(identity_key(Habit, habit_id))
+    if habit is not None:
+        return habit.user_id
+    return session.connection().scalar(select(Habit.user_id).where(Habit.id == habit_id))
+
+
+def _checkin_delta(checkin):
+    added, _, deleted = inspect(checkin).attrs.days.history
+    if not added:
+        return 0
+    return bitmap_count(added[0]) - (bitmap_count(deleted[0]) if deleted else 0)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _count_changes(session, flush_context):  # pylint: disable=unused-argument
+    connection = session.connection()
+    new_users = [obj.id for obj in session.new if isinstance(obj, User)]
+    if new_users:
+        connection.execute(
+            insert(UserStats.__table__),
+            [{"user_id": user_id, "habit_count": 0, "checkin_count": 0, "longest_streak": 0}
+             for user_id in new_users],
+        )
+
+    deltas = _Deltas()
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, Habit):
+            new = obj in session.new
+            if new:
+                deltas[obj.user_id]["habits"] += 1
+            if obj.longest_streak and (new or inspect(obj).attrs.longest_streak.history.added):
+                delta = deltas[obj.user_id]
+                delta["streak"] = max(delta["streak"], obj.longest_streak)
+        elif isinstance(obj, HabitCheckin):
+            count = _checkin_delta(obj)
+            if count:
+                deltas[_user_of_habit(session, obj.habit_id)]["checkins"] += count
+    deltas.apply(connection)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _count_inserted_habits(orm_execute_state):
+    state = orm_execute_state
+    if not (state.is_insert and state.bind_mapper is inspect(Habit)):
+        return None
+    rows = state.parameters if isinstance(state.parameters, list) else [state.parameters]
+    result = state.invoke_statement()
+    deltas = _Deltas()
+    for row in rows:
+        deltas[row["user_id"]]["habits"] += 1
+    deltas.apply(state.session.connection())
+    return result
+
+
+def _actual_stats(connection, user_ids):
+    """
+    Compute the aggregates of users from the habit and check-in tables.
+    """
+    stats = {
+        user_id: {"habit_count": 0, "checkin_count": 0, "longest_streak": 0}
+        for user_id in user_ids
+    }
+    habits = connection.execute(
+        select(
+            Habit.user_id,
+            func.count(Habit.id),  # pylint: disable=not-callable
+            func.max(Habit.longest_streak),
+        )
+        .where(Habit.user_id.in_(user_ids))
+        .group_by(Habit.user_id)
+    )
+    for user_id, habit_count, longest_streak in habits:
+        stats[user_id].update(habit_count=habit_count, longest_streak=longest_streak or 0)
+    checkins = connection.execute(
+        select(Habit.user_id, HabitCheckin.days)
+        .join(HabitCheckin, HabitCheckin.habit_id == Habit.id)
+        .where(Habit.user_id.in_(user_ids))
+    )
+    for user_id, days in checkins:
+        stats[user_id]["checkin_count"] += bitmap_count(days)
+    return stats
+
+
+def _repair(connection, user_id, stored, actual):
+    """
+    Overwrite a drifted row with the actual aggregates, unless a write changed the row since
+    it was read, in which case the next reconciliation checks it again.
+    """
+    table = UserStats.__table__
+    if stored is None:
+        connection.execute(insert(table).values(user_id=user_id, **actual))
+        return
+    connection.execute(
+        update(table)
+        .where(table.c.user_id == user_id,
+               *(table.c[metric] == stored[metric] for metric in METRICS))
+        .values(**actual)
+    )
+
+
+def reconcile(connection, chunk_size=RECONCILE_CHUNK, commit=False):
+    """
+    Recompute the aggregates of every user and repair the stats rows that drifted from them,
+    including missing ones.
+
+    :param connection: The connection to run on.
+    :param chunk_size: The number of users checked per round of queries.
+    :param commit: Whether to commit after every chunk, on a connection used without an
+                   explicit transaction.
+    :return: The IDs of the users whose stats had drifted.
+    """
+    table = UserStats.__table__
+    drifted = []
+    last_id = 0
+    while True:
+        user_ids = connection.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+        ).all()
+        if not user_ids:
+            return drifted
+        last_id = user_ids[-1]
+        stored = {
+            row.user_id: row._asdict()
+            for row in connection.execute(
+                select(table.c.user_id, *(table.c[metric] for metric in METRICS))
+                .where(table.c.user_id.in_(user_ids))
+            )
+        }
+        actual = _actual_stats(connection, user_ids)
+        for user_id in user_ids:
+            row = stored.get(user_id)
+            if row is None or any(row[metric] != actual[user_id][metric] for metric in METRICS):
+                _repair(connection, user_id, row, actual[user_id])
+                drifted.append(user_id)
+        if commit:
+            connection.commit()
+
+
+def _reconcile_forever(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context(), db.engine.connect() as connection:
+                drifted = reconcile(connection, commit=True)
+            if drifted:
+                logger.warning(
+                    "Repaired the drifted stats of %d users, e.g. %s",
+                    len(drifted), drifted[:MAX_LOGGED_DRIFTS],
+                )
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Reconciling user stats failed")
+
+
+def init_stats(app):
+    """
+    Start the thread reconciling the user stats if STATS_RECONCILE_INTERVAL is set.
+
+    :param app: The Flask app.
+    """
+    interval = float(app.config.get("STATS_RECONCILE_INTERVAL") or 0)
+    if interval > 0:
+        threading.Thread(
+            target=_reconcile_forever, args=(app, interval), name="stats-reconciler", daemon=True
+        ).start()
@@ -0,0 +1,364 @@
+"""
+This module serves the "today" view of each user from a precomputed snapshot.
+
+GET /user/<id>/today lists the user's habits with whether each was checked in on the
+current day in the user's time zone. Rather than being assembled from the user, habit and
+check-in tables on every read, the view is stored serialized in the today_snapshot table,
+one row per user, and served as is. Snapshots are kept current in three ways:
+
+- A scheduler thread rebuilds the stored snapshots whose day has ended, waking at the next
+  local midnight among the time zones in use, and every TODAY_SCHEDULER_INTERVAL seconds
+  at the latest.
+- Commits that create or change habits, check-ins included, patch the entries of those
+  habits in their user's snapshot right after committing, from the habit rows alone. A
+  user whose time zone changes has their snapshot dropped.
+- A read that finds no snapshot, or one from an earlier day, builds and stores it.
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import NotFound
+from server.src.database import RoutingSession, db
+from server.src.models.helpers import local_today, make_etag
+from server.src.models.models import Habit, User
+from server.src.models.serializers import dumps
+
+REBUILD_CHUNK = 500
+PATCH_ATTEMPTS = 3
+# seconds the scheduler sleeps past a local midnight, so that day has surely ended
+MIDNIGHT_SLACK = 1.0
+# session.info key of the habit changes flushed in the current transaction
+_CHANGES = "today_changes"
+
+logger = logging.getLogger(__name__)
+
+
+class TodaySnapshot(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    The serialized today view of one user, for one day.
+
+    Attributes:
+        user_id (int): The ID of the user.
+        day (date): The day of the view, in the user's time zone.
+        timezone (str): The time zone of the user when the view was built.
+        body (bytes): The view as JSON.
+        version (int): Incremented by every update, used for ETags and optimistic locking.
+    """
+
+    __tablename__ = "today_snapshot"
+    __table_args__ = (db.Index("ix_today_snapshot_timezone_day", "timezone", "day"),)
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), primary_key=True, autoincrement=False
+    )
+    day = db.Column(db.Date, nullable=False)
+    timezone = db.Column(db.String(64), nullable=False)
+    body = db.Column(db.LargeBinary, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class HabitState(NamedTuple):
+    """
+    The columns of a habit an entry of the today view is built from.
+    """
+
+    id: int
+    name: str
+    current_streak: int
+    longest_streak: int
+    last_checkin: Optional[object]
+
+    @staticmethod
+    def of(habit):
+        """
+        Get the state of a habit.
+
+        :param habit: The Habit.
+        :return: The HabitState.
+        """
+        return HabitState(
+            habit.id, habit.name, habit.current_streak, habit.longest_streak, habit.last_checkin
+        )
+
+
+def _entry(state, day, done=None):
+    """
+    Build the entry of a habit in the view of a day. Whether the habit was done that day
+    follows from last_checkin, unless the habit was checked in on a later day, in which
+    case done must be given or None is returned.
+    """
+    last = state.last_checkin
+    if last is not None and last > day:
+        if done is None:
+            return None
+    else:
+        done = last == day
+    alive = last is not None and last >= day - timedelta(days=1)
+    return {
+        "id": state.id,
+        "name": state.name,
+        "done": done,
+        "current_streak": state.current_streak if alive else 0,
+        "longest_streak": state.longest_streak,
+    }
+
+
+def _body(user_id, day, timezone_name, entries):
+    return dumps(
+        {"user_id": user_id, "date": day.isoformat(), "timezone": timezone_name,
+         "habits": entries}
+    )
+
+
+def rebuild(users, now=None):
+    """
+    Build the snapshots of users for their current day and add them to the session, without
+    committing.
+
+    :param users: The users, with their habits loaded.
+    :param now: The aware current time, defaults to the clock.
+    :return: A dict mapping the ID of each user to their TodaySnapshot.
+    """
+    snapshots = {
+        snapshot.user_id: snapshot
+        for snapshot in TodaySnapshot.query.filter(
+            TodaySnapshot.user_id.in_([user.id for user in users])
+        )
+    }
+    for user in users:
+        day = local_today(user.timezone, now)
+        entries = []
+        for habit in sorted(user.habits, key=lambda habit: habit.id):
+            state = HabitState.of(habit)
+            entry = _entry(state, day)
+            if entry is None:
+                entry = _entry(state, day, done=bool(habit.history(day, day)))
+            entries.append(entry)
+        snapshot = snapshots.get(user.id)
+        if snapshot is None:
+            snapshot = snapshots[user.id] = TodaySnapshot(user_id=user.id)
+            db.session.add(snapshot)
+        snapshot.day = day
+        snapshot.timezone = user.timezone
+        snapshot.body = _body(user.id, day, user.timezone, entries)
+    return snapshots
+
+
+def today_snapshot(user_id, now=None):
+    """
+    Get the today view of a user, building and storing it if it is missing or from an
+    earlier day.
+
+    :param user_id: The ID of the user.
+    :param now: The aware current time, defaults to the clock.
+    :return: The view as JSON, and its ETag, or None if another request stored the
+             snapshot at the same time.
+    :raises NotFound: If the user does not exist.
+    """
+    snapshot = db.session.get(TodaySnapshot, user_id)
+    if snapshot is not None and snapshot.day == local_today(snapshot.timezone, now):
+        return snapshot.body, make_etag(user_id, snapshot.day, snapshot.version)
+
+    user = User.query.options(selectinload(User.habits)).filter_by(id=user_id).first()
+    if user is None:
+        raise NotFound("User not found")
+    snapshot = rebuild([user], now)[user_id]
+    body = snapshot.body
+    try:
+        db.session.flush()
+        etag = make_etag(user_id, snapshot.day, snapshot.version)
+        db.session.commit()
+    except (IntegrityError, StaleDataError):
+        # another request stored or patched the snapshot first, serve this one unstored
+        db.session.rollback()
+        etag = None
+    return body, etag
+
+
+def _patched_body(body, states, day):
+    view = json.loads(body)
+    entries = {entry["id"]: entry for entry in view["habits"]}
+    for state in states:
+        entry = _entry(state, day)
+        if entry is None:
+            return None
+        entries[state.id] = entry
+    view["habits"] = [entries[habit_id] for habit_id in sorted(entries)]
+    return dumps(view)
+
+
+def _patch(connection, user_id, states):
+    """
+    Replace the entries of the given habits in a user's snapshot, retrying if another
+    commit patched it meanwhile. The snapshot is dropped, to be rebuilt by the next read,
+    if states is None or the entries cannot be built from the habit rows alone.
+    """
+    table = TodaySnapshot.__table__
+    for _ in range(PATCH_ATTEMPTS):
+        with connection.begin():
+            row = connection.execute(
+                select(table.c.day, table.c.version, table.c.body)
+                .where(table.c.user_id == user_id)
+            ).first()
+            if row is None:
+                return
+            body = None if states is None else _patched_body(row.body, states, row.day)
+            if body is None:
+                break
+            result = connection.execute(
+                update(table)
+                .where(table.c.user_id == user_id, table.c.version == row.version)
+                .values(body=body, version=row.version + 1)
+            )
+            if result.rowcount == 1:
+                return
+    with connection.begin():
+        connection.execute(delete(table).where(table.c.user_id == user_id))
+
+
+def patch_snapshots(changes):
+    """
+    Patch the snapshots of the users whose habits changed.
+
+    :param changes: A dict mapping user IDs to a dict of the HabitState of each changed
+                    habit by ID, or to None to drop the user's snapshot.
+    """
+    try:
+        with db.engine.connect() as connection:
+            for user_id, habits in changes.items():
+                _patch(connection, user_id, None if habits is None else habits.values())
+    except SQLAlchemyError:
+        logger.exception("Patching the today snapshots of users %s failed", sorted(changes))
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_changes(session, flush_context):  # pylint: disable=unused-argument
+    changes = session.info.setdefault(_CHANGES, {})
+    # users created in this transaction have no snapshot to patch yet
+    new_users = {obj.id for obj in session.new if isinstance(obj, User)}
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, Habit) and obj.user_id not in new_users:
+            habits = changes.setdefault(obj.user_id, {})
+            if habits is not None:
+                habits[obj.id] = HabitState.of(obj)
+    for obj in session.dirty:
+        if isinstance(obj, User) and inspect(obj).attrs.timezone.history.has_changes():
+            changes[obj.id] = None
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    changes = session.info.pop(_CHANGES, None)
+    if changes:
+        patch_snapshots(changes)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_CHANGES, None)
+
+
+class TodayScheduler:
+    """
+    Rebuilds the stored snapshots whose day has ended in their time zone.
+    """
+
+    def __init__(self, interval, clock=None):
+        """
+        :param interval: The longest time in seconds between two runs.
+        :param clock: Function returning the aware current time, defaults to the clock.
+        """
+        self.interval = interval
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+
+    @staticmethod
+    def _timezones():
+        return db.session.scalars(select(TodaySnapshot.timezone).distinct()).all()
+
+    def run_due(self):
+        """
+        Rebuild every stored snapshot from an earlier day than today in its time zone,
+        committing every REBUILD_CHUNK users.
+
+        :return: The number of snapshots rebuilt.
+        """
+        now = self.clock()
+        rebuilt = 0
+        for timezone_name in self._timezones():
+            due = db.session.scalars(
+                select(TodaySnapshot.user_id).where(
+                    TodaySnapshot.timezone == timezone_name,
+                    TodaySnapshot.day < local_today(timezone_name, now),
+                )
+            ).all()
+            for start in range(0, len(due), REBUILD_CHUNK):
+                users = User.query.options(selectinload(User.habits)).filter(
+                    User.id.in_(due[start : start + REBUILD_CHUNK])
+                ).all()
+                rebuild(users, now)
+                try:
+                    db.session.commit()
+                    rebuilt += len(users)
+                except (IntegrityError, StaleDataError):
+                    # patched meanwhile, the next run or read rebuilds them
+                    db.session.rollback()
+        return rebuilt
+
+    def seconds_until_next(self):
+        """
+        Get the time to sleep until the next local midnight among the time zones in use,
+        or the interval if that is sooner.
+
+        :return: The number of seconds.
+        """
+        now = self.clock()
+        delay = self.interval
+        for timezone_name in self._timezones():
+            zone = ZoneInfo(timezone_name)
+            midnight = datetime.combine(
+                now.astimezone(zone).date() + timedelta(days=1), datetime.min.time(), zone
+            )
+            delay = min(delay, (midnight - now).total_seconds() + MIDNIGHT_SLACK)
+        return max(delay, MIDNIGHT_SLACK)
+
+
+def _schedule_forever(app, scheduler):
+    while True:
+        delay = scheduler.interval
+        try:
+            with app.app_context():
+                rebuilt = scheduler.run_due()
+                delay = scheduler.seconds_until_next()
+            if rebuilt:
+                logger.info("Rebuilt %d today snapshots", rebuilt)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Rebuilding today snapshots failed")
+        time.sleep(delay)
+
+
+def init_today(app):
+    """
+    Start the scheduler thread rebuilding the today snapshots if TODAY_SCHEDULER_INTERVAL
+    is set.
+
+    :param app: The Flask app.
+    """
+    interval = float(app.config.get("TODAY_SCHEDULER_INTERVAL") or 0)
+    if interval > 0:
+        scheduler = TodayScheduler(interval)
+        app.extensions["today_scheduler"] = scheduler
+        threading.Thread(
+            target=_schedule_forever, args=(app, scheduler), name="today-scheduler", daemon=True
+        ).start()
@@ -0,0 +1,186 @@
+#pylint: skip-file
+import json
+import pytest
+from server.src.backup import ImportCheckpoint, export_lines, import_lines
+from server.src.database import db
+from server.src.models.models import Habit, User
+from server.src.passwords import is_password_hash, verify_password
+
+USERS = [
+    {"name": f"user{n}", "email": f"user{n}@example.com", "password": "pw",
+     "habits": [{"name": "Read"}, {"name": "Run"}]}
+    for n in range(3)
+]
+TOKEN = {"Authorization": "Bearer secret"}
+NDJSON = {**TOKEN, "Content-Type": "application/x-ndjson"}
+
+
+@pytest.fixture(autouse=True)
+def backup_token(app):
+    app.config["BACKUP_TOKEN"] = "secret"
+
+@pytest.fixture
+def users(client):
+    client.post("/users/bulk", json=USERS)
+    client.post("/user/1/habit/1/checkin", json={"date": "2023-12-31"})
+    client.post("/user/1/habit/1/checkin", json={"date": "2024-01-01"})
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data().splitlines()]
+
+def _body(records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+def test_export_streams_every_user(client, users):
+    # Act
+    response = client.get("/export", headers=TOKEN)
+    # Assert
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    records = _lines(response)
+    assert [record["email"] for record in records] == [user["email"] for user in USERS]
+    assert records[0]["habits"][0] == {
+        "name": "Read", "current_streak": 2, "longest_streak": 2, "last_checkin": "2024-01-01",
+        "checkins": [{"year": 2023, "days": records[0]["habits"][0]["checkins"][0]["days"]},
+                     {"year": 2024, "days": "AQ" + "A" * 60 + "=="}],
+    }
+    assert records[0]["habits"][1] == {"name": "Run", "current_streak": 0, "longest_streak": 0}
+    assert "password" not in records[0]
+
+def test_export_includes_password_hashes_when_asked(client, users):
+    records = _lines(client.get("/export?include_passwords=true", headers=TOKEN))
+    assert all(record["password"].startswith("scrypt$") for record in records)
+
+def test_backups_are_disabled_without_a_token(app, client, users):
+    # Arrange
+    app.config["BACKUP_TOKEN"] = None
+    # Act
+    response = client.get("/export", headers=TOKEN)
+    # Assert
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Backups are not enabled"}
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"},
+                                     {"Authorization": "Basic c2VjcmV0Og=="}])
+def test_backups_require_the_token(client, users, headers):
+    # Act
+    responses = [
+        client.get("/export", headers=headers),
+        client.post("/import", data=_body(USERS),
+                    headers={"Content-Type": "application/x-ndjson", **headers}),
+    ]
+    # Assert
+    assert [response.status_code for response in responses] == [403, 403]
+    assert responses[0].get_json() == {"error": "A valid backup token is required"}
+
+def test_export_reads_a_chunk_at_a_time(app_context, client, users, statements):
+    # Act
+    chunks = list(export_lines(chunk_size=2))
+    # Assert
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 1]
+    # users, habits and check-ins per chunk, and the empty chunk ending the export
+    assert len(statements) == 7
+    assert not db.session.identity_map
+
+def test_import_round_trips_an_export(app, client, users):
+    # Arrange
+    exported = client.get("/export?include_passwords=true", headers=TOKEN).get_data()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    # Act
+    response = client.post("/import?import_id=restore", data=exported, headers=NDJSON)
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "import_id": "restore", "resumed_from": 0, "lines": 3, "created": 3, "failed": 0,
+        "errors": [],
+    }
+    assert client.get("/export?include_passwords=true", headers=TOKEN).get_data() == exported
+    history = client.get("/user/1/habit/1/history?from=2023-12-30&to=2024-01-02").get_json()
+    assert history["days"] == ["2023-12-31", "2024-01-01"]
+
+def test_import_hashes_plain_text_passwords(app, client):
+    # Act
+    client.post("/import", data=_body(USERS[:1]), headers=NDJSON)
+    # Assert
+    with app.app_context():
+        user = User.query.one()
+        assert verify_password("pw", user.password)
+        assert [habit.name for habit in user.habits] == ["Read", "Run"]
+
+def test_import_without_password_sets_one_that_never_matches(app, client):
+    # Act
+    client.post("/import", data=_body([{"name": "x", "email": "x@example.com"}]), headers=NDJSON)
+    # Assert
+    with app.app_context():
+        stored = User.query.one().password
+        assert is_password_hash(stored)
+        assert not verify_password("", stored)
+
+def test_import_reports_invalid_lines(client):
+    # Arrange
+    body = "\n".join([
+        json.dumps(USERS[0]),
+        "not json",
+        "",
+        json.dumps({"name": "x", "password": "pw"}),
+        json.dumps({**USERS[1], "habits": [{"name": "Read", "checkins": [{"year": 2024, "days": "AA=="}]}]}),
+        json.dumps({**USERS[2], "email": USERS[0]["email"]}),
+    ])
+    # Act
+    response = client.post("/import", data=body, headers=NDJSON)
+    # Assert
+    assert response.status_code == 207
+    summary = response.get_json()
+    assert (summary["lines"], summary["created"], summary["failed"]) == (6, 1, 4)
+    assert summary["errors"] == [
+        {"line": 2, "error": "Invalid JSON"},
+        {"line": 4, "error": "Missing mandatory fields: email"},
+        {"line": 5, "error": "habits[0].checkins[0].days must encode 46 bytes"},
+        {"line": 6, "error": "Email is already in use"},
+    ]
+
+def test_import_resumes_after_the_last_committed_batch(app_context):
+    # Arrange
+    lines = [json.dumps(user) + "\n" for user in USERS]
+
+    def interrupted():
+        yield from lines[:2]
+        raise ConnectionError("client went away")
+
+    with pytest.raises(ConnectionError):
+        import_lines(interrupted(), "resume", batch_size=1)
+    # Act
+    summary = import_lines(lines, "resume", batch_size=1)
+    # Assert
+    assert (summary["resumed_from"], summary["lines"], summary["created"]) == (2, 3, 1)
+    assert [user.email for user in User.query.order_by(User.id)] \
+        == [user["email"] for user in USERS]
+    checkpoint = db.session.get(ImportCheckpoint, "resume")
+    assert (checkpoint.lines, checkpoint.created) == (3, 3)
+
+def test_import_commits_every_batch(app_context, monkeypatch):
+    # Arrange
+    commits = []
+    commit = db.session.commit
+
+    def counting_commit():
+        commits.append(User.query.count())
+        commit()
+
+    monkeypatch.setattr(db.session, "commit", counting_commit)
+    # Act
+    import_lines([json.dumps(user) for user in USERS], "batches", batch_size=2)
+    # Assert
+    assert commits == [2, 3]
+    assert Habit.query.count() == 6
+
+def test_import_requires_ndjson(client):
+    response = client.post("/import", json=USERS, headers=TOKEN)
+    assert response.status_code == 415
+    assert response.get_json() == {"error": "The body must be application/x-ndjson"}
+
+def test_import_id_length_is_capped(client):
+    response = client.post(f"/import?import_id={'x' * 65}", data="", headers=NDJSON)
+    assert response.status_code == 400
@@ -0,0 +1,33 @@
+#pylint: skip-file
+from server.benchmarks.endpoint_bench import SCENARIOS, check_coverage
+from server.benchmarks.stats import find_regressions, percentile, summarize
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) == 0.0
+
+def test_summarize():
+    summary = summarize([0.001, 0.002, 0.003, 0.004], elapsed=0.5)
+    assert summary["requests"] == 4
+    assert summary["throughput"] == 8
+    assert summary["p50_ms"] == 2
+    assert summary["p99_ms"] == 4
+
+def test_find_regressions():
+    baseline = {"a": {"p95_ms": 10, "throughput": 100}, "b": {"p95_ms": 10, "throughput": 100}}
+    results = {
+        "a": {"p95_ms": 11, "throughput": 95},
+        "b": {"p95_ms": 13, "throughput": 70},
+        "new": {"p95_ms": 50, "throughput": 1},
+    }
+    assert find_regressions(results, baseline, threshold=0.2) == [
+        "b: p95 13.00 ms vs baseline 10.00 ms",
+        "b: throughput 70/s vs baseline 100/s",
+    ]
+
+def test_every_user_controller_route_has_a_benchmark(app):
+    assert check_coverage(app) == []
@@ -0,0 +1,125 @@
+#pylint: skip-file
+import threading
+import pytest
+from server.src.cache import CacheBackend, LRUCache, NullCache, UserCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _read_through(cache, user_id, include, loader):
+    key = cache.key(user_id, include)
+    entry = cache.lookup(key)
+    if entry is None:
+        entry = loader()
+        if entry is not None:
+            cache.store(key, entry)
+    return entry
+
+def test_incomplete_backend_fails_on_creation():
+    class GetOnlyCache(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyCache()
+
+def test_lru_cache_hit_and_miss():
+    cache = LRUCache(max_entries=2, ttl=10)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_cache_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["size"] == 1
+
+def test_lru_cache_delete():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+
+def test_lru_cache_is_thread_safe():
+    cache = LRUCache(max_entries=50)
+
+    def work(offset):
+        for i in range(2000):
+            cache.set(i % 100 + offset, i)
+            cache.get(i % 100)
+
+    threads = [threading.Thread(target=work, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["size"] == 50
+    assert stats["hits"] + stats["misses"] == 8000
+
+def test_user_cache_reads_through_once():
+    cache = UserCache(LRUCache())
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"id": 1}
+
+    assert _read_through(cache, 1, frozenset(), loader) == {"id": 1}
+    assert _read_through(cache, 1, frozenset(), loader) == {"id": 1}
+    assert len(calls) == 1
+
+def test_user_cache_keys_by_include():
+    cache = UserCache(LRUCache())
+    _read_through(cache, 1, frozenset(), lambda: {"id": 1})
+    assert _read_through(cache, 1, frozenset({"habits"}), lambda: {"id": 1, "habits": []}) == {"id": 1, "habits": []}
+
+def test_user_cache_does_not_cache_missing_users():
+    cache = UserCache(LRUCache())
+    assert _read_through(cache, 1, frozenset(), lambda: None) is None
+    assert _read_through(cache, 1, frozenset(), lambda: {"id": 1}) == {"id": 1}
+
+def test_user_cache_invalidate_bumps_version():
+    cache = UserCache(LRUCache())
+    _read_through(cache, 1, frozenset(), lambda: {"id": 1, "username": "old"})
+    cache.invalidate(1)
+    assert _read_through(cache, 1, frozenset(), lambda: {"id": 1, "username": "new"})["username"] == "new"
+
+def test_user_cache_with_null_backend_always_loads():
+    cache = UserCache(NullCache())
+    _read_through(cache, 1, frozenset(), lambda: {"id": 1})
+    assert _read_through(cache, 1, frozenset(), lambda: {"id": 2}) == {"id": 2}
+    assert cache.stats()["misses"] == 2
+
+def test_user_cache_does_not_count_version_tokens():
+    # Arrange
+    cache = UserCache(LRUCache())
+    # Act
+    for _ in range(3):
+        _read_through(cache, 1, frozenset(), lambda: {"id": 1})
+    # Assert
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
@@ -0,0 +1,89 @@
+#pylint: skip-file
+import json
+from server.src.app import create_app
+from server.src.database import db
+from server.benchmarks.replay import read_requests, replay, route_of, client_sender
+
+
+def _capturing_app(path, database_uri="sqlite:///:memory:"):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": database_uri,
+        "TRAFFIC_CAPTURE_PATH": str(path),
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_capture_records_requests_as_jsonl_with_redaction(tmp_path):
+    # Arrange
+    path = tmp_path / "traffic.jsonl"
+    app = _capturing_app(path)
+    client = app.test_client()
+    # Act
+    client.post("/user", json={"name": "a", "email": "a@example.com", "password": "secret"})
+    client.get("/user/1?include=habits")
+    client.get("/users")
+    client.get("/user?email=a@example.com&fields=id,username&password=secret")
+    app.extensions["traffic_recorder"].close()
+    # Assert
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(r["method"], r["path"], r["status"]) for r in records] == [
+        ("POST", "/user", 201),
+        ("GET", "/user/1?include=habits", 200),
+        ("GET", "/users", 200),
+        ("GET", "/user?email=[REDACTED]&fields=id,username&password=[REDACTED]", 200),
+    ]
+    assert records[0]["body"]["password"] == "[REDACTED]"
+    assert records[1]["body"] is None
+
+def test_capture_is_disabled_by_default(app):
+    assert "traffic_recorder" not in app.extensions
+
+def test_read_requests_skips_malformed_lines():
+    lines = ['{"method": "get", "path": "/users"}', "", "nope", '{"path": "/x"}',
+             '{"method": "POST", "path": "/user", "body": {"name": "a"}}']
+    assert list(read_requests(lines)) == [
+        ("GET", "/users", None),
+        ("POST", "/user", {"name": "a"}),
+    ]
+
+def test_route_of_groups_ids():
+    assert route_of("PUT", "/user/12/habit/7?x=1") == "PUT /user/<id>/habit/<id>"
+    assert route_of("GET", "/users") == "GET /users"
+
+def test_replay_captured_traffic_through_the_test_client(tmp_path):
+    # Arrange
+    path = tmp_path / "traffic.jsonl"
+    app = _capturing_app(path)
+    client = app.test_client()
+    client.post("/user", json={"name": "a", "email": "a@example.com", "password": "secret"})
+    for _ in range(3):
+        client.get("/user/1")
+    client.get("/user/999")
+    app.extensions["traffic_recorder"].close()
+    # a file database, the workers would otherwise share one in-memory connection
+    target_app = _capturing_app(
+        tmp_path / "replayed.jsonl", f"sqlite:///{tmp_path / 'replayed.db'}"
+    )
+    # Act
+    with open(path) as lines:
+        report, elapsed = replay(read_requests(lines), client_sender(target_app), workers=2)
+    # Assert
+    assert report["POST /user"]["statuses"] == {201: 1}
+    assert report["GET /user/<id>"]["requests"] == 4
+    assert sum(report["GET /user/<id>"]["statuses"].values()) == 4
+    assert elapsed > 0
+
+def test_replay_respects_limit_and_rate(tmp_path):
+    sent = []
+
+    def send(method, path, body):
+        sent.append(path)
+        return 200
+
+    requests = (("GET", f"/user/{i}", None) for i in range(100))
+    report, elapsed = replay(requests, send, workers=2, rate=100, limit=10)
+    assert len(sent) == 10
+    assert report["GET /user/<id>"]["statuses"] == {200: 10}
+    assert elapsed >= 0.09
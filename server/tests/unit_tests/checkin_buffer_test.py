@@ -0,0 +1,115 @@
+#pylint: skip-file
+import time
+import pytest
+from datetime import date
+from server.src.app import create_app
+from server.src.checkin_buffer import CheckinBuffer
+from server.src.database import db
+from server.src.models.models import Habit
+
+
+@pytest.fixture
+def app(tmp_path):
+    # a file database, so the flusher thread gets its own connection
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'checkins.db'}",
+        "PASSWORD_HASH_COST": 4,
+        "CHECKIN_WRITE_BEHIND": True,
+        "CHECKIN_FLUSH_INTERVAL_MS": 60000,
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    app.extensions["checkin_buffer"].close()
+    with app.app_context():
+        db.engine.dispose()
+
+def _history(client, habit_url):
+    return client.get(f"{habit_url}/history?from=2024-03-01&to=2024-03-10").get_json()
+
+def test_check_in_is_acknowledged_before_it_is_written(app, client, habit_url):
+    # Act
+    response = client.post(f"{habit_url}/checkin", json={"date": "2024-03-10"})
+    # Assert
+    assert response.status_code == 202
+    assert response.get_json() == {"habit_id": 1, "date": "2024-03-10"}
+    assert _history(client, habit_url)["days"] == []
+    assert app.extensions["checkin_buffer"].flush(5)
+    assert _history(client, habit_url)["days"] == ["2024-03-10"]
+
+def test_flush_coalesces_duplicates_and_updates_streaks(app, client, habit_url):
+    # Arrange
+    for day in ("2024-03-08", "2024-03-09", "2024-03-09", "2024-03-10", "2024-03-10"):
+        client.post(f"{habit_url}/checkin", json={"date": day})
+    buffer = app.extensions["checkin_buffer"]
+    # Act
+    buffer.flush(5)
+    # Assert
+    assert _history(client, habit_url)["longest_streak"] == 3
+    stats = buffer.stats()
+    assert stats["events"] == {
+        "queued": 5, "coalesced": 2, "rejected": 0, "written": 3, "failed": 0
+    }
+    assert stats["flush_count"] == 1
+
+def test_full_batch_is_written_without_waiting_for_the_interval(app, client, habit_url):
+    # Arrange
+    buffer = app.extensions["checkin_buffer"]
+    buffer.batch_size = 2
+    # Act
+    client.post(f"{habit_url}/checkin", json={"date": "2024-03-09"})
+    client.post(f"{habit_url}/checkin", json={"date": "2024-03-10"})
+    deadline = time.monotonic() + 5
+    while buffer.stats()["flush_count"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Assert
+    assert _history(client, habit_url)["days"] == ["2024-03-09", "2024-03-10"]
+
+def test_close_writes_the_queued_check_ins(app, client, habit_url):
+    # Arrange
+    client.post(f"{habit_url}/checkin", json={"date": "2024-03-10"})
+    buffer = app.extensions["checkin_buffer"]
+    # Act
+    buffer.close()
+    # Assert
+    assert _history(client, habit_url)["days"] == ["2024-03-10"]
+    assert not buffer.put(1, date(2024, 3, 9))
+
+def test_full_queue_rejects_check_ins(app, client, habit_url):
+    # Arrange
+    app.extensions["checkin_buffer"].close()
+    app.extensions["checkin_buffer"] = CheckinBuffer(app, max_size=1, enqueue_timeout=0.01)
+    # Act
+    responses = [client.post(f"{habit_url}/checkin", json={"date": "2024-03-10"})
+                 for _ in range(2)]
+    # Assert
+    assert [response.status_code for response in responses] == [202, 503]
+    assert responses[1].headers["Retry-After"] == "1"
+    assert responses[1].get_json() == {
+        "error": "Too many check-ins are waiting to be written, retry later"
+    }
+    assert app.extensions["checkin_buffer"].stats()["events"]["rejected"] == 1
+
+def test_unknown_habit_is_refused_before_queueing(app, client, habit_url):
+    response = client.post("/user/1/habit/99/checkin")
+    assert response.status_code == 404
+    assert app.extensions["checkin_buffer"].stats()["events"]["queued"] == 0
+
+def test_check_in_many_skips_missing_habits(app, client, habit_url):
+    # Arrange
+    days = {1: {date(2024, 3, 9), date(2024, 3, 10)}, 2: {date(2024, 3, 10)}, 99: {date(2024, 3, 10)}}
+    with app.app_context():
+        # Act
+        changed = Habit.check_in_many(days)
+        # Assert
+        assert changed == {1}
+        assert [(habit.id, habit.current_streak) for habit in Habit.query.order_by(Habit.id)] \
+            == [(1, 2), (2, 1)]
+
+def test_metrics_expose_the_queue(app, client, habit_url):
+    client.post(f"{habit_url}/checkin", json={"date": "2024-03-10"})
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "dailies_checkin_queue_depth" in body
+    assert 'dailies_checkin_events_total{event="queued"} 1' in body
+    assert "dailies_checkin_flush_seconds_count" in body
@@ -0,0 +1,68 @@
+#pylint: skip-file
+import pytest
+from sqlalchemy import event
+from server.src.app import create_app
+from server.src.database import db
+
+
+@pytest.fixture
+def app_config():
+    # settings added to the test configuration, override it in a test module to change them
+    return {}
+
+@pytest.fixture
+def app(app_config):
+    test_config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": 'sqlite:///:memory:',  # use an in-memory SQLite database
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "PASSWORD_HASH_COST": 4,  # keep hashing cheap in tests
+        **app_config,
+    }
+
+    app = create_app(test_config)  # pass test configuration
+
+    with app.app_context():
+        db.create_all()
+
+    yield app  # yield the app context for tests
+
+    with app.app_context():
+        db.drop_all()  # clean up after tests
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user_data():
+    # the user created by the user_id fixture, override it in a test module to change its fields
+    return {"name": "user", "email": "user@example.com", "password": "pw",
+            "habits": [{"name": "Read"}, {"name": "Run"}]}
+
+@pytest.fixture
+def user_id(client, user_data):
+    return client.post("/user", json=user_data).get_json()["id"]
+
+@pytest.fixture
+def habit_url(user_id):
+    # the URL of the first habit of the user, "Read"
+    return f"/user/{user_id}/habit/1"
+
+@pytest.fixture
+def statements(app_context):
+    # records every SQL statement sent to the database while the test runs
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
@@ -0,0 +1,36 @@
+#pylint: skip-file
+import pytest
+
+
+def test_search_habits(client, user_id):
+    # Act
+    response = client.get("/habits/search?q=reed")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {"data": [{"id": 1, "name": "Read", "user_id": user_id}]}
+
+def test_search_habits_limit(client, user_id, user_data):
+    client.post("/user", json={**user_data, "email": "other@example.com"})
+    response = client.get("/habits/search?q=read&limit=1")
+    assert response.get_json()["data"] == [{"id": 1, "name": "Read", "user_id": user_id}]
+
+def test_search_user_habits(client, user_id, user_data):
+    # Arrange
+    other = {**user_data, "email": "other@example.com"}
+    other_id = client.post("/user", json=other).get_json()["id"]
+    # Act
+    response = client.get(f"/user/{other_id}/habits/search?q=run")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {"data": [{"id": 4, "name": "Run", "user_id": other_id}]}
+
+def test_search_habits_of_unknown_user(client):
+    response = client.get("/user/99/habits/search?q=run")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
+
+@pytest.mark.parametrize("query", ["", "ab", "x" * 81])
+def test_search_rejects_short_and_long_queries(client, query):
+    response = client.get(f"/habits/search?q={query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "q must be between 3 and 80 characters"}
@@ -0,0 +1,52 @@
+#pylint: skip-file
+import pytest
+
+
+@pytest.fixture
+def other_id(client, user_data):
+    # a second user, with a single habit checked in once
+    other = {**user_data, "name": "other", "email": "other@example.com",
+             "habits": [{"name": "Swim"}]}
+    other_id = client.post("/user", json=other).get_json()["id"]
+    client.post(f"/user/{other_id}/habit/3/checkin", json={"date": "2024-03-10"})
+    return other_id
+
+def test_user_stats(client, user_id):
+    # Arrange
+    client.post(f"/user/{user_id}/habit/1/checkin", json={"date": "2024-03-10"})
+    # Act
+    response = client.get(f"/user/{user_id}/stats")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "user_id": user_id, "habit_count": 2, "checkin_count": 1, "longest_streak": 1
+    }
+
+def test_stats_of_unknown_user(client):
+    response = client.get("/user/99/stats")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
+
+def test_leaderboard_ranks_users_by_metric(client, user_id, other_id):
+    # Act
+    by_habits = client.get("/stats/leaderboard?limit=2").get_json()
+    by_checkins = client.get("/stats/leaderboard?metric=checkin_count&limit=1").get_json()
+    # Assert
+    assert by_habits == {"metric": "habit_count", "data": [
+        {"rank": 1, "user_id": user_id, "name": "user", "value": 2},
+        {"rank": 2, "user_id": other_id, "name": "other", "value": 1},
+    ]}
+    assert by_checkins["data"] == [{"rank": 1, "user_id": other_id, "name": "other", "value": 1}]
+
+def test_leaderboard_does_not_aggregate_habits(client, user_id, other_id, statements):
+    statements.clear()
+    client.get("/stats/leaderboard")
+    assert len(statements) == 1
+    assert "habit" not in statements[0].replace("habit_count", "")
+
+def test_leaderboard_rejects_unknown_metrics(client):
+    response = client.get("/stats/leaderboard?metric=friends")
+    assert response.status_code == 400
+    assert response.get_json() == {
+        "error": "metric must be one of habit_count, checkin_count, longest_streak"
+    }
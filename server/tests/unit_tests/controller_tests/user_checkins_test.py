@@ -0,0 +1,135 @@
+#pylint: skip-file
+import pytest
+from datetime import date, timedelta
+from unittest.mock import patch
+from server.src.database import db
+from server.src.models.models import HabitCheckin
+
+TODAY = date(2024, 3, 10)
+
+
+@pytest.fixture(autouse=True)
+def fixed_today():
+    with patch("server.src.controllers.user_controller.local_today", return_value=TODAY) as today:
+        yield today
+
+def _check_in(client, habit_url, *days_ago):
+    return [
+        client.post(f"{habit_url}/checkin", json={"date": str(TODAY - timedelta(days=n))})
+        for n in days_ago
+    ]
+
+def test_check_in_defaults_to_today(client, habit_url, fixed_today):
+    # Act
+    response = client.post(f"{habit_url}/checkin")
+    # Assert
+    assert response.status_code == 201
+    assert response.get_json()["date"] == "2024-03-10"
+    assert response.get_json()["current_streak"] == 1
+    fixed_today.assert_called_once_with("UTC")
+
+def test_check_in_defaults_to_the_local_day_of_the_user(client, user_data, fixed_today):
+    user_id = client.post("/user", json={**user_data, "timezone": "Asia/Tokyo"}).get_json()["id"]
+    client.post(f"/user/{user_id}/habit/1/checkin")
+    fixed_today.assert_called_once_with("Asia/Tokyo")
+
+def test_check_in_twice_is_not_recorded_again(client, habit_url):
+    responses = _check_in(client, habit_url, 0, 0)
+    assert [response.status_code for response in responses] == [201, 200]
+    assert responses[1].get_json()["longest_streak"] == 1
+
+def test_consecutive_days_extend_the_streak(client, habit_url):
+    responses = _check_in(client, habit_url, 3, 2, 1, 0)
+    assert responses[-1].get_json() == {
+        "habit_id": 1, "date": "2024-03-10",
+        "current_streak": 4, "longest_streak": 4, "last_checkin": "2024-03-10",
+    }
+
+def test_gap_restarts_the_streak(client, habit_url):
+    response = _check_in(client, habit_url, 5, 4, 3, 0)[-1].get_json()
+    assert (response["current_streak"], response["longest_streak"]) == (1, 3)
+
+def test_backfill_joins_runs(client, habit_url):
+    # Arrange
+    _check_in(client, habit_url, 6, 5, 3, 2, 1, 0)
+    # Act
+    response = _check_in(client, habit_url, 4)[0].get_json()
+    # Assert
+    assert (response["current_streak"], response["longest_streak"]) == (7, 7)
+
+def test_backfill_before_the_current_run(client, habit_url):
+    _check_in(client, habit_url, 10, 9, 1, 0)
+    response = _check_in(client, habit_url, 8)[0].get_json()
+    assert (response["current_streak"], response["longest_streak"]) == (2, 3)
+
+def test_streak_is_broken_when_yesterday_was_missed(client, habit_url):
+    _check_in(client, habit_url, 5, 4, 3)
+    response = client.get(f"{habit_url}/history")
+    assert (response.get_json()["current_streak"], response.get_json()["longest_streak"]) == (0, 3)
+
+def test_streak_across_new_year(client, habit_url):
+    responses = _check_in(client, habit_url, *range(75, 65, -1))
+    assert responses[-1].get_json()["longest_streak"] == 10
+
+def test_one_row_per_year(app, client, habit_url):
+    # Act
+    _check_in(client, habit_url, 0, 1, 2, 365)
+    # Assert
+    with app.app_context():
+        assert [row.year for row in HabitCheckin.query.order_by(HabitCheckin.year)] == [2023, 2024]
+
+def test_history_lists_the_days_in_range(client, habit_url):
+    # Arrange
+    _check_in(client, habit_url, 0, 2, 70, 400)
+    # Act
+    response = client.get(f"{habit_url}/history?from=2023-12-01&to=2024-03-09")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json()["days"] == ["2023-12-31", "2024-03-08"]
+    assert response.get_json()["from"] == "2023-12-01"
+
+def test_history_defaults_to_the_last_30_days(client, habit_url):
+    _check_in(client, habit_url, 0, 29, 30)
+    response = client.get(f"{habit_url}/history").get_json()
+    assert (response["from"], response["to"]) == ("2024-02-10", "2024-03-10")
+    assert response["days"] == ["2024-02-10", "2024-03-10"]
+
+@pytest.mark.parametrize("query, error", [
+    ("from=2024-03-10&to=2024-03-01", "from must not be after to"),
+    ("from=2010-01-01", "The range must not exceed 1830 days"),
+    ("to=tomorrow", "to must be a date in YYYY-MM-DD format"),
+])
+def test_history_rejects_invalid_ranges(client, habit_url, query, error):
+    response = client.get(f"{habit_url}/history?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+@pytest.mark.parametrize("body, error", [
+    ({"date": "2024-03-12"}, "date must not be in the future"),
+    ({"date": "10/03/2024"}, "date must be a date in YYYY-MM-DD format"),
+    ([], "Check-in data must be a JSON object"),
+])
+def test_check_in_rejects_invalid_dates(client, habit_url, body, error):
+    response = client.post(f"{habit_url}/checkin", json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+def test_check_in_allows_tomorrow(client, habit_url):
+    response = client.post(f"{habit_url}/checkin", json={"date": "2024-03-11"})
+    assert response.status_code == 201
+
+def test_check_in_habit_of_another_user(client, habit_url, user_data):
+    other = client.post("/user", json={**user_data, "email": "other@example.com"}).get_json()
+    response = client.post(f"/user/{other['id']}/habit/1/checkin")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Habit not found"}
+
+def test_check_in_does_not_read_history_for_consecutive_days(client, habit_url, statements):
+    # Arrange
+    _check_in(client, habit_url, 2, 1)
+    statements.clear()
+    # Act
+    _check_in(client, habit_url, 0)
+    # Assert
+    reads = [s for s in statements if s.startswith("SELECT") and "habit_checkin" in s]
+    assert len(reads) == 1
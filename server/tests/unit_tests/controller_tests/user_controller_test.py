@@ -3,38 +3,10 @@ import pytest
 from unittest.mock import patch, MagicMock
 from server.src.controllers.user_controller import get_user, create_user
 from server.src.models.models import User, Habit
-from server.src.app import create_app
 from server.src.database import db
 from werkzeug.exceptions import BadRequest, NotFound
 
 
-@pytest.fixture
-def app():
-    test_config = {
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": 'sqlite:///:memory:',  # use an in-memory SQLite database
-        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
-    }
-
-    app = create_app(test_config)  # pass test configuration
-
-    with app.app_context():
-        db.create_all()
-
-    yield app  # yield the app context for tests
-
-    with app.app_context():
-        db.drop_all()  # clean up after tests
-
-@pytest.fixture
-def app_context(app):
-    with app.app_context():
-        yield
-
-@pytest.fixture()
-def client(app):
-    return app.test_client()
-
 def test_get_user_when_user_exists(app_context, client):
     # Arrange
     mock_user = MagicMock()
@@ -217,14 +189,14 @@ def test_update_habit_should_return_201_when_habit_is_updated(app_context, clien
     with patch.object(User, 'query') as mock_user_query:
         mock_user_query.get.return_value = mock_user
         with patch.object(Habit, 'query') as mock_habit_query:
-            mock_habit_query.get.return_value = mock_habit
+            mock_habit_query.filter_by.return_value.first.return_value = mock_habit
             with patch.object(mock_habit, 'update', return_value = None) as mock_update_habit:
                 # Act
                 response = client.put("/user/1/habit/1", json=habit_data, content_type='application/json')
 
                 # Assert
                 mock_user_query.get.assert_called_once_with(1)
-                mock_habit_query.get.assert_called_once_with(1)
+                mock_habit_query.filter_by.assert_called_once_with(id=1, user_id=1)
                 mock_update_habit.assert_called_once_with({"name": "Updated Habit"})
                 assert response.status_code == 201
 
@@ -258,11 +230,608 @@ def test_update_habit_should_return_404_when_habit_not_found(app_context, client
     with patch.object(User, 'query') as mock_user_query:
         mock_user_query.get.return_value = mock_user
         with patch.object(Habit, 'query') as mock_habit_query:
-            mock_habit_query.get.return_value = None
+            mock_habit_query.filter_by.return_value.first.return_value = None
             # Act
             response = client.put("/user/1/habit/1", json=habit_data, content_type='application/json')
             # Assert
             mock_user_query.get.assert_called_once_with(1)
-            mock_habit_query.get.assert_called_once_with(1)
+            mock_habit_query.filter_by.assert_called_once_with(id=1, user_id=1)
             assert response.status_code == 404
-            assert response.get_json() == expected
\ No newline at end of file
+            assert response.get_json() == expected
+
+def test_update_habit_should_return_404_when_habit_belongs_to_another_user(app_context, client):
+    # Arrange
+    owner = _create_user(habits=["Read"])
+    other = _create_user(name="other")
+    habit_id = owner.habits[0].id
+    # Act
+    response = client.put(f"/user/{other.id}/habit/{habit_id}", json={"name": "Run"})
+    # Assert
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Habit not found"}
+    assert db.session.get(Habit, habit_id).name == "Read"
+
+def test_bulk_create_users_should_return_201_when_all_users_are_created(app_context, client):
+    # Arrange
+    users_data = [
+        {"name": f"user{i}", "email": f"user{i}@example.com", "password": "pw",
+         "habits": [{"name": "Read"}, {"name": "Run"}]}
+        for i in range(3)
+    ]
+    # Act
+    response = client.post("/users/bulk", json=users_data)
+    # Assert
+    assert response.status_code == 201
+    results = response.get_json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert all(r["status"] == 201 and r["id"] for r in results)
+    assert User.query.count() == 3
+    assert Habit.query.count() == 6
+
+def test_bulk_create_users_should_report_invalid_rows_and_create_the_rest(app_context, client):
+    # Arrange
+    users_data = [
+        {"name": "good", "email": "good@example.com", "password": "pw"},
+        {"name": "bad"},
+        {"name": "bad habit", "email": "b@example.com", "password": "pw", "habits": [{}]},
+    ]
+    # Act
+    response = client.post("/users/bulk", json=users_data)
+    # Assert
+    assert response.status_code == 207
+    results = response.get_json()["results"]
+    assert results[0]["status"] == 201
+    assert results[1] == {"index": 1, "status": 400, "error": "Missing mandatory fields: email, password"}
+    assert results[2] == {"index": 2, "status": 400, "error": "Missing mandatory fields: habits[0].name"}
+    assert User.query.count() == 1
+
+def test_bulk_create_users_should_accept_ndjson(app_context, client):
+    # Arrange
+    body = (
+        '{"name": "a", "email": "a@example.com", "password": "pw"}\n'
+        '\n'
+        'not json\n'
+        '{"name": "b", "email": "b@example.com", "password": "pw"}\n'
+    )
+    # Act
+    response = client.post("/users/bulk", data=body, content_type="application/x-ndjson")
+    # Assert
+    assert response.status_code == 207
+    statuses = [r["status"] for r in response.get_json()["results"]]
+    assert statuses == [201, 400, 201]
+
+def test_bulk_create_users_should_batch_inserts(statements, client):
+    # Arrange
+    users_data = [
+        {"name": f"user{i}", "email": f"user{i}@example.com", "password": "pw",
+         "habits": [{"name": "Read"}]}
+        for i in range(50)
+    ]
+    # Act
+    response = client.post("/users/bulk", json=users_data)
+    # Assert
+    assert response.status_code == 201
+    habit_inserts = [s for s in statements if s.startswith("INSERT INTO habit")]
+    assert len(habit_inserts) == 1
+    assert Habit.query.count() == 50
+
+def test_bulk_create_users_should_return_400_when_body_is_not_a_list(app_context, client):
+    # Act
+    response = client.post("/users/bulk", json={"name": "a"})
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "User data must be a JSON array"}
+
+
+def _create_user(name="user", habits=()):
+    user = User.create({"name": name, "email": f"{name}@example.com", "password": "pw",
+                        "habits": [{"name": habit} for habit in habits]})
+    db.session.commit()
+    return user
+
+def test_batch_create_habits_should_create_habits_with_one_commit(app_context, client):
+    # Arrange
+    user = _create_user()
+    habits_data = [{"name": "Read"}, {}, "nope", {"name": "Run"}]
+    # Act
+    with patch.object(db.session, "commit", wraps=db.session.commit) as mock_commit:
+        response = client.post(f"/user/{user.id}/habits/batch", json=habits_data)
+    # Assert
+    assert response.status_code == 207
+    results = response.get_json()["results"]
+    assert [r["status"] for r in results] == [201, 400, 400, 201]
+    assert results[1]["error"] == "Missing mandatory fields: name"
+    assert results[2]["error"] == "Habit data must be a JSON object"
+    assert mock_commit.call_count == 1
+    assert sorted(h.name for h in Habit.query.filter_by(user_id=user.id)) == ["Read", "Run"]
+
+def test_batch_create_habits_should_return_404_when_user_not_found(app_context, client):
+    # Act
+    response = client.post("/user/99/habits/batch", json=[{"name": "Read"}])
+    # Assert
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
+
+def test_batch_create_habits_should_return_400_when_no_data_is_provided(app_context, client):
+    # Act
+    response = client.post("/user/1/habits/batch", json=[])
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "No habit data provided"}
+
+def test_batch_update_habits_should_update_owned_habits(app_context, client):
+    # Arrange
+    user = _create_user("owner", habits=["Read", "Run"])
+    other = _create_user("other", habits=["Swim"])
+    read, run = user.habits
+    swim = other.habits[0]
+    habits_data = [
+        {"id": read.id, "name": "Read more"},
+        {"id": swim.id, "name": "Stolen"},
+        {"name": "No id"},
+        {"id": run.id, "name": "Run further"},
+    ]
+    # Act
+    response = client.patch(f"/user/{user.id}/habits/batch", json=habits_data)
+    # Assert
+    assert response.status_code == 207
+    assert response.get_json()["results"] == [
+        {"index": 0, "status": 200, "id": read.id},
+        {"index": 1, "status": 404, "error": "Habit not found"},
+        {"index": 2, "status": 400, "error": "Missing mandatory fields: id"},
+        {"index": 3, "status": 200, "id": run.id},
+    ]
+    assert db.session.get(Habit, read.id).name == "Read more"
+    assert db.session.get(Habit, run.id).name == "Run further"
+    assert db.session.get(Habit, swim.id).name == "Swim"
+
+
+def test_list_users_should_page_through_all_users(app_context, client):
+    # Arrange
+    ids = [_create_user(f"user{i}").id for i in range(5)]
+    # Act
+    seen = []
+    cursor = None
+    while True:
+        query = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        response = client.get("/users", query_string=query)
+        assert response.status_code == 200
+        page = response.get_json()
+        seen.extend(user["id"] for user in page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    # Assert
+    assert seen == ids
+    assert "password" not in page["data"][0]
+
+def test_list_users_should_use_keyset_not_offset(statements, client):
+    # Arrange
+    for i in range(3):
+        _create_user(f"user{i}")
+    first = client.get("/users?limit=1").get_json()
+    statements.clear()
+    # Act
+    response = client.get("/users", query_string={"limit": 1, "cursor": first["next_cursor"]})
+    # Assert
+    assert response.status_code == 200
+    # SQLite always renders "LIMIT ? OFFSET ?", with an offset of 0 here, so check the
+    # page is selected by an id range instead
+    assert len(statements) == 1
+    assert "WHERE user.id > ?" in statements[0]
+    assert "ORDER BY user.id" in statements[0]
+
+def test_list_users_should_return_400_when_cursor_is_invalid(app_context, client):
+    # Act
+    response = client.get("/users?cursor=garbage")
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor"}
+
+def test_list_users_with_ids_should_keep_the_requested_order(statements, client):
+    # Arrange
+    for i in range(3):
+        _create_user(f"user{i}", habits=["Read"])
+    statements.clear()
+    # Act
+    response = client.get("/users?ids=3,99,1,3&include=habits&fields=id,username")
+    # Assert
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [user and user["id"] for user in body["data"]] == [3, None, 1, 3]
+    assert body["data"][0]["username"] == "user2"
+    assert [h["name"] for h in body["data"][2]["habits"]] == ["Read"]
+    assert body["missing"] == [99]
+    # one IN query for the users, one for their habits
+    assert len(statements) == 2
+    assert " IN (" in statements[0]
+
+@pytest.mark.parametrize("ids, error", [
+    ("1,x", "ids must be comma separated positive integers"),
+    ("", "ids must be comma separated positive integers"),
+    (",".join(["1"] * 101), "ids must list at most 100 IDs"),
+])
+def test_list_users_with_ids_should_return_400_when_ids_are_invalid(app_context, client, ids, error):
+    # Act
+    response = client.get("/users", query_string={"ids": ids})
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
+
+def test_list_habits_should_page_through_a_users_habits(app_context, client):
+    # Arrange
+    user = _create_user("owner", habits=["a", "b", "c"])
+    _create_user("other", habits=["d"])
+    # Act
+    first = client.get(f"/user/{user.id}/habits?limit=2").get_json()
+    second = client.get(f"/user/{user.id}/habits",
+                        query_string={"limit": 2, "cursor": first["next_cursor"]}).get_json()
+    # Assert
+    assert [h["name"] for h in first["data"]] == ["a", "b"]
+    assert [h["name"] for h in second["data"]] == ["c"]
+    assert second["next_cursor"] is None
+
+def test_list_habits_should_return_404_when_user_not_found(app_context, client):
+    # Act
+    response = client.get("/user/99/habits")
+    # Assert
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
+
+
+def test_get_user_should_not_load_habits_without_include(statements, client):
+    # Arrange
+    user = _create_user(habits=["Read", "Run"])
+    statements.clear()
+    # Act
+    response = client.get(f"/user/{user.id}")
+    # Assert
+    assert response.status_code == 200
+    assert "habits" not in response.get_json()
+    assert len(statements) == 1
+
+def test_get_user_should_eager_load_habits_with_include(statements, client):
+    # Arrange
+    user = _create_user(habits=["Read", "Run"])
+    statements.clear()
+    # Act
+    response = client.get(f"/user/{user.id}?include=habits")
+    # Assert
+    assert response.status_code == 200
+    assert [h["name"] for h in response.get_json()["habits"]] == ["Read", "Run"]
+    assert len(statements) == 2
+
+def test_list_users_should_load_habits_for_the_page_in_one_query(statements, client):
+    # Arrange
+    for i in range(5):
+        _create_user(f"user{i}", habits=["Read", "Run"])
+    statements.clear()
+    # Act
+    response = client.get("/users?include=habits")
+    # Assert
+    assert response.status_code == 200
+    assert all(len(user["habits"]) == 2 for user in response.get_json()["data"])
+    assert len(statements) == 2
+
+def test_list_users_should_not_load_habits_without_include(statements, client):
+    # Arrange
+    for i in range(5):
+        _create_user(f"user{i}", habits=["Read"])
+    statements.clear()
+    # Act
+    response = client.get("/users")
+    # Assert
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+def test_get_user_should_return_400_when_include_is_unknown(app_context, client):
+    # Act
+    response = client.get("/user/1?include=friends")
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Unknown include: friends"}
+
+
+def test_get_user_should_return_only_requested_fields(app_context, client):
+    # Arrange
+    user = _create_user()
+    # Act
+    response = client.get(f"/user/{user.id}?fields=id,username")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {"id": user.id, "username": "user"}
+
+def test_get_user_should_keep_included_habits_with_fields(app_context, client):
+    # Arrange
+    user = _create_user(habits=["Read"])
+    url = f"/user/{user.id}?include=habits&fields=id"
+    # Act
+    loaded = client.get(url).get_json()
+    cached = client.get(url).get_json()
+    # Assert
+    assert loaded == cached == {
+        "id": user.id, "habits": [{"id": 1, "name": "Read", "user_id": user.id}]
+    }
+    assert client.get(f"/user?email=user@example.com&include=habits&fields=id").get_json() == loaded
+
+def test_get_user_should_return_400_when_password_field_is_requested(app_context, client):
+    # Act
+    response = client.get("/user/1?fields=id,password")
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Unknown fields: password"}
+
+
+def test_create_user_should_reject_invalid_data_without_touching_the_database(statements, client):
+    # Arrange
+    user_data = {"name": "n" * 81, "email": "test@example.com", "password": "pw", "role": "admin"}
+    # Act
+    response = client.post("/user", json=user_data)
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {
+        "error": "name must be at most 80 characters; Unknown fields: role"
+    }
+    assert statements == []
+
+
+def test_create_user_should_return_400_when_timezone_is_unknown(client, user_data):
+    # Act
+    response = client.post("/user", json={**user_data, "timezone": "Nowhere/City"})
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {
+        "error": "timezone must be an IANA time zone, e.g. Europe/Paris"
+    }
+
+
+def test_get_user_should_be_served_from_cache(statements, client):
+    # Arrange
+    user = _create_user()
+    client.get(f"/user/{user.id}")
+    statements.clear()
+    # Act
+    response = client.get(f"/user/{user.id}?fields=username")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {"username": "user"}
+    assert statements == []
+
+def test_update_user_should_invalidate_cached_user(app_context, client):
+    # Arrange
+    user = _create_user()
+    client.get(f"/user/{user.id}")
+    # Act
+    client.put(f"/user/{user.id}", json={"name": "renamed", "email": "e@example.com", "password": "pw"})
+    response = client.get(f"/user/{user.id}")
+    # Assert
+    assert response.get_json()["username"] == "renamed"
+
+def test_create_habit_should_invalidate_cached_user(app_context, client):
+    # Arrange
+    user = _create_user()
+    client.get(f"/user/{user.id}?include=habits")
+    # Act
+    client.post(f"/user/{user.id}/habit", json={"name": "Read"})
+    response = client.get(f"/user/{user.id}?include=habits")
+    # Assert
+    assert [h["name"] for h in response.get_json()["habits"]] == ["Read"]
+
+
+def test_get_user_should_return_304_when_etag_matches(statements, client):
+    # Arrange
+    user = _create_user()
+    etag = client.get(f"/user/{user.id}").headers["ETag"]
+    # Act
+    response = client.get(f"/user/{user.id}", headers={"If-None-Match": etag})
+    # Assert
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+def test_get_user_should_return_304_on_cache_miss_when_etag_matches(app, client):
+    # Arrange
+    with app.app_context():
+        user_id = _create_user().id
+    etag = client.get(f"/user/{user_id}").headers["ETag"]
+    app.extensions["user_cache"].invalidate(user_id)
+    # Act
+    with patch.object(User, "to_json") as mock_to_json:
+        response = client.get(f"/user/{user_id}", headers={"If-None-Match": etag})
+    # Assert
+    assert response.status_code == 304
+    mock_to_json.assert_not_called()
+
+def test_get_user_etag_should_change_when_user_or_habits_change(app_context, client):
+    # Arrange
+    user = _create_user(habits=["Read"])
+    plain = client.get(f"/user/{user.id}").headers["ETag"]
+    with_habits = client.get(f"/user/{user.id}?include=habits").headers["ETag"]
+    sparse = client.get(f"/user/{user.id}?fields=id").headers["ETag"]
+    # Act
+    client.put(f"/user/{user.id}/habit/{user.habits[0].id}", json={"name": "Read more"})
+    # Assert
+    assert len({plain, with_habits, sparse}) == 3
+    assert client.get(f"/user/{user.id}").headers["ETag"] == plain
+    assert client.get(f"/user/{user.id}?include=habits").headers["ETag"] != with_habits
+
+def test_update_user_should_return_412_when_if_match_is_stale(app_context, client):
+    # Arrange
+    user = _create_user()
+    etag = client.get(f"/user/{user.id}").headers["ETag"]
+    user_data = {"name": "renamed", "email": "e@example.com", "password": "pw"}
+    first = client.put(f"/user/{user.id}", json=user_data, headers={"If-Match": etag})
+    # Act
+    second = client.put(f"/user/{user.id}", json=user_data, headers={"If-Match": etag})
+    # Assert
+    assert first.status_code == 201
+    assert first.headers["ETag"] != etag
+    assert first.headers["ETag"] == client.get(f"/user/{user.id}").headers["ETag"]
+    assert second.status_code == 412
+    assert second.get_json() == {"error": "User has been modified"}
+
+def test_update_habit_should_return_412_when_if_match_is_stale(app_context, client):
+    # Arrange
+    user = _create_user(habits=["Read"])
+    habit_id = user.habits[0].id
+    url = f"/user/{user.id}/habit/{habit_id}"
+    etag = client.put(url, json={"name": "Read more"}).headers["ETag"]
+    client.put(url, json={"name": "Read even more"})
+    # Act
+    response = client.put(url, json={"name": "Read less"}, headers={"If-Match": etag})
+    # Assert
+    assert response.status_code == 412
+    assert response.get_json() == {"error": "Habit has been modified"}
+
+def test_update_user_should_return_409_when_row_changed_concurrently(app_context, client):
+    # Arrange
+    user = _create_user()
+    db.session.execute(db.text("UPDATE user SET version = version + 1 WHERE id = :id"), {"id": user.id})
+    # Act / Assert
+    from werkzeug.exceptions import Conflict
+    with pytest.raises(Conflict):
+        user.update({"name": "renamed", "email": "e@example.com", "password": "pw"})
+
+
+def test_batch_update_habits_should_raise_409_when_a_habit_changed_concurrently(app_context, client):
+    # Arrange
+    user = _create_user(habits=["Read", "Run"])
+    habit_ids = [habit.id for habit in user.habits]
+    db.session.execute(db.text("UPDATE habit SET version = version + 1 WHERE id = :id"),
+                       {"id": habit_ids[1]})
+    # Act / Assert
+    from werkzeug.exceptions import Conflict
+    with pytest.raises(Conflict, match="Habit was modified by another request"):
+        Habit.batch_update([{"id": habit_id, "name": "renamed"} for habit_id in habit_ids], user)
+
+
+def test_patch_user_should_only_update_changed_columns(statements, client):
+    # Arrange
+    user = _create_user()
+    statements.clear()
+    # Act
+    response = client.patch(f"/user/{user.id}", json={"name": "user", "email": "new@example.com"})
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "data": {
+            "id": user.id, "username": "user", "email": "new@example.com", "timezone": "UTC"
+        },
+        "changed": ["email"],
+    }
+    updates = [s for s in statements if s.startswith("UPDATE")]
+    assert len(updates) == 1
+    assert "SET email=?" in updates[0]
+    assert "username" not in updates[0]
+
+def test_patch_user_should_not_write_when_nothing_changed(statements, client):
+    # Arrange
+    user = _create_user()
+    etag = client.get(f"/user/{user.id}").headers["ETag"]
+    statements.clear()
+    # Act
+    response = client.patch(f"/user/{user.id}", json={"name": "user", "password": "pw"})
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json()["changed"] == []
+    assert response.headers["ETag"] == etag
+    assert not [s for s in statements if s.startswith("UPDATE")]
+
+def test_patch_user_should_return_400_when_data_is_invalid(app_context, client):
+    # Arrange
+    user = _create_user()
+    # Act
+    response = client.patch(f"/user/{user.id}", json={"email": 5, "habits": []})
+    # Assert
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "email must be a string"}
+
+def test_patch_user_should_return_404_when_user_not_found(app_context, client):
+    # Act
+    response = client.patch("/user/99", json={"name": "x"})
+    # Assert
+    assert response.status_code == 404
+
+def test_patch_habit_should_report_changed_fields(statements, client):
+    # Arrange
+    user = _create_user(habits=["Read"])
+    url = f"/user/{user.id}/habit/{user.habits[0].id}"
+    # Act
+    changed = client.patch(url, json={"name": "Read more"})
+    statements.clear()
+    unchanged = client.patch(url, json={"name": "Read more"})
+    # Assert
+    assert changed.status_code == 200
+    assert changed.get_json()["changed"] == ["name"]
+    assert unchanged.get_json()["changed"] == []
+    assert not [s for s in statements if s.startswith("UPDATE")]
+
+def test_patch_habit_should_return_404_for_another_users_habit(app_context, client):
+    # Arrange
+    owner = _create_user("owner", habits=["Read"])
+    other = _create_user("other")
+    # Act
+    response = client.patch(f"/user/{other.id}/habit/{owner.habits[0].id}", json={"name": "x"})
+    # Assert
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Habit not found"}
+
+def test_get_user_by_email_should_return_the_user(app_context, client):
+    # Arrange
+    user = _create_user("found", habits=["Read"])
+    # Act
+    response = client.get("/user?email=found@example.com&include=habits")
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json()["id"] == user.id
+    assert response.get_json()["habits"][0]["name"] == "Read"
+    assert response.headers["ETag"]
+
+def test_get_user_by_email_should_return_404_when_not_found(app_context, client):
+    response = client.get("/user?email=missing@example.com")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
+
+def test_get_user_by_email_should_return_400_without_email(app_context, client):
+    response = client.get("/user")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Missing query parameter: email"}
+
+def test_create_user_should_return_409_when_email_is_taken(app_context, client):
+    # Arrange
+    _create_user("taken")
+    # Act
+    response = client.post("/user", json={"name": "x", "email": "taken@example.com",
+                                          "password": "pw"})
+    # Assert
+    assert response.status_code == 409
+    assert response.get_json() == {"error": "Email is already in use"}
+    assert User.query.count() == 1
+
+def test_patch_user_should_return_409_when_email_is_taken(app_context, client):
+    # Arrange
+    _create_user("taken")
+    user = _create_user("other")
+    # Act
+    response = client.patch(f"/user/{user.id}", json={"email": "taken@example.com"})
+    # Assert
+    assert response.status_code == 409
+    assert response.get_json() == {"error": "Email is already in use"}
+
+def test_bulk_create_users_should_report_taken_emails(app_context, client):
+    # Arrange
+    _create_user("taken")
+    users_data = [
+        {"name": "a", "email": "taken@example.com", "password": "pw"},
+        {"name": "b", "email": "new@example.com", "password": "pw"},
+        {"name": "c", "email": "new@example.com", "password": "pw"},
+    ]
+    # Act
+    response = client.post("/users/bulk", json=users_data)
+    # Assert
+    assert response.status_code == 207
+    results = response.get_json()["results"]
+    assert results[0] == {"index": 0, "status": 409, "error": "Email is already in use"}
+    assert results[1]["status"] == 201
+    assert results[2] == {"index": 2, "status": 409, "error": "Email is already in use"}
+    assert User.query.count() == 2
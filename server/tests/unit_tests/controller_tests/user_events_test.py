@@ -0,0 +1,68 @@
+#pylint: skip-file
+import json
+import pytest
+
+
+def _poll(client, user_id, last_event_id=None, timeout=0):
+    query = {"timeout": timeout}
+    if last_event_id is not None:
+        query["last_event_id"] = last_event_id
+    return client.get(f"/user/{user_id}/events", query_string=query)
+
+def _read_events(response, count):
+    # parses the first count events of a Server-Sent Events stream
+    events = []
+    chunks = iter(response.response)
+    while len(events) < count:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n") if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    response.close()
+    return events
+
+def test_long_poll_returns_the_events_after_the_last_one(client, user_id):
+    # Arrange
+    start = _poll(client, user_id).get_json()
+    client.post(f"/user/{user_id}/habit", json={"name": "Swim"})
+    # Act
+    response = _poll(client, user_id, start["last_event_id"])
+    # Assert
+    assert start["data"] == []
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [(e["event"], e["data"]["name"]) for e in body["data"]] == [("habit.created", "Swim")]
+    assert body["last_event_id"] == body["data"][-1]["id"]
+    assert _poll(client, user_id, body["last_event_id"]).get_json()["data"] == []
+
+def test_stream_resumes_after_last_event_id(client, user_id):
+    # Arrange
+    start = _poll(client, user_id).get_json()["last_event_id"]
+    client.post(f"/user/{user_id}/habit", json={"name": "Swim"})
+    client.post(f"/user/{user_id}/habit", json={"name": "Walk"})
+    # Act
+    response = client.get(f"/user/{user_id}/events", buffered=False, headers={
+        "Accept": "text/event-stream", "Last-Event-ID": start,
+    })
+    # Assert
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert [(event, data["name"]) for event, data in _read_events(response, 2)] == [
+        ("habit.created", "Swim"), ("habit.created", "Walk"),
+    ]
+
+def test_unknown_last_event_id_gets_a_reset(client, user_id):
+    response = _poll(client, user_id, "0123abcd-5")
+    assert [e["event"] for e in response.get_json()["data"]] == ["reset"]
+
+def test_events_of_unknown_user(client):
+    response = _poll(client, 99)
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
+
+@pytest.mark.parametrize("timeout", ["-1", "61", "soon"])
+def test_long_poll_rejects_invalid_timeouts(client, user_id, timeout):
+    response = _poll(client, user_id, timeout=timeout)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "timeout must be between 0 and 60 seconds"}
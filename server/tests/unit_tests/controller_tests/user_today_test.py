@@ -0,0 +1,42 @@
+#pylint: skip-file
+import pytest
+from server.src.models.helpers import local_today
+from server.src.today import TodaySnapshot
+
+TIMEZONE = "Pacific/Kiritimati"  # UTC+14, so its day differs from UTC's most of the time
+
+
+@pytest.fixture
+def user_data(user_data):
+    return {**user_data, "timezone": TIMEZONE}
+
+def _today(client, user_id, **kwargs):
+    return client.get(f"/user/{user_id}/today", **kwargs)
+
+def test_today_lists_the_habits_for_the_local_day(app, client, user_id):
+    # Act
+    response = _today(client, user_id)
+    # Assert
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "user_id": user_id,
+        "date": local_today(TIMEZONE).isoformat(),
+        "timezone": TIMEZONE,
+        "habits": [
+            {"id": 1, "name": "Read", "done": False, "current_streak": 0, "longest_streak": 0},
+            {"id": 2, "name": "Run", "done": False, "current_streak": 0, "longest_streak": 0},
+        ],
+    }
+    with app.app_context():
+        assert TodaySnapshot.query.count() == 1
+
+def test_today_not_modified(client, user_id):
+    etag = _today(client, user_id).headers["ETag"]
+    response = _today(client, user_id, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_today_of_unknown_user(client):
+    response = _today(client, 99)
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "User not found"}
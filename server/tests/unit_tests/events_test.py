@@ -0,0 +1,51 @@
+#pylint: skip-file
+from server.src.database import db
+from server.src.events import EventBroker, event_broker
+from server.src.models.models import Habit
+
+
+def test_commits_publish_the_changed_users_and_habits(app_context, client, user_id):
+    # Arrange
+    subscription = event_broker().subscribe(user_id)
+    # Act
+    client.patch(f"/user/{user_id}", json={"name": "renamed"})
+    client.post(f"/user/{user_id}/habit", json={"name": "Swim"})
+    client.patch(f"/user/{user_id}/habit/1", json={"name": "Read more"})
+    client.post(f"/user/{user_id}/habit/1/checkin", json={"date": "2024-03-10"})
+    # Assert
+    events = subscription.get(0)
+    assert [(e.type, e.data.get("name", e.data.get("username"))) for e in events] == [
+        ("user.updated", "renamed"), ("habit.created", "Swim"), ("habit.updated", "Read more"),
+    ]
+    assert subscription.get(0) == []
+
+def test_rolled_back_changes_are_not_published(app_context, user_id):
+    # Arrange
+    subscription = event_broker().subscribe(user_id)
+    # Act
+    db.session.add(Habit(name="Swim", user_id=user_id))
+    db.session.flush()
+    db.session.rollback()
+    # Assert
+    assert subscription.get(0) == []
+
+def test_slow_subscriber_catches_up_from_the_log():
+    # Arrange
+    broker = EventBroker(buffer_size=2, log_size=10)
+    subscription = broker.subscribe(1)
+    # Act
+    broker.publish([(1, "habit.created", {"id": n}) for n in range(5)])
+    # Assert
+    assert [e.data["id"] for e in subscription.get(0)] == [0, 1, 2, 3, 4]
+    assert subscription.get(0) == []
+
+def test_resume_past_the_log_gets_a_reset():
+    # Arrange
+    broker = EventBroker(log_size=2)
+    broker.publish([(1, "habit.created", {"id": n}) for n in range(4)])
+    # Act
+    replayed = broker.subscribe(1, broker.event_id(1)).get(0)
+    resumed = broker.subscribe(1, broker.event_id(3)).get(0)
+    # Assert
+    assert [(e.seq, e.type) for e in replayed] == [(4, "reset")]
+    assert [e.seq for e in resumed] == [4]
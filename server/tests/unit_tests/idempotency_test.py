@@ -0,0 +1,148 @@
+#pylint: skip-file
+import threading
+import time
+import pytest
+from werkzeug.exceptions import Conflict
+from server.src.app import create_app
+from server.src.database import db
+from server.src.idempotency import IdempotencyRecord, IdempotencyStore, _fingerprint
+from server.src.models.models import User, Habit
+
+USER = {"name": "user", "email": "user@example.com", "password": "pw"}
+
+
+def _file_app(tmp_path):
+    # a file database, so requests on other threads get their own connections
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'idempotency.db'}",
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_retry_returns_the_stored_response(app, client):
+    # Arrange
+    headers = {"Idempotency-Key": "signup-1"}
+    first = client.post("/user", json=USER, headers=headers)
+    # Act
+    retry = client.post("/user", json=USER, headers=headers)
+    # Assert
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    with app.app_context():
+        assert User.query.count() == 1
+
+def test_requests_without_a_key_are_not_deduplicated(app, client):
+    client.post("/user", json=USER)
+    client.post("/user", json={**USER, "email": "other@example.com"})
+    with app.app_context():
+        assert User.query.count() == 2
+
+def test_habit_creation_retry_keeps_the_etag(app, client):
+    # Arrange
+    user_id = client.post("/user", json=USER).get_json()["id"]
+    headers = {"Idempotency-Key": "habit-1"}
+    first = client.post(f"/user/{user_id}/habit", json={"name": "Read"}, headers=headers)
+    # Act
+    retry = client.post(f"/user/{user_id}/habit", json={"name": "Read"}, headers=headers)
+    # Assert
+    assert retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers["ETag"] == first.headers["ETag"]
+    with app.app_context():
+        assert Habit.query.count() == 1
+
+def test_key_reused_for_a_different_request(client):
+    headers = {"Idempotency-Key": "signup-1"}
+    client.post("/user", json=USER, headers=headers)
+    response = client.post("/user", json={**USER, "name": "other"}, headers=headers)
+    assert response.status_code == 422
+    assert response.get_json() == {"error": "Idempotency-Key was already used for a different request"}
+
+def test_failed_request_releases_the_key(app, client):
+    # Arrange
+    headers = {"Idempotency-Key": "signup-1"}
+    invalid = {"name": "user", "email": "user@example.com"}
+    # Act
+    responses = [client.post("/user", json=invalid, headers=headers) for _ in range(2)]
+    # Assert
+    assert [response.status_code for response in responses] == [400, 400]
+    with app.app_context():
+        assert IdempotencyRecord.query.count() == 0
+
+def test_concurrent_duplicate_waits_for_the_first_request(tmp_path):
+    # Arrange
+    app = _file_app(tmp_path)
+    headers = {"Idempotency-Key": "signup-1"}
+    with app.test_request_context("/user", method="POST", json=USER, headers=headers):
+        store = app.extensions["idempotency"]
+        assert store.claim("signup-1", _fingerprint()) is None
+    responses = []
+    retry = threading.Thread(
+        target=lambda: responses.append(app.test_client().post("/user", json=USER, headers=headers))
+    )
+    # Act
+    retry.start()
+    time.sleep(0.2)
+    waiting = retry.is_alive()
+    with app.app_context():
+        store.complete("signup-1", 201, b'{"id": 42}')
+    retry.join(5)
+    # Assert
+    assert waiting
+    assert responses[0].status_code == 201
+    assert responses[0].get_json() == {"id": 42}
+    with app.app_context():
+        assert User.query.count() == 0
+
+def test_duplicate_gives_up_waiting(tmp_path):
+    # Arrange
+    app = _file_app(tmp_path)
+    app.extensions["idempotency"].wait_timeout = 0.1
+    headers = {"Idempotency-Key": "signup-1"}
+    with app.test_request_context("/user", method="POST", json=USER, headers=headers):
+        app.extensions["idempotency"].claim("signup-1", _fingerprint())
+    # Act
+    response = app.test_client().post("/user", json=USER, headers=headers)
+    # Assert
+    assert response.status_code == 409
+
+def test_sweep_deletes_expired_records(app_context):
+    # Arrange
+    now = [1000.0]
+    store = IdempotencyStore(ttl=60, clock=lambda: now[0])
+    store.claim("old", "a")
+    store.complete("old", 201, b"{}")
+    now[0] += 30
+    store.claim("new", "b")
+    now[0] += 45
+    # Act
+    deleted = store.sweep()
+    # Assert
+    assert deleted == 1
+    assert [record.key for record in IdempotencyRecord.query.all()] == ["new"]
+
+def test_expired_key_can_be_claimed_again(app_context):
+    now = [1000.0]
+    store = IdempotencyStore(ttl=60, clock=lambda: now[0])
+    store.claim("key", "a")
+    store.complete("key", 201, b"{}")
+    now[0] += 61
+    assert store.claim("key", "b") is None
+
+def test_abandoned_claim_can_be_taken_over_after_its_lease(app_context):
+    # Arrange
+    now = [1000.0]
+    store = IdempotencyStore(ttl=3600, clock=lambda: now[0], lease=30, wait_timeout=0)
+    store.claim("key", "a")
+    # Act / Assert
+    with pytest.raises(Conflict):
+        store.claim("key", "a")
+    now[0] += 31
+    assert store.claim("key", "a") is None
+    store.complete("key", 201, b"{}")
+    now[0] += 3000
+    assert store.claim("key", "a") == (201, b"{}", None)
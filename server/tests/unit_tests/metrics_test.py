@@ -0,0 +1,64 @@
+#pylint: skip-file
+import logging
+from server.src.metrics import Histogram, Metrics, RequestSample
+from server.src.models.models import User
+from server.src.database import db
+
+
+def _create_user():
+    user = User.create({"name": "user", "email": "user@example.com", "password": "pw",
+                        "habits": [{"name": "Read"}]})
+    db.session.commit()
+    return user
+
+def test_histogram_cumulative_counts():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.cumulative_counts() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.sum == 3.65
+    assert histogram.count == 4
+
+def test_metrics_render_prometheus_text():
+    metrics = Metrics()
+    metrics.record(RequestSample("user_controller.get_user", "GET", 200, 0.02, 2, 0.004, 51))
+    metrics.record(RequestSample("user_controller.get_user", "GET", 404, 0.001, 1, 0.001, 29))
+    text = metrics.render(["extra 1"])
+    labels = 'endpoint="user_controller.get_user",method="GET"'
+    assert "# TYPE dailies_request_duration_seconds histogram" in text
+    assert f'dailies_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'dailies_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f'dailies_requests_total{{{labels},status="404"}} 1' in text
+    assert f"dailies_request_sql_statements_total{{{labels}}} 3" in text
+    assert f"dailies_response_size_bytes_total{{{labels}}} 80" in text
+    assert text.endswith("extra 1\n")
+
+def test_metrics_endpoint_reports_sql_per_route(app, client):
+    # Arrange
+    with app.app_context():
+        user_id = _create_user().id
+    client.get(f"/user/{user_id}?include=habits")
+    client.get("/user/999")
+    # Act
+    response = client.get("/metrics")
+    # Assert
+    text = response.get_data(as_text=True)
+    labels = 'endpoint="user_controller.get_user",method="GET"'
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert f'dailies_requests_total{{{labels},status="200"}} 1' in text
+    assert f'dailies_requests_total{{{labels},status="404"}} 1' in text
+    assert f"dailies_request_sql_statements_total{{{labels}}} 3" in text
+    assert 'dailies_user_cache_events_total{event="miss"}' in text
+
+def test_slow_requests_are_logged_with_their_sql(app, client, caplog):
+    # Arrange
+    app.config["SLOW_REQUEST_THRESHOLD_MS"] = 0
+    with app.app_context():
+        user_id = _create_user().id
+    # Act
+    with caplog.at_level(logging.WARNING, logger="server.src.metrics"):
+        client.get(f"/user/{user_id}")
+    # Assert
+    assert "Slow request GET /user/" in caplog.text
+    assert "FROM user" in caplog.text
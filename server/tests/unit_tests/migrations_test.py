@@ -0,0 +1,93 @@
+#pylint: skip-file
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from server.src.app import create_app
+from server.src.migrations import MIGRATIONS, pending, upgrade
+
+# the schema created by db.create_all() before versions, idempotency keys and indexes
+LEGACY_SCHEMA = (
+    "CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL, "
+    "email VARCHAR(100) NOT NULL, password VARCHAR(120) NOT NULL)",
+    "CREATE TABLE habit (id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL, "
+    "user_id INTEGER NOT NULL REFERENCES user (id))",
+)
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "INSERT INTO user (username, email, password) VALUES ('a', 'a@example.com', 'pw')"
+        ))
+    yield engine
+    engine.dispose()
+
+def test_upgrade_brings_a_legacy_schema_up_to_date(legacy_engine):
+    # Act
+    applied = upgrade(legacy_engine)
+    # Assert
+    inspector = inspect(legacy_engine)
+    assert applied == [version for version, _, _ in MIGRATIONS]
+    assert "version" in {c["name"] for c in inspector.get_columns("user")}
+    assert "version" in {c["name"] for c in inspector.get_columns("habit")}
+    assert "idempotency_record" in inspector.get_table_names()
+    indexes = {index["name"]: index for index in inspector.get_indexes("user")}
+    assert indexes["ix_user_email"]["unique"]
+    assert "ix_habit_user_id" in {index["name"] for index in inspector.get_indexes("habit")}
+    assert {"current_streak", "longest_streak", "last_checkin"} \
+        <= {c["name"] for c in inspector.get_columns("habit")}
+    assert "habit_checkin" in inspector.get_table_names()
+    assert "timezone" in {c["name"] for c in inspector.get_columns("user")}
+    assert "today_snapshot" in inspector.get_table_names()
+    assert "import_checkpoint" in inspector.get_table_names()
+    assert "habit_search" in inspector.get_table_names()
+    with legacy_engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM user")).scalar() == 1
+        assert connection.execute(text("SELECT timezone FROM user")).scalar() == "UTC"
+        assert connection.execute(text("SELECT habit_count FROM user_stats")).scalar() == 0
+
+def test_upgrade_runs_each_migration_once(legacy_engine):
+    upgrade(legacy_engine)
+    assert upgrade(legacy_engine) == []
+
+def test_app_refuses_to_start_on_a_legacy_schema(legacy_engine, monkeypatch):
+    # Arrange
+    monkeypatch.setenv("DATABASE_URI", str(legacy_engine.url))
+    with legacy_engine.connect() as connection:
+        assert pending(connection) == [version for version, _, _ in MIGRATIONS]
+    # Act / Assert
+    with pytest.raises(RuntimeError, match="python -m server.src.migrations"):
+        create_app()
+    upgrade(legacy_engine)
+    with legacy_engine.connect() as connection:
+        assert pending(connection) == []
+
+def test_upgrade_creates_a_new_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    upgrade(engine)
+    assert {"user", "habit", "schema_migrations"} <= set(inspect(engine).get_table_names())
+
+def test_email_lookup_uses_the_index(legacy_engine):
+    upgrade(legacy_engine)
+    with legacy_engine.connect() as connection:
+        plan = connection.execute(
+            text("EXPLAIN QUERY PLAN SELECT * FROM user WHERE email = 'a@example.com'")
+        ).all()
+    assert "ix_user_email" in " ".join(str(row) for row in plan)
+
+def test_upgrade_refuses_duplicate_emails(legacy_engine):
+    # Arrange
+    with legacy_engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO user (username, email, password) VALUES ('b', 'a@example.com', 'pw')"
+        ))
+    # Act
+    with pytest.raises(RuntimeError, match=r"a@example.com \(2\)"):
+        upgrade(legacy_engine)
+    with legacy_engine.begin() as connection:
+        connection.execute(text("UPDATE user SET email = 'b@example.com' WHERE username = 'b'"))
+    # Assert
+    assert upgrade(legacy_engine) == [version for version, _, _ in MIGRATIONS]
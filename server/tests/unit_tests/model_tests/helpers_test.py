@@ -1,26 +1,137 @@
 #pylint: skip-file
-from server.src.models.helpers import DataValidator
+import pytest
+from datetime import date
+from werkzeug.exceptions import BadRequest
+from server.src.models.helpers import USER_SCHEMA, HABIT_SCHEMA
+from server.src.models.helpers import (
+    YEAR_BITMAP_BYTES, bitmap_count, bitmap_has, bitmap_set, day_of_year, parse_date,
+    parse_ids
+)
 
 def test_user_validator_all_fields_present():
     user_data = {"name": "test", "email": "test@example.com", "password": "password"}
-    assert DataValidator.validate_user_data(user_data) == (True, None)
+    assert USER_SCHEMA.errors(user_data) is None
 
 def test_user_validator_fields_with_null_values():
     user_data = {"name": None, "email": "test@example.com", "password": "password"}
-    assert DataValidator.validate_user_data(user_data) == (True, None)
+    assert USER_SCHEMA.errors(user_data) == "name must be a string"
 
 def test_user_validator_missing_field():
     user_data = {"name": "test"}
-    assert DataValidator.validate_user_data(user_data) == (False, "Missing mandatory fields: email, password")
+    assert USER_SCHEMA.errors(user_data) == "Missing mandatory fields: email, password"
+
+def test_user_validator_collects_every_error():
+    user_data = {
+        "name": "n" * 81,
+        "email": 5,
+        "admin": True,
+        "habits": [{"name": "ok"}, {}, "nope", {"name": "h" * 81, "colour": "red"}],
+    }
+    assert USER_SCHEMA.errors(user_data) == "; ".join([
+        "Missing mandatory fields: password",
+        "name must be at most 80 characters",
+        "email must be a string",
+        "Missing mandatory fields: habits[1].name",
+        "habits[2] must be a JSON object",
+        "habits[3].name must be at most 80 characters",
+        "Unknown fields: habits[3].colour",
+        "Unknown fields: admin",
+    ])
+
+def test_user_validator_rejects_non_objects():
+    assert USER_SCHEMA.errors(["test"]) == "User data must be a JSON object"
+
+def test_user_validator_max_lengths_match_columns():
+    user_data = {"name": "n" * 80, "email": "e" * 100, "password": "p" * 120}
+    assert USER_SCHEMA.errors(user_data) is None
+    user_data = {"name": "n" * 80, "email": "e" * 101, "password": "p" * 121}
+    assert USER_SCHEMA.errors(user_data) == (
+        "email must be at most 100 characters; password must be at most 120 characters"
+    )
 
 def test_habit_validator_all_fields_present():
     habit_data = {"name": "test habit"}
-    assert DataValidator.validate_habit_data(habit_data) == (True, None)
+    assert HABIT_SCHEMA.errors(habit_data) is None
 
 def test_habit_validator_fields_with_null_values():
-    user_data = {"name": None}
-    assert DataValidator.validate_habit_data(user_data) == (True, None)
+    habit_data = {"name": None}
+    assert HABIT_SCHEMA.errors(habit_data) == "name must be a string"
 
 def test_habit_validator_missing_field():
     habit_data = {}
-    assert DataValidator.validate_habit_data(habit_data) == (False, "Missing mandatory fields: name")
\ No newline at end of file
+    assert HABIT_SCHEMA.errors(habit_data) == "Missing mandatory fields: name"
+
+def test_habit_validator_rejects_non_integer_ids():
+    assert HABIT_SCHEMA.errors({"id": True, "name": "a"}) == "id must be an integer"
+
+def test_partial_validation_allows_missing_mandatory_fields():
+    assert USER_SCHEMA.errors({"email": "test@example.com"}, partial=True) is None
+    assert USER_SCHEMA.errors({"email": None, "role": 1}, partial=True) == (
+        "email must be a string; Unknown fields: role"
+    )
+
+def test_validate_raises_bad_request():
+    with pytest.raises(BadRequest) as error:
+        HABIT_SCHEMA.validate({})
+    assert error.value.description == "Missing mandatory fields: name"
+
+from server.src.models.helpers import KeysetPaginator, DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT
+
+def test_cursor_round_trip():
+    cursor = KeysetPaginator.encode_cursor(42)
+    assert "=" not in cursor
+    assert KeysetPaginator.decode_cursor(cursor) == 42
+
+def test_decode_cursor_empty_is_first_page():
+    assert KeysetPaginator.decode_cursor(None) is None
+    assert KeysetPaginator.decode_cursor("") is None
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", "eyJpZCI6ImEifQ"])
+def test_decode_cursor_invalid(cursor):
+    with pytest.raises(BadRequest):
+        KeysetPaginator.decode_cursor(cursor)
+
+def test_parse_limit_defaults_and_caps():
+    assert KeysetPaginator.parse_limit(None) == DEFAULT_PAGE_LIMIT
+    assert KeysetPaginator.parse_limit("10") == 10
+    assert KeysetPaginator.parse_limit(str(MAX_PAGE_LIMIT + 1)) == MAX_PAGE_LIMIT
+
+@pytest.mark.parametrize("limit", ["0", "-1", "ten"])
+def test_parse_limit_invalid(limit):
+    with pytest.raises(BadRequest):
+        KeysetPaginator.parse_limit(limit)
+
+
+from server.src.models.helpers import parse_include
+
+def test_parse_include():
+    assert parse_include(None, frozenset({"habits"})) == frozenset()
+    assert parse_include("habits, ", frozenset({"habits"})) == frozenset({"habits"})
+
+def test_parse_include_unknown():
+    with pytest.raises(BadRequest):
+        parse_include("habits,friends", frozenset({"habits"}))
+
+def test_parse_ids_keeps_order_and_repeats():
+    assert parse_ids(" 3,1, 3,") == [3, 1, 3]
+
+@pytest.mark.parametrize("ids", ["1,-2", "0", "a", ",", "1,2,3"])
+def test_parse_ids_invalid(ids):
+    with pytest.raises(BadRequest):
+        parse_ids(ids, max_ids=2)
+
+def test_bitmap_set_and_has():
+    bitmap = bytes(YEAR_BITMAP_BYTES)
+    bitmap = bitmap_set(bitmap_set(bitmap, 0), 365)
+    assert len(bitmap) == YEAR_BITMAP_BYTES
+    assert [i for i in range(366) if bitmap_has(bitmap, i)] == [0, 365]
+    assert bitmap_count(bitmap) == 2
+
+def test_day_of_year_counts_from_zero():
+    assert day_of_year(date(2024, 1, 1)) == 0
+    assert day_of_year(date(2024, 12, 31)) == 365
+
+@pytest.mark.parametrize("value", ["2024-02-30", "yesterday", None])
+def test_parse_date_rejects_invalid_dates(value):
+    with pytest.raises(BadRequest, match="from must be a date in YYYY-MM-DD format"):
+        parse_date(value, "from")
@@ -0,0 +1,41 @@
+#pylint: skip-file
+import pytest
+from unittest.mock import patch
+from werkzeug.exceptions import BadRequest
+from server.src.models import serializers
+from server.src.models.models import User, Habit, USER_SERIALIZER, HABIT_SERIALIZER
+from server.src.models.serializers import json_response
+
+
+def test_user_serializer_never_includes_password():
+    assert USER_SERIALIZER.fields == ("id", "username", "email", "timezone")
+    user = User(id=1, username="test", email="test@example.com", password="secret",
+                timezone="UTC")
+    assert user.to_json() == {
+        "id": 1, "username": "test", "email": "test@example.com", "timezone": "UTC"
+    }
+
+def test_serialize_sparse_fields_in_requested_order():
+    user = User(id=1, username="test", email="test@example.com", password="secret")
+    fields = USER_SERIALIZER.parse_fields("username,id,username")
+    assert fields == ("username", "id")
+    assert user.to_json(fields=fields) == {"username": "test", "id": 1}
+
+def test_serialize_single_field():
+    habit = Habit(id=3, name="Read", user_id=1)
+    assert habit.to_json(fields=HABIT_SERIALIZER.parse_fields("name")) == {"name": "Read"}
+
+def test_parse_fields_empty_means_every_field():
+    assert USER_SERIALIZER.parse_fields(None) is None
+    assert USER_SERIALIZER.parse_fields(" , ") is None
+
+@pytest.mark.parametrize("fields", ["password", "id,nope"])
+def test_parse_fields_rejects_unknown_and_excluded_fields(fields):
+    with pytest.raises(BadRequest):
+        USER_SERIALIZER.parse_fields(fields)
+
+def test_json_response_falls_back_to_jsonify_without_orjson(app_context):
+    with patch.object(serializers, "orjson", None):
+        response, status = json_response({"id": 1}, 201)
+    assert status == 201
+    assert response.get_json() == {"id": 1}
@@ -0,0 +1,126 @@
+#pylint: skip-file
+from concurrent.futures import ThreadPoolExecutor
+from server.src.database import db
+from server.src.models.models import User
+from server.src.passwords import PasswordHasher, hash_password, is_password_hash, verify_password
+
+USER = {"name": "user", "email": "user@example.com", "password": "secret"}
+
+
+def test_hash_password_round_trip():
+    stored = hash_password("secret", cost=4)
+    assert stored.startswith("scrypt$4$8$1$")
+    assert stored != hash_password("secret", cost=4)
+    assert verify_password("secret", stored)
+    assert not verify_password("wrong", stored)
+
+def test_verify_password_accepts_plain_text_from_earlier_versions():
+    assert verify_password("secret", "secret")
+    assert not verify_password("wrong", "secret")
+
+def test_is_password_hash():
+    assert is_password_hash(hash_password("secret", cost=4))
+    assert not is_password_hash("secret")
+    assert not is_password_hash("scrypt$not$a$hash")
+
+def test_needs_rehash_when_cost_changes():
+    hasher = PasswordHasher(cost=5)
+    assert not hasher.needs_rehash(hash_password("secret", cost=5))
+    assert hasher.needs_rehash(hash_password("secret", cost=4))
+    assert hasher.needs_rehash("secret")
+
+def test_pooled_hasher_hashes_in_worker_processes():
+    hasher = PasswordHasher(cost=4, workers=1)
+    try:
+        hashes = hasher.hash_many(["a", "b", "c"])
+        assert [hasher.verify(password, stored) for password, stored in zip("abc", hashes)] \
+            == [True, True, True]
+        assert hasher.verify("a", hasher.hash("a"))
+    finally:
+        hasher.shutdown()
+
+def test_hash_many_queues_no_more_hashes_than_the_slots(monkeypatch):
+    # Arrange
+    hasher = PasswordHasher(cost=4, workers=1)
+    hasher._executor = ThreadPoolExecutor(1)
+    submit, submitted, peak = hasher._executor.submit, [], [0]
+
+    def counting_submit(*args):
+        submitted.append(submit(*args))
+        peak[0] = max(peak[0], sum(not future.done() for future in submitted))
+        return submitted[-1]
+
+    monkeypatch.setattr(hasher._executor, "submit", counting_submit)
+    # Act
+    hashes = hasher.hash_many([str(n) for n in range(20)])
+    # Assert
+    assert verify_password("19", hashes[19])
+    assert 1 <= peak[0] <= 4
+    hasher.shutdown()
+
+def test_create_user_stores_a_hash(app_context, client):
+    # Act
+    user_id = client.post("/user", json=USER).get_json()["id"]
+    # Assert
+    stored = db.session.get(User, user_id).password
+    assert stored.startswith("scrypt$4$")
+    assert verify_password("secret", stored)
+
+def test_bulk_create_users_hashes_every_password(app_context, client):
+    users = [{**USER, "email": f"{i}@example.com", "password": f"pw{i}"} for i in range(3)]
+    client.post("/users/bulk", json=users)
+    stored = [user.password for user in User.query.order_by(User.id)]
+    assert [verify_password(f"pw{i}", password) for i, password in enumerate(stored)] \
+        == [True, True, True]
+
+def test_patch_with_the_same_password_changes_nothing(app_context, client, statements):
+    # Arrange
+    user_id = client.post("/user", json=USER).get_json()["id"]
+    statements.clear()
+    # Act
+    response = client.patch(f"/user/{user_id}", json={"password": "secret"})
+    # Assert
+    assert response.get_json()["changed"] == []
+    assert not [s for s in statements if s.startswith("UPDATE")]
+
+def test_patch_with_a_new_password_rehashes(app_context, client):
+    user_id = client.post("/user", json=USER).get_json()["id"]
+    response = client.patch(f"/user/{user_id}", json={"password": "new secret"})
+    assert response.get_json()["changed"] == ["password"]
+    assert verify_password("new secret", db.session.get(User, user_id).password)
+
+def test_password_is_rehashed_when_the_cost_changes(app, client):
+    # Arrange
+    user_id = client.post("/user", json=USER).get_json()["id"]
+    app.extensions["password_hasher"].cost = 5
+    # Act
+    response = client.put(f"/user/{user_id}", json=USER)
+    # Assert
+    assert response.status_code == 201
+    with app.app_context():
+        stored = db.session.get(User, user_id).password
+    assert stored.startswith("scrypt$5$")
+    assert verify_password("secret", stored)
+
+def test_rehash_invalidates_the_cached_user(app, client):
+    # Arrange
+    user_id = client.post("/user", json=USER).get_json()["id"]
+    etag = client.get(f"/user/{user_id}").headers["ETag"]
+    app.extensions["password_hasher"].cost = 5
+    # Act
+    put = client.put(f"/user/{user_id}", json=USER, headers={"If-Match": etag})
+    # Assert
+    assert client.get(f"/user/{user_id}").headers["ETag"] == put.headers["ETag"] != etag
+
+def test_plain_text_password_is_hashed_when_seen(app, client):
+    # Arrange
+    with app.app_context():
+        user = User(username="old", email="old@example.com", password="secret")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    # Act
+    client.patch(f"/user/{user_id}", json={"password": "secret"})
+    # Assert
+    with app.app_context():
+        assert db.session.get(User, user_id).password.startswith("scrypt$4$")
@@ -0,0 +1,108 @@
+#pylint: skip-file
+import pytest
+from server.src.database import db
+from server.src.models.models import Habit
+from server.src.search import (
+    Fts5HabitIndex, HabitIndex, TrieHabitIndex, habit_index, match_cost, prefix_distance
+)
+
+USERS = [
+    {"name": "ann", "email": "ann@example.com", "password": "pw",
+     "habits": [{"name": "Morning exercise"}, {"name": "Read a book"}, {"name": "Meditate"}]},
+    {"name": "bob", "email": "bob@example.com", "password": "pw",
+     "habits": [{"name": "Exercise"}, {"name": "Drink water"}, {"name": "Morning pages"}]},
+]
+
+
+@pytest.fixture(params=["fts5", "trie"])
+def app_config(request):
+    return {"HABIT_SEARCH_BACKEND": request.param}
+
+@pytest.fixture
+def seeded(client):
+    client.post("/users/bulk", json=USERS)
+
+def _search(query, user_id=None):
+    return [row.name for row in habit_index().search(query, user_id=user_id)]
+
+def test_backend_follows_the_config(app_context, app):
+    expected = Fts5HabitIndex if app.config["HABIT_SEARCH_BACKEND"] == "fts5" else TrieHabitIndex
+    assert type(habit_index()) is expected
+
+def test_search_matches_word_prefixes(app_context, seeded):
+    assert _search("morn") == ["Morning pages", "Morning exercise"]
+
+def test_search_tolerates_typos(app_context, seeded):
+    assert _search("exrcise") == ["Exercise", "Morning exercise"]
+    assert _search("mornin exercize") == ["Morning exercise"]
+    assert _search("xyzzy") == []
+
+def test_search_of_a_user(app_context, seeded):
+    assert _search("exercise", user_id=2) == ["Exercise"]
+
+def test_search_follows_new_and_renamed_habits(app_context, client, seeded):
+    # Arrange
+    _search("swim")
+    # Act
+    client.post("/user/1/habit", json={"name": "Swimming"})
+    client.patch("/user/2/habit/5", json={"name": "Swim laps"})
+    # Assert
+    assert _search("swim") == ["Swimming", "Swim laps"]
+    assert _search("drink") == []
+
+@pytest.mark.parametrize("app_config", ["trie"], indirect=True)
+def test_trie_follows_habits_committed_out_of_id_order(app_context, seeded):
+    # Arrange
+    _search("swim")
+    db.session.add(Habit(id=100, name="Swim laps", user_id=1))
+    db.session.commit()
+    _search("swim")
+    # Act
+    db.session.add(Habit(id=50, name="Swimming", user_id=2))
+    db.session.commit()
+    # Assert
+    assert _search("swim") == ["Swimming", "Swim laps"]
+
+def test_search_follows_habits_created_in_bulk(app_context, client, seeded):
+    # Arrange
+    _search("swim")
+    # Act
+    client.post("/users/bulk", json=[{"name": "cy", "email": "cy@example.com", "password": "pw",
+                                      "habits": [{"name": "Swimming"}]}])
+    # Assert
+    assert _search("swim") == ["Swimming"]
+
+@pytest.mark.parametrize("app_config", ["fts5"], indirect=True)
+def test_fts5_search_uses_the_index(seeded, statements):
+    _search("exercise")
+    assert any("habit_search MATCH" in statement for statement in statements)
+    assert not any("LIKE" in statement for statement in statements)
+
+def test_candidates_are_the_closest_matches(app_context, user_id):
+    # Arrange
+    db.session.add_all(Habit(name=f"Swam {n} laps in the big pool", user_id=user_id)
+                       for n in range(5))
+    db.session.add(Habit(name="Swim", user_id=user_id))
+    db.session.commit()
+    # Act
+    rows = habit_index().candidates(["swim"], 1)
+    # Assert
+    assert [row.name for row in rows] == ["Swim"]
+
+def test_prefix_distance():
+    assert prefix_distance("morn", "morning") == 0
+    assert prefix_distance("exrcise", "exercise") == 1
+    assert prefix_distance("run", "read") == 2
+    assert prefix_distance("exercise", "xyz", bound=1) == 2
+
+def test_match_cost():
+    assert match_cost(["morn", "exrc"], "Morning exercise") == 1
+    assert match_cost(["run"], "Morning exercise") is None
+
+
+def test_index_without_candidates_fails_on_creation():
+    class NoCandidatesIndex(HabitIndex):
+        name = "none"
+
+    with pytest.raises(TypeError):
+        NoCandidatesIndex()
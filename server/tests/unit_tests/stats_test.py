@@ -0,0 +1,75 @@
+#pylint: skip-file
+import json
+from sqlalchemy import insert, text
+from server.src.database import db
+from server.src.models.models import Habit
+from server.src.stats import UserStats, reconcile
+
+
+def _stats(client, user_id):
+    return client.get(f"/user/{user_id}/stats").get_json()
+
+def test_user_create_counts_nested_habits(client, user_id):
+    assert _stats(client, user_id) == {
+        "user_id": user_id, "habit_count": 2, "checkin_count": 0, "longest_streak": 0
+    }
+
+def test_habit_creation_and_check_ins_update_the_counters(client, user_id):
+    # Act
+    client.post(f"/user/{user_id}/habit", json={"name": "Swim"})
+    client.post(f"/user/{user_id}/habits/batch", json=[{"name": "Walk"}, {"name": "Write"}])
+    for day in ("2024-03-08", "2024-03-09", "2024-03-09", "2024-03-10"):
+        client.post(f"/user/{user_id}/habit/2/checkin", json={"date": day})
+    client.post(f"/user/{user_id}/habit/1/checkin", json={"date": "2024-03-10"})
+    # Assert
+    assert _stats(client, user_id) == {
+        "user_id": user_id, "habit_count": 5, "checkin_count": 4, "longest_streak": 3
+    }
+
+def test_bulk_create_and_import_update_the_counters(app, client, user_data):
+    # Arrange
+    app.config["BACKUP_TOKEN"] = "secret"
+    users = [{**user_data, "email": f"user{n}@example.com", "habits": user_data["habits"][:n]}
+             for n in range(3)]
+    # Act
+    client.post("/users/bulk", json=users)
+    client.post("/import", data=json.dumps({
+        "name": "imported", "email": "imported@example.com", "password": "pw",
+        "habits": [{"name": "Read", "longest_streak": 5, "checkins": [
+            {"year": 2024, "days": "Bw" + "A" * 60 + "=="}
+        ]}],
+    }), headers={"Content-Type": "application/x-ndjson", "Authorization": "Bearer secret"})
+    # Assert
+    assert [_stats(client, user_id)["habit_count"] for user_id in (1, 2, 3)] == [0, 1, 2]
+    assert _stats(client, 4) == {
+        "user_id": 4, "habit_count": 1, "checkin_count": 3, "longest_streak": 5
+    }
+
+def test_counters_roll_back_with_the_transaction(app_context, user_id):
+    # Act
+    db.session.add(Habit(name="Swim", user_id=user_id))
+    db.session.flush()
+    db.session.rollback()
+    # Assert
+    assert db.session.get(UserStats, user_id).habit_count == 2
+
+def test_reconcile_repairs_drift(app_context, client, user_id, user_data):
+    # Arrange
+    other = {**user_data, "email": "other@example.com"}
+    other_id = client.post("/user", json=other).get_json()["id"]
+    client.post(f"/user/{user_id}/habit/1/checkin", json={"date": "2024-03-10"})
+    with db.engine.begin() as connection:
+        # writes bypassing the session are not counted
+        connection.execute(insert(Habit.__table__), [{"name": "Walk", "user_id": user_id}])
+        connection.execute(text("UPDATE user_stats SET checkin_count = 7 WHERE user_id = 1"))
+        connection.execute(text("DELETE FROM user_stats WHERE user_id = 2"))
+    # Act
+    with db.engine.connect() as connection:
+        drifted = reconcile(connection, chunk_size=1, commit=True)
+    # Assert
+    assert (user_id, other_id) == (1, 2)
+    assert drifted == [1, 2]
+    assert [(s.habit_count, s.checkin_count) for s in UserStats.query.order_by(UserStats.user_id)] \
+        == [(3, 1), (2, 0)]
+    with db.engine.connect() as connection:
+        assert reconcile(connection) == []
@@ -0,0 +1,95 @@
+#pylint: skip-file
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from server.src.database import db
+from server.src.models.helpers import local_today
+from server.src.today import TodayScheduler, TodaySnapshot, today_snapshot
+
+TIMEZONE = "Pacific/Kiritimati"  # UTC+14, so its day differs from UTC's most of the time
+
+
+@pytest.fixture
+def user_data(user_data):
+    return {**user_data, "timezone": TIMEZONE}
+
+def _today(client, user_id, **kwargs):
+    return client.get(f"/user/{user_id}/today", **kwargs)
+
+def test_today_is_served_from_the_snapshot(client, user_id, statements):
+    # Arrange
+    _today(client, user_id)
+    statements.clear()
+    # Act
+    _today(client, user_id)
+    # Assert
+    assert len(statements) == 1
+    assert "today_snapshot" in statements[0]
+
+def test_check_in_patches_the_snapshot(client, user_id, statements):
+    # Arrange
+    first = _today(client, user_id)
+    # Act
+    client.post(f"/user/{user_id}/habit/2/checkin")
+    statements.clear()
+    response = _today(client, user_id)
+    # Assert
+    assert len(statements) == 1
+    assert response.get_json()["habits"][1] == {
+        "id": 2, "name": "Run", "done": True, "current_streak": 1, "longest_streak": 1
+    }
+    assert response.headers["ETag"] != first.headers["ETag"]
+
+def test_check_in_of_a_past_day_keeps_today_undone(client, user_id):
+    _today(client, user_id)
+    yesterday = local_today(TIMEZONE) - timedelta(days=1)
+    client.post(f"/user/{user_id}/habit/1/checkin", json={"date": yesterday.isoformat()})
+    habit = _today(client, user_id).get_json()["habits"][0]
+    assert (habit["done"], habit["current_streak"]) == (False, 1)
+
+def test_habit_changes_patch_the_snapshot(client, user_id):
+    # Arrange
+    _today(client, user_id)
+    # Act
+    client.post(f"/user/{user_id}/habit", json={"name": "Write"})
+    client.patch(f"/user/{user_id}/habit/1", json={"name": "Read a book"})
+    # Assert
+    habits = _today(client, user_id).get_json()["habits"]
+    assert [habit["name"] for habit in habits] == ["Read a book", "Run", "Write"]
+
+def test_batch_updates_patch_the_snapshot(client, user_id):
+    _today(client, user_id)
+    client.patch(f"/user/{user_id}/habits/batch", json=[{"id": 2, "name": "Swim"}])
+    assert _today(client, user_id).get_json()["habits"][1]["name"] == "Swim"
+
+def test_timezone_change_rebuilds_the_snapshot(app, client, user_id):
+    # Arrange
+    _today(client, user_id)
+    # Act
+    client.patch(f"/user/{user_id}", json={"timezone": "Pacific/Pago_Pago"})
+    # Assert
+    with app.app_context():
+        assert TodaySnapshot.query.count() == 0
+    response = _today(client, user_id).get_json()
+    assert response["timezone"] == "Pacific/Pago_Pago"
+    assert response["date"] == local_today("Pacific/Pago_Pago").isoformat()
+
+def test_scheduler_rebuilds_snapshots_of_past_days(app_context, client, user_id):
+    # Arrange
+    now = datetime(2024, 3, 10, 9, 59, tzinfo=timezone.utc)  # 23:59 in Kiritimati
+    today_snapshot(user_id, now=now)
+    scheduler = TodayScheduler(300, clock=lambda: now + timedelta(minutes=2))
+    # Act
+    rebuilt = scheduler.run_due()
+    # Assert
+    assert rebuilt == 1
+    snapshot = db.session.get(TodaySnapshot, user_id)
+    assert snapshot.day.isoformat() == "2024-03-11"
+    assert json.loads(snapshot.body)["date"] == "2024-03-11"
+    assert scheduler.run_due() == 0
+
+def test_scheduler_wakes_at_the_next_local_midnight(app_context, client, user_id):
+    now = datetime(2024, 3, 10, 9, 50, tzinfo=timezone.utc)  # 23:50 in Kiritimati
+    today_snapshot(user_id, now=now)
+    assert TodayScheduler(3600, clock=lambda: now).seconds_until_next() == 601
+    assert TodayScheduler(60, clock=lambda: now).seconds_until_next() == 60